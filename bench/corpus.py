@@ -0,0 +1,89 @@
+"""Synthetic memory_nodes corpus for benchmarks.
+
+Content is drawn from a fixed pseudo-word vocabulary with a Zipf-like
+distribution, so keyword recall sees realistic selectivity (a few very common
+terms, a long tail of rare ones). Timestamps spread over two years, which makes
+a share of rows fall under the prune threshold.
+
+    python -m bench.corpus --rows 1000000 --db /tmp/bench/memory.db
+"""
+import argparse
+import os
+import time
+from typing import List
+
+import numpy as np
+
+VOCAB_SIZE = 20000
+WORDS_PER_NODE = (6, 18)
+TAGS = ["work", "home", "code", "travel", "health", "music", "finance", "family"]
+SPAN_SECONDS = 2 * 365 * 24 * 3600
+BATCH_ROWS = 20000
+
+def vocabulary(seed: int = 7) -> List[str]:
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    lengths = rng.integers(4, 10, VOCAB_SIZE)
+    words = {"".join(rng.choice(letters, n)) for n in lengths}
+    return sorted(words)
+
+class CorpusGenerator:
+    def __init__(self, seed: int = 11):
+        self.vocab = vocabulary()
+        self.rng = np.random.default_rng(seed)
+        ranks = np.arange(1, len(self.vocab) + 1)
+        weights = 1.0 / ranks ** 1.1
+        self.p = weights / weights.sum()
+
+    def rows(self, n: int, now: float) -> List[tuple]:
+        """n rows shaped like MemoryManager's (id, type, content, timestamp, last_accessed, tags) tuples."""
+        from core.memory import DECAY_POLICIES
+        types = list(DECAY_POLICIES)
+        rng = self.rng
+        lengths = rng.integers(WORDS_PER_NODE[0], WORDS_PER_NODE[1] + 1, n)
+        words = rng.choice(len(self.vocab), int(lengths.sum()), p=self.p)
+        stamps = (now - rng.random(n) * SPAN_SECONDS).astype(np.int64)
+        type_ids = rng.integers(0, len(types), n)
+        tag_ids = rng.integers(0, len(TAGS), (n, 2))
+        ids = rng.bytes(8 * n)
+        out = []
+        pos = 0
+        for i in range(n):
+            end = pos + lengths[i]
+            content = " ".join(self.vocab[w] for w in words[pos:end])
+            pos = end
+            tags = ",".join(sorted({TAGS[tag_ids[i, 0]], TAGS[tag_ids[i, 1]]}))
+            ts = int(stamps[i])
+            out.append((ids[8 * i:8 * i + 8].hex(), types[type_ids[i]], content, ts, ts, tags))
+        return out
+
+    def query_terms(self, band: str, n: int) -> List[str]:
+        """Words for recall queries: 'common' (top 50), 'mid' (rank 500-2000) or 'rare' (tail)."""
+        lo, hi = {"common": (0, 50), "mid": (500, 2000), "rare": (10000, len(self.vocab))}[band]
+        return [self.vocab[i] for i in self.rng.integers(lo, hi, n)]
+
+def grow(manager, generator: CorpusGenerator, target: int) -> int:
+    """Inserts rows through `manager` until memory_nodes holds `target` rows; returns rows added."""
+    count = manager._reader().execute("SELECT COUNT(*) FROM memory_nodes").fetchone()[0]
+    added = 0
+    now = time.time()
+    while count < target:
+        n = min(BATCH_ROWS, target - count)
+        manager._write_rows(generator.rows(n, now))
+        count += n
+        added += n
+    return added
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--db", default="runtime/memory/memory.db")
+    args = parser.parse_args()
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    import core.memory as memory
+    memory.DB_PATH = args.db
+    manager = memory.MemoryManager(cache_bytes=0)
+    started = time.perf_counter()
+    added = grow(manager, CorpusGenerator(), args.rows)
+    manager.close()
+    print(f"Added {added} rows to {args.db} in {time.perf_counter() - started:.1f}s")
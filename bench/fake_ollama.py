@@ -0,0 +1,58 @@
+"""Stand-in for Ollama's /api/generate NDJSON stream, for benchmarks.
+
+Each request streams `--tokens` tokens `--token-ms` apart after a `--ttft-ms`
+prefill delay, like the simulated emitter in python_runtime/core/models.py.
+Empty prompts (model preloads) and keep_alive=0 (unloads) return at once.
+
+    python -m bench.fake_ollama --port 11500 --tokens 200 --token-ms 5
+"""
+import argparse
+import asyncio
+import json
+import time
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import uvicorn
+
+def build_app(tokens: int, token_ms: float, ttft_ms: float) -> FastAPI:
+    app = FastAPI()
+    loaded = {}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name, "model": name, "size": size, "size_vram": 0} for name, size in loaded.items()]}
+
+    @app.post("/api/generate")
+    async def generate(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        if body.get("keep_alive") == 0:
+            loaded.pop(model, None)
+            return {"model": model, "done": True}
+        loaded[model] = 4 * 2**30
+        if not body.get("prompt"):
+            return {"model": model, "response": "", "done": True}
+        words = body["prompt"].split() or ["token"]
+        count = min(tokens, body.get("options", {}).get("num_predict", tokens))
+
+        async def emit():
+            await asyncio.sleep(ttft_ms / 1000)
+            for i in range(count):
+                yield json.dumps({"model": model, "response": words[i % len(words)] + " ", "done": False}) + "\n"
+                if token_ms:
+                    await asyncio.sleep(token_ms / 1000)
+            yield json.dumps({"model": model, "response": "", "done": True, "eval_count": count,
+                              "created_at": time.time()}) + "\n"
+
+        return StreamingResponse(emit(), media_type="application/x-ndjson")
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    args = parser.parse_args()
+    uvicorn.run(build_app(args.tokens, args.token_ms, args.ttft_ms), host="127.0.0.1", port=args.port, log_level="warning")
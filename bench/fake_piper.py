@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""Stand-in for `piper --model M --output_raw`, for benchmarks.
+
+Reads one utterance per stdin line and writes silent 16-bit PCM to stdout in
+small chunks (BYTES_PER_CHAR per input character, SYNTH_MS_PER_CHAR apart per
+chunk), then logs Piper's "Real-time factor" line to stderr like the real binary.
+"""
+import sys
+import time
+
+BYTES_PER_CHAR = 1000
+CHUNK_CHARS = 8
+SYNTH_MS_PER_CHAR = 0.2
+
+def main():
+    out = sys.stdout.buffer
+    for line in sys.stdin:
+        text = line.strip()
+        for i in range(0, len(text), CHUNK_CHARS):
+            n = min(CHUNK_CHARS, len(text) - i)
+            time.sleep(n * SYNTH_MS_PER_CHAR / 1000)
+            out.write(b"\0" * (n * BYTES_PER_CHAR))
+            out.flush()
+        sys.stderr.write("[piper] [info] Real-time factor: 0.05 (infer=0.01 sec, audio=0.2 sec)\n")
+        sys.stderr.flush()
+
+if __name__ == "__main__":
+    main()
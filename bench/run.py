@@ -0,0 +1,393 @@
+"""NCS load and latency benchmarks.
+
+Starts bench.fake_ollama and the app (bench.serve, with stub STT/TTS) as
+subprocesses in a scratch directory, drives concurrent WebSocket clients
+against /chat/stream, /voice/stt and /voice/tts, then benchmarks the memory
+store in-process at several corpus sizes. Results go to stdout (or --out) as
+JSON; a short human summary goes to stderr.
+
+    python -m bench.run --clients 16 --requests 5
+    python -m bench.run --suites memory --sizes 10000,100000,1000000 --out bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUITES = ("chat", "stt", "tts", "memory")
+SAMPLE_RATE = 16000
+# Must match bench/fake_piper.py so TTS clients know when an utterance is complete
+PIPER_BYTES_PER_CHAR = 1000
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Count, mean and tail percentiles of `values` (ms unless noted)."""
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {"n": len(values), "mean": round(float(arr.mean()), 3), "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3), "p99": round(float(p99), 3), "max": round(float(arr.max()), 3)}
+
+def rss(pid: Optional[int] = None) -> Dict[str, Optional[float]]:
+    """Current and peak resident set size in MB, from /proc (Linux) or getrusage."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {"rss_mb": int(fields["VmRSS"].split()[0]) / 1024, "peak_mb": int(fields["VmHWM"].split()[0]) / 1024}
+    except (OSError, KeyError):
+        if pid is not None:
+            return {"rss_mb": None, "peak_mb": None}
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss_mb": None, "peak_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024)}
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn(module: str, args: List[str], cwd: str) -> subprocess.Popen:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    return subprocess.Popen([sys.executable, "-m", module, *args], cwd=cwd, env=env)
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+# --- /chat/stream ---
+
+# Control frames core/server.py sends around the token stream; "[TAG]" or "[TAG]: detail"
+SESSION_TAG = "[SESSION]"
+CHAT_END_TAGS = ("[DONE]", "[BUSY]", "[ERROR]", "[INTERRUPTED]")
+
+def status_tag(message: str) -> Optional[str]:
+    for tag in (SESSION_TAG, *CHAT_END_TAGS):
+        if message == tag or message.startswith(tag + ":"):
+            return tag
+    return None
+
+async def chat_request(base: str, client_id: int, seq: int, prompt: str, delivery: str) -> Dict:
+    url = f"{base}/chat/stream?session_id=bench-{client_id}-{seq}&delivery={delivery}"
+    started = time.perf_counter()
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(prompt)
+        sent = time.perf_counter()
+        first = None
+        frames = 0
+        chars = 0
+        status = None
+        async for message in ws:
+            tag = status_tag(message)
+            if tag == SESSION_TAG:
+                continue
+            if tag is not None:
+                status = tag
+                break
+            if first is None:
+                first = time.perf_counter()
+            frames += 1
+            chars += len(message)
+        done = time.perf_counter()
+    return {"connect_ms": (sent - started) * 1000, "ttft_ms": ((first or done) - sent) * 1000,
+            "total_ms": (done - sent) * 1000, "frames": frames, "chars": chars, "status": status,
+            "stream_s": done - (first or done)}
+
+async def bench_chat(base: str, args) -> Dict:
+    async def client(cid: int) -> List[Dict]:
+        out = []
+        for seq in range(args.requests):
+            # Distinct prompts keep single-flight dedup and the response cache out of the measurement
+            prompt = f"client {cid} request {seq} " + "benchmark prompt words " * 4
+            out.append(await chat_request(base, cid, seq, prompt, args.delivery))
+        return out
+
+    started = time.perf_counter()
+    results = [r for rs in await asyncio.gather(*(client(c) for c in range(args.clients))) for r in rs]
+    wall = time.perf_counter() - started
+    ok = [r for r in results if r["status"] == "[DONE]"]
+    tokens = args.tokens * len(ok)
+    return {
+        "clients": args.clients,
+        "requests": len(results),
+        "completed": len(ok),
+        "statuses": {s: sum(1 for r in results if r["status"] == s) for s in {r["status"] for r in results}},
+        "delivery": args.delivery,
+        "wall_s": round(wall, 3),
+        "throughput_tokens_per_s": round(tokens / wall, 1),
+        "per_stream_tokens_per_s": summarize([args.tokens / r["stream_s"] for r in ok if r["stream_s"] > 0]),
+        "connect_ms": summarize([r["connect_ms"] for r in results]),
+        "ttft_ms": summarize([r["ttft_ms"] for r in ok]),
+        "total_ms": summarize([r["total_ms"] for r in ok]),
+        "frames_per_request": summarize([r["frames"] for r in ok]),
+    }
+
+# --- /voice/stt ---
+
+def speech_pcm(seconds: float) -> bytes:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (0.2 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2").tobytes()
+
+def silence_pcm(seconds: float) -> bytes:
+    return bytes(2 * int(seconds * SAMPLE_RATE))
+
+async def stt_client(base: str, utterances: int, chunk_ms: int, speedup: float) -> Dict:
+    from core.voice import ENDPOINT_SILENCE_MS
+    chunk = 2 * SAMPLE_RATE * chunk_ms // 1000
+    finals: List[float] = []
+    partials = 0
+    speech_end: List[float] = []
+    async with websockets.connect(f"{base}/voice/stt", max_size=None) as ws:
+        async def reader():
+            nonlocal partials
+            async for message in ws:
+                if message.startswith("[FINAL]"):
+                    finals.append(time.perf_counter())
+                    if len(finals) == utterances:
+                        return
+                elif message.startswith("[PARTIAL]"):
+                    partials += 1
+
+        read = asyncio.create_task(reader())
+        for _ in range(utterances):
+            for part, voiced in ((speech_pcm(1.5), True), (silence_pcm(1.0), False)):
+                for i in range(0, len(part), chunk):
+                    await ws.send(part[i:i + chunk])
+                    await asyncio.sleep(chunk_ms / 1000 / speedup)
+                if voiced:
+                    speech_end.append(time.perf_counter())
+        try:
+            await asyncio.wait_for(read, 10.0)
+        except asyncio.TimeoutError:
+            pass
+    # The endpoint fires ENDPOINT_SILENCE_MS of (possibly sped-up) audio after speech ends
+    endpoint_s = ENDPOINT_SILENCE_MS / 1000 / speedup
+    return {"final_ms": [(f - (s + endpoint_s)) * 1000 for f, s in zip(finals, speech_end)],
+            "finals": len(finals), "partials": partials}
+
+async def bench_stt(base: str, args) -> Dict:
+    results = await asyncio.gather(*(
+        stt_client(base, args.utterances, args.chunk_ms, args.stt_speedup) for _ in range(args.clients)
+    ))
+    return {
+        "clients": args.clients,
+        "utterances": args.clients * args.utterances,
+        "finals": sum(r["finals"] for r in results),
+        "partials": sum(r["partials"] for r in results),
+        "final_after_endpoint_ms": summarize([ms for r in results for ms in r["final_ms"]]),
+    }
+
+# --- /voice/tts ---
+
+async def tts_client(base: str, cid: int, phrases: int, repeat: bool) -> List[Dict]:
+    out = []
+    async with websockets.connect(f"{base}/voice/tts", max_size=None) as ws:
+        for i in range(phrases):
+            text = "Sure, I can help with that." if repeat else f"Phrase {i} for client {cid}, synthesized fresh."
+            expected = len(" ".join(text.split())) * PIPER_BYTES_PER_CHAR
+            sent = time.perf_counter()
+            await ws.send(text)
+            first = None
+            received = 0
+            chunks = 0
+            while received < expected:
+                data = await ws.recv()
+                first = first or time.perf_counter()
+                received += len(data)
+                chunks += 1
+            done = time.perf_counter()
+            out.append({"ttfa_ms": (first - sent) * 1000, "total_ms": (done - sent) * 1000, "chunks": chunks})
+    return out
+
+async def bench_tts(base: str, args) -> Dict:
+    results = [r for rs in await asyncio.gather(*(
+        tts_client(base, c, args.requests, args.tts_repeat) for c in range(args.clients)
+    )) for r in rs]
+    return {
+        "clients": args.clients,
+        "utterances": len(results),
+        "repeated_phrase": args.tts_repeat,
+        "ttfa_ms": summarize([r["ttfa_ms"] for r in results]),
+        "total_ms": summarize([r["total_ms"] for r in results]),
+        "chunks_per_utterance": summarize([r["chunks"] for r in results]),
+    }
+
+async def bench_service(args, workdir: str) -> Dict:
+    ollama_port, app_port = free_port(), free_port()
+    ollama = spawn("bench.fake_ollama", ["--port", str(ollama_port), "--tokens", str(args.tokens),
+                                         "--token-ms", str(args.token_ms), "--ttft-ms", str(args.ttft_ms)], workdir)
+    serve_args = ["--port", str(app_port), "--ollama", f"http://127.0.0.1:{ollama_port}", "--stt-ms", str(args.stt_ms)]
+    if args.max_active:
+        serve_args += ["--max-active", str(args.max_active)]
+    if not args.tts_repeat:
+        serve_args.append("--no-tts-cache")
+    app = spawn("bench.serve", serve_args, workdir)
+    results: Dict = {}
+    try:
+        await wait_ready(f"http://127.0.0.1:{ollama_port}/api/ps")
+        await wait_ready(f"http://127.0.0.1:{app_port}/health")
+        base = f"ws://127.0.0.1:{app_port}"
+        for suite, run in (("chat", bench_chat), ("stt", bench_stt), ("tts", bench_tts)):
+            if suite in args.suites:
+                print(f"[bench] {suite}: {args.clients} clients", file=sys.stderr)
+                results[suite] = await run(base, args)
+        results["server_rss"] = rss(app.pid)
+        async with httpx.AsyncClient() as client:
+            results["server_health"] = (await client.get(f"http://127.0.0.1:{app_port}/health")).json()
+    finally:
+        for proc in (app, ollama):
+            proc.terminate()
+            try:
+                proc.wait(5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return results
+
+# --- memory store ---
+
+def timed_ms(fn, *a, **kw):
+    started = time.perf_counter()
+    result = fn(*a, **kw)
+    return (time.perf_counter() - started) * 1000, result
+
+def bench_memory(args, workdir: str) -> List[Dict]:
+    import core.memory as memory
+    from bench.corpus import CorpusGenerator, grow
+    memory.DB_PATH = os.path.join(workdir, "bench_memory.db")
+    manager = memory.MemoryManager(cache_bytes=0)
+    cached = None
+    generator = CorpusGenerator()
+    out = []
+    try:
+        for size in sorted(args.sizes):
+            print(f"[bench] memory: growing corpus to {size} rows", file=sys.stderr)
+            grow_ms, added = timed_ms(grow, manager, generator, size)
+            entry: Dict = {"rows": size, "grow": {"rows_added": added, "ms": round(grow_ms, 1)}}
+
+            search = {}
+            for band in ("common", "mid", "rare"):
+                terms = generator.query_terms(band, args.queries)
+                search[f"keyword_{band}"] = summarize([timed_ms(manager.search_memory, t)[0] for t in terms])
+            pairs = zip(generator.query_terms("mid", args.queries), generator.query_terms("rare", args.queries))
+            search["keyword_two_terms"] = summarize([timed_ms(manager.search_memory, f"{a} {b}")[0] for a, b in pairs])
+            terms = generator.query_terms("mid", args.queries)
+            search["scoped_type_tag"] = summarize([
+                timed_ms(manager.search_memory, t, types=["project"], tags=["code"])[0] for t in terms
+            ])
+            # Same queries twice through a cached manager: second pass measures hits
+            cached = cached or memory.MemoryManager()
+            for t in terms:
+                cached.search_memory(t)
+            search["cached_repeat"] = summarize([timed_ms(cached.search_memory, t)[0] for t in terms])
+            entry["search"] = search
+
+            store_ms = [timed_ms(manager.store_memory, f"bench single insert {i}", "fact", "bench")[0]
+                        for i in range(args.stores)]
+            bulk = [{"content": f"bench bulk insert {i}", "type": "fact", "tags": "bench"} for i in range(args.bulk)]
+            bulk_ms, _ = timed_ms(manager.store_memories, bulk)
+            entry["store"] = {"single_ms": summarize(store_ms),
+                              "bulk_rows": args.bulk, "bulk_rows_per_s": round(args.bulk / (bulk_ms / 1000), 1)}
+
+            prune_ms, pruned = timed_ms(manager.prune_low_confidence)
+            entry["prune"] = {"ms": round(prune_ms, 1), "deleted": pruned,
+                              "rows_per_s": round(pruned / (prune_ms / 1000), 1) if pruned else 0.0}
+            entry["db_mb"] = round(os.path.getsize(memory.DB_PATH) / 2**20, 1)
+            entry["rss"] = rss()
+            out.append(entry)
+    finally:
+        manager.close()
+        if cached is not None:
+            cached.close()
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma list of {', '.join(SUITES)}")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=5, help="chat requests / TTS phrases per client")
+    parser.add_argument("--delivery", default="token", choices=("token", "coalesce"))
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake generation")
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--ttft-ms", type=float, default=50.0)
+    parser.add_argument("--max-active", type=int, default=None, help="chat scheduler slots (default: service's)")
+    parser.add_argument("--utterances", type=int, default=3, help="STT utterances per client")
+    parser.add_argument("--chunk-ms", type=int, default=100, help="STT audio chunk length")
+    parser.add_argument("--stt-speedup", type=float, default=4.0, help="send audio this much faster than real time")
+    parser.add_argument("--stt-ms", type=float, default=40.0, help="stub Whisper decode time")
+    parser.add_argument("--tts-repeat", action="store_true", help="repeat one phrase (exercises the TTS cache)")
+    parser.add_argument("--sizes", default="10000,100000", help="memory corpus sizes, e.g. 10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--stores", type=int, default=200)
+    parser.add_argument("--bulk", type=int, default=10000)
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a fresh temp dir)")
+    parser.add_argument("--out", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+    args.suites = [s for s in args.suites.split(",") if s]
+    args.sizes = [int(s) for s in args.sizes.split(",") if s]
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+    if websockets is None and set(args.suites) & {"chat", "stt", "tts"}:
+        parser.error("the websockets package is required for chat/stt/tts suites")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ncs-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    report: Dict = {
+        "meta": {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k != "out"},
+        }
+    }
+    if set(args.suites) & {"chat", "stt", "tts"}:
+        report.update(asyncio.run(bench_service(args, workdir)))
+    if "memory" in args.suites:
+        report["memory"] = bench_memory(args, workdir)
+
+    for suite in ("chat", "stt", "tts"):
+        if suite in report:
+            r = report[suite]
+            key = {"chat": "ttft_ms", "stt": "final_after_endpoint_ms", "tts": "ttfa_ms"}[suite]
+            print(f"[bench] {suite}: {key} p50={r[key].get('p50')} p95={r[key].get('p95')} p99={r[key].get('p99')}",
+                  file=sys.stderr)
+    for entry in report.get("memory", []):
+        print(f"[bench] memory {entry['rows']} rows: keyword_mid p50={entry['search']['keyword_mid'].get('p50')}ms "
+              f"prune={entry['prune']['ms']}ms", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Runs the NCS app wired to benchmark stand-ins instead of real engines.
+
+Ollama is replaced by bench.fake_ollama (via --ollama), Piper by
+bench/fake_piper.py and Whisper by StubWhisper, which sleeps --stt-ms per decode.
+
+    python -m bench.serve --port 7400 --ollama http://127.0.0.1:11500
+"""
+import argparse
+import os
+import time
+
+import uvicorn
+
+SAMPLE_RATE = 16000
+
+class StubWhisper:
+    """Quacks like whisper's model for WhisperStreamer: fixed decode cost, echoes the audio length."""
+
+    def __init__(self, decode_ms: float):
+        self.decode_ms = decode_ms
+
+    def transcribe(self, audio, **kwargs):
+        time.sleep(self.decode_ms / 1000)
+        return {"text": f"{len(audio) / SAMPLE_RATE:.2f} seconds of speech"}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=7400)
+    parser.add_argument("--ollama", default="http://127.0.0.1:11500")
+    parser.add_argument("--piper", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_piper.py"))
+    parser.add_argument("--stt-ms", type=float, default=40.0)
+    parser.add_argument("--max-active", type=int, default=None, help="override chat scheduler slots")
+    parser.add_argument("--no-tts-cache", action="store_true")
+    args = parser.parse_args()
+
+    import core.models as models
+    models.OLLAMA_BASE = args.ollama
+    models.OLLAMA_URL = f"{args.ollama}/api/generate"
+    models.OLLAMA_PS_URL = f"{args.ollama}/api/ps"
+    from core import server
+    server.stt.model = StubWhisper(args.stt_ms)
+    server.stt._loaded = True
+    server.tts.pool.binary = args.piper
+    server.tts.use_cache = not args.no_tts_cache
+    if args.max_active:
+        server.chat_scheduler.max_active = args.max_active
+    uvicorn.run(server.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
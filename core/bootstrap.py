@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger("NCS-Bootstrap")
+# Reference point for the cold-start report; core.server imports this module first
+BOOT_TIME = time.perf_counter()
+# Engine lifecycle as reported in /health
+ENGINE_STATES = ("cold", "loading", "ready", "unavailable", "failed")
+
+class Bootstrap:
+    """Cold-start profile and engine readiness for the NCS service.
+
+    `phase()` times import and init steps; `loading()` wraps an engine's lazy
+    initialization so its state moves cold -> loading -> ready (or failed /
+    unavailable when a dependency is missing). Engines register an async warm
+    function that `/warmup` can run in the background.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.engines: Dict[str, str] = {}
+        self.errors: Dict[str, str] = {}
+        self.first_accept_ms: Optional[float] = None
+        self._warmers: Dict[str, Callable[[], Awaitable]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round((time.perf_counter() - started) * 1000, 2)
+
+    @contextmanager
+    def loading(self, engine: str):
+        self.engines[engine] = "loading"
+        try:
+            with self.phase(f"init:{engine}"):
+                yield
+        except (ImportError, FileNotFoundError) as e:
+            self.set_state(engine, "unavailable", e)
+            raise
+        except BaseException as e:
+            self.set_state(engine, "failed", e)
+            raise
+        self.set_state(engine, "ready")
+
+    def set_state(self, engine: str, state: str, error: Optional[BaseException] = None):
+        self.engines[engine] = state
+        if error is not None:
+            self.errors[engine] = str(error)
+            logger.warning(f"Engine {engine} {state}: {error}")
+        else:
+            self.errors.pop(engine, None)
+
+    def register(self, engine: str, warm: Callable[[], Awaitable]):
+        self._warmers[engine] = warm
+        self.engines.setdefault(engine, "cold")
+
+    def warm_up(self, engines: Optional[List[str]] = None) -> List[str]:
+        """Starts background warm-up for the named (default: all) engines not yet loaded or loading."""
+        started = []
+        for engine in engines or list(self._warmers):
+            if engine not in self._warmers:
+                raise ValueError(f"Unknown engine '{engine}'")
+            task = self._tasks.get(engine)
+            if self.engines.get(engine) in ("ready", "loading") or (task is not None and not task.done()):
+                continue
+            self._tasks[engine] = asyncio.create_task(self._warm(engine))
+            started.append(engine)
+        return started
+
+    async def _warm(self, engine: str):
+        try:
+            await self._warmers[engine]()
+        except Exception as e:
+            # State and error were recorded by the engine's loading() block
+            logger.debug(f"Warm-up of {engine} failed: {e}")
+
+    def mark_accept(self):
+        if self.first_accept_ms is None:
+            self.first_accept_ms = round((time.perf_counter() - BOOT_TIME) * 1000, 2)
+            logger.info(f"First WebSocket accepted {self.first_accept_ms}ms after boot")
+
+    def report(self) -> Dict:
+        return {
+            "uptime_ms": round((time.perf_counter() - BOOT_TIME) * 1000, 2),
+            "first_accept_ms": self.first_accept_ms,
+            "phases": dict(self.phases),
+            "engines": dict(self.engines),
+            "errors": dict(self.errors),
+        }
+
+class AcceptTimer:
+    """ASGI middleware recording when the first WebSocket handshake is accepted."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket" or bootstrap.first_accept_ms is not None:
+            return await self.app(scope, receive, send)
+
+        async def timed_send(message):
+            if message["type"] == "websocket.accept":
+                bootstrap.mark_accept()
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+bootstrap = Bootstrap()
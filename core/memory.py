@@ -4,7 +4,16 @@ import os
 import logging
 import time
 import math
-from typing import List, Dict
+import atexit
+import asyncio
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Dict, Optional, Tuple, Union
+from core.bootstrap import bootstrap
+from core.metrics import metrics, ROW_BUCKETS
+from core.vectors import Embedder, VectorStore, node_id, node_key
 
 logger = logging.getLogger("NCS-Memory")
 DB_PATH = "runtime/memory/memory.db"
@@ -17,76 +26,873 @@ DECAY_POLICIES = {
     "skill": 365 * 24 * 3600
 }
 
+DEFAULT_HALF_LIFE = 180 * 24 * 3600
+USAGE_WEIGHT = 0.1
+# Nodes below this confidence are garbage-collected by the decay pass
+PRUNE_THRESHOLD = 0.1
+# Rows visited per prune transaction; keeps the write lock short
+PRUNE_BATCH_SIZE = 5000
+
+# Semantic recall pulls k * N nearest vectors before rescoring with decay/importance
+SEMANTIC_OVERFETCH = 4
+# Dead-row fraction at which the decay pass compacts the vector matrix
+VECTOR_COMPACT_RATIO = 0.25
+# Nodes embedded per batch when backfilling vectors for existing rows
+VECTOR_REBUILD_BATCH = 1024
+# Node ids bound per `id IN (...)` lookup; stays under SQLite's host-parameter limit
+ID_LOOKUP_BATCH = 900
+
+# Recall cache bounds; sized for the 4-8 GB devices the service targets
+RECALL_CACHE_ENTRIES = 512
+RECALL_CACHE_BYTES = 4 * 1024 * 1024
+RECALL_CACHE_TTL = 60.0
+
+# Recall hits are buffered in memory and written back on this interval (seconds)
+REINFORCE_INTERVAL = 5.0
+
+# Write-behind defaults: flush every N queued nodes or every T milliseconds
+WRITE_BEHIND_BATCH = 512
+WRITE_BEHIND_INTERVAL_MS = 50
+
+# WAL lets readers proceed while a writer commits; NORMAL sync is durable across
+# app crashes and only fsyncs on checkpoint
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Scopes smaller than this are scanned via the type/tag indexes instead of FTS
+SCOPE_SCAN_LIMIT = 2000
+
+# Schema migrations are tracked through PRAGMA user_version
+SCHEMA_VERSION = 3
+# `seq` aliases the rowid, so VACUUM cannot renumber the keys memory_fts points at
+NODE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        seq INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        type TEXT,
+        content TEXT,
+        timestamp INTEGER,
+        last_accessed INTEGER,
+        importance INTEGER DEFAULT 1,
+        usage_count INTEGER DEFAULT 0,
+        base_confidence REAL DEFAULT 1.0,
+        tags TEXT
+    )
+"""
+# Node rows are handled as tuples in this column order
+NODE_COLUMNS = ("id", "type", "content", "timestamp", "last_accessed", "importance", "usage_count",
+                "base_confidence", "tags")
+NODE_SELECT = ", ".join(f"n.{c}" for c in NODE_COLUMNS)
+# The trigram tokenizer cannot index terms shorter than three characters
+FTS_MIN_TERM_LEN = 3
+# Words that appear in most rows; like 1-2 character terms they never select candidates
+STOPWORDS = frozenset("""
+    about after all also and any are because been but can could did does for from had has have
+    her him his how into its just not now our out she than that the their them then there these
+    they this was were what when where which while who why will with would you your
+""".split())
+
+SEARCH_SECONDS = metrics.histogram("ncs_memory_search_seconds", "search_memory latency", ("mode", "cache"))
+ROWS_SCANNED = metrics.histogram(
+    "ncs_memory_rows_scanned", "Candidate rows scored per uncached recall", ("mode",), buckets=ROW_BUCKETS)
+STORE_SECONDS = metrics.histogram("ncs_memory_store_seconds", "store_memories latency per call (any batch size)")
+ROWS_WRITTEN = metrics.counter("ncs_memory_rows_written", "Memory nodes inserted")
+ROWS_PRUNED = metrics.counter("ncs_memory_rows_pruned", "Memory nodes removed by the decay pass")
+
+def decay_confidence(m_type: str, ts: float, usage: int, base_conf: float, now: float,
+                     usage_weight: float = USAGE_WEIGHT) -> float:
+    # confidence = base_score × recency_factor × usage_factor
+    half_life = DECAY_POLICIES.get(m_type, DEFAULT_HALF_LIFE)
+    recency_factor = math.pow(0.5, (now - ts) / half_life)
+    usage_factor = 1.0 + (math.log(usage + 1) * usage_weight)
+    return min(1.0, base_conf * recency_factor * usage_factor)
+
+def _connect(path: str, usage_weight: float = USAGE_WEIGHT) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    # nexus_conf(type, timestamp, usage_count, base_confidence, now) lets the decay
+    # formula run inside SQLite, so pruning is a single set-based DELETE
+    conn.create_function("nexus_conf", 5, functools.partial(decay_confidence, usage_weight=usage_weight),
+                         deterministic=True)
+    return conn
+
+def parse_tags(tags) -> List[str]:
+    """Normalizes a comma-separated string (or list) of tags: trimmed, lowercased, unique."""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    return sorted({t.strip().lower() for t in tags or () if t.strip()})
+
+def _scope_sql(types: Optional[List[str]], tags: Optional[List[str]]) -> Tuple[str, list]:
+    """WHERE fragment (over alias `n`) restricting recall to any of `types` and any of `tags`."""
+    clauses, params = [], []
+    if isinstance(types, str):
+        types = [types]
+    if types:
+        clauses.append(f"n.type IN ({','.join('?' * len(types))})")
+        params.extend(types)
+    if tags:
+        tags = parse_tags(tags)
+        clauses.append(f"n.id IN (SELECT node_id FROM memory_tags WHERE tag IN ({','.join('?' * len(tags))}))")
+        params.extend(tags)
+    return " AND ".join(clauses), params
+
+def query_keys(terms: List[str]) -> List[str]:
+    """Terms that select recall candidates; the rest only add to the score of rows found."""
+    return [t for t in terms if len(t) >= FTS_MIN_TERM_LEN and t not in STOPWORDS]
+
+def _fts_match_expr(terms: List[str]) -> str:
+    """OR-query of quoted substrings, so the index returns the same rows `t in content` would."""
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+class RecallCache:
+    """LRU + TTL cache of recall results, bounded by entry count and approximate bytes.
+
+    Every write bumps `generation` and drops all entries; a result computed while a
+    write landed carries the old generation and is never stored, so a cached result
+    never outlives the data it was built from.
+    """
+
+    def __init__(self, max_entries: int = RECALL_CACHE_ENTRIES, max_bytes: int = RECALL_CACHE_BYTES,
+                 ttl: float = RECALL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: "OrderedDict[tuple, Tuple[int, float, int, List[Dict]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(query: str, k: int, mode: str, types=None, tags=None) -> tuple:
+        terms = query.lower().split()
+        # Keyword scoring ignores term order; embeddings see bigrams, so keep it there
+        normalized = tuple(sorted(terms)) if mode == "keyword" else " ".join(terms)
+        # Same normalization as _scope_sql, so equal scopes share an entry and a bare string stays one type
+        types = [types] if isinstance(types, str) else types
+        return (mode, normalized, k, frozenset(types or ()), tuple(parse_tags(tags)))
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def get(self, key: tuple) -> Optional[List[Dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            generation, expires, size, value = entry
+            if generation != self.generation or expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(m) for m in value]
+
+    def put(self, key: tuple, value: List[Dict], generation: int):
+        size = sum(len(m.get("content", "")) + 128 for m in value) + 256
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (generation, time.monotonic() + self.ttl, size, [dict(m) for m in value])
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: tuple):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "generation": self.generation,
+            }
+
 class MemoryManager:
-    def __init__(self):
+    """SQLite-backed memory store.
+
+    Writes go through one long-lived connection guarded by a lock; every reader
+    thread gets its own connection, so recall never waits on a writer in WAL mode.
+    With `write_behind=True`, store_memory only enqueues and a background thread
+    commits queued nodes in batches; recall commits whatever is still queued
+    first, so a search always sees every store that has returned.
+    Passing an `embedder` enables `search_memory(..., mode="semantic")`, backed by
+    a memory-mapped vector matrix stored next to the DB. Recall results are cached
+    in a RecallCache of at most `cache_bytes` (0 disables it).
+    Recall hits bump usage_count/last_accessed through an in-memory counter that a
+    background thread writes back every `reinforce_interval` seconds.
+    `db_path` defaults to DB_PATH; subclasses may override `usage_weight`.
+    """
+    usage_weight = USAGE_WEIGHT
+
+    def __init__(self, write_behind: bool = False, batch_size: int = WRITE_BEHIND_BATCH,
+                 flush_interval_ms: int = WRITE_BEHIND_INTERVAL_MS, embedder: Optional[Embedder] = None,
+                 cache_bytes: int = RECALL_CACHE_BYTES, reinforce_interval: float = REINFORCE_INTERVAL,
+                 db_path: Optional[str] = None):
+        self.db_path = db_path or DB_PATH
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.fts_enabled = False
+        self.cache = RecallCache(max_bytes=cache_bytes) if cache_bytes else None
+        # Bumped by every committed store or prune: recall output depends on nothing else.
+        # `epoch` tells this run's generations apart from an earlier process's
+        self.generation = 0
+        self.epoch = os.urandom(4).hex()
+        self.embedder = embedder
+        self.vectors = VectorStore(os.path.splitext(self.db_path)[0], embedder.dim) if embedder else None
+        self._write_lock = threading.Lock()
+        self._writer = _connect(self.db_path, self.usage_weight)
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
         self._init_db()
+        if self.vectors:
+            self._sync_vectors()
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._pending: List[tuple] = []
+        self._pending_cv = threading.Condition()
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+        if write_behind:
+            self._flusher = threading.Thread(target=self._flush_loop, name="ncs-memory-writer", daemon=True)
+            self._flusher.start()
+
+        self.reinforce_interval = reinforce_interval
+        # node id -> [hit count, last recall timestamp]
+        self._hits: Dict[str, List[int]] = {}
+        self._hits_lock = threading.Lock()
+        self._reinforce_stop = threading.Event()
+        self._reinforcer = threading.Thread(target=self._reinforce_loop, name="ncs-memory-reinforce", daemon=True)
+        self._reinforcer.start()
+        atexit.register(self.close)
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.db_path, self.usage_weight)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
 
     def _init_db(self):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS memory_nodes (
-                id TEXT PRIMARY KEY,
-                type TEXT,
-                content TEXT,
-                timestamp INTEGER,
-                last_accessed INTEGER,
-                importance INTEGER DEFAULT 1,
-                usage_count INTEGER DEFAULT 0,
-                base_confidence REAL DEFAULT 1.0
+        with self._write_lock:
+            cursor = self._writer.cursor()
+            cursor.execute(NODE_TABLE_SQL.format(name="memory_nodes"))
+            self._migrate(cursor)
+            self._writer.commit()
+
+    def _migrate(self, cursor):
+        """Brings older databases up to SCHEMA_VERSION.
+
+        v1 adds the FTS5 inverted index over memory_nodes.content, kept in sync via
+        triggers and keyed on the node rowid.
+        v2 unifies the service and runtime schemas: a `tags` column on every node,
+        the normalized memory_tags table, and secondary indexes on type/timestamp.
+        v3 copies memory_nodes into a table whose rowid is the explicit `seq`
+        column, then rebuilds the FTS index, since a VACUUM may already have
+        renumbered the implicit rowids it pointed at.
+        """
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        if version < 2:
+            self._migrate_tags(cursor)
+        rekeyed = self._migrate_rowid(cursor)
+        self._migrate_fts(cursor, rebuild=rekeyed)
+        self._create_tag_index(cursor)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _migrate_rowid(self, cursor) -> bool:
+        columns = [c[1] for c in cursor.execute("PRAGMA table_info(memory_nodes)")]
+        if "seq" in columns:
+            return False
+        logger.info("Re-keying memory nodes on a stable rowid...")
+        names = ", ".join(NODE_COLUMNS)
+        cursor.execute(NODE_TABLE_SQL.format(name="memory_nodes_v3"))
+        cursor.execute(f"INSERT INTO memory_nodes_v3 (seq, {names}) SELECT rowid, {names} FROM memory_nodes")
+        # Dropping the table drops its FTS and tag triggers and indexes; both are recreated next
+        cursor.execute("DROP TABLE memory_nodes")
+        cursor.execute("ALTER TABLE memory_nodes_v3 RENAME TO memory_nodes")
+        return True
+
+    def _migrate_fts(self, cursor, rebuild: bool = False):
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'memory_fts'"
+        ).fetchone()
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS memory_fts USING fts5(
+                    content,
+                    content='memory_nodes',
+                    content_rowid='rowid',
+                    tokenize='trigram'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 unavailable, recall falls back to full scan: {e}")
+            return
+        cursor.executescript("""
+            CREATE TRIGGER IF NOT EXISTS memory_nodes_ai AFTER INSERT ON memory_nodes BEGIN
+                INSERT INTO memory_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS memory_nodes_ad AFTER DELETE ON memory_nodes BEGIN
+                INSERT INTO memory_fts(memory_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS memory_nodes_au AFTER UPDATE OF content ON memory_nodes BEGIN
+                INSERT INTO memory_fts(memory_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                INSERT INTO memory_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+        """)
+        if not exists or rebuild:
+            # Existing databases: index every node stored before the migration
+            logger.info("Building memory full-text index...")
+            cursor.execute("INSERT INTO memory_fts(memory_fts) VALUES ('rebuild')")
+        self.fts_enabled = True
+
+    def _migrate_tags(self, cursor):
+        columns = [c[1] for c in cursor.execute("PRAGMA table_info(memory_nodes)")]
+        if "tags" not in columns:
+            cursor.execute("ALTER TABLE memory_nodes ADD COLUMN tags TEXT")
+        self._create_tag_index(cursor)
+        tagged = cursor.execute(
+            "SELECT id, tags FROM memory_nodes WHERE tags IS NOT NULL AND tags != ''"
+        ).fetchall()
+        if tagged:
+            logger.info(f"Indexing tags of {len(tagged)} memory nodes...")
+            cursor.executemany(
+                "INSERT OR IGNORE INTO memory_tags (tag, node_id) VALUES (?, ?)",
+                [(tag, m_id) for m_id, tags in tagged for tag in parse_tags(tags)]
             )
+
+    def _create_tag_index(self, cursor):
+        cursor.executescript("""
+            CREATE TABLE IF NOT EXISTS memory_tags (
+                tag TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                PRIMARY KEY (tag, node_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_memory_tags_node ON memory_tags(node_id);
+            CREATE INDEX IF NOT EXISTS idx_memory_nodes_type ON memory_nodes(type);
+            CREATE INDEX IF NOT EXISTS idx_memory_nodes_timestamp ON memory_nodes(timestamp);
+            CREATE TRIGGER IF NOT EXISTS memory_nodes_tags_ad AFTER DELETE ON memory_nodes BEGIN
+                DELETE FROM memory_tags WHERE node_id = old.id;
+            END;
         """)
-        conn.commit()
-        conn.close()
+
+    def rebuild_index(self):
+        if not self.fts_enabled:
+            return
+        with self._write_lock, self._writer:
+            self._writer.execute("INSERT INTO memory_fts(memory_fts) VALUES ('rebuild')")
+
+    def _sync_vectors(self):
+        rows = self._writer.execute("SELECT COUNT(*) FROM memory_nodes").fetchone()[0]
+        if self.vectors.live_count != rows:
+            self.rebuild_vectors()
+
+    def rebuild_vectors(self) -> int:
+        """Embeds nodes that have no vector yet and tombstones vectors of deleted nodes.
+
+        Covers rows stored before an embedder was configured or pruned while the
+        store was opened without one; returns the number of nodes embedded.
+        """
+        if self.vectors is None:
+            return 0
+        have = set(self.vectors.live_keys().tolist())
+        present = set()
+        embedded = 0
+        cursor = self._reader().execute("SELECT id, content FROM memory_nodes")
+        while True:
+            batch = cursor.fetchmany(VECTOR_REBUILD_BATCH)
+            if not batch:
+                break
+            present.update(node_key(m_id) for m_id, _ in batch)
+            missing = [(m_id, content) for m_id, content in batch if node_key(m_id) not in have]
+            if missing:
+                self.vectors.append([m_id for m_id, _ in missing], self.embedder.embed([c for _, c in missing]))
+                embedded += len(missing)
+        stale = [node_id(key) for key in have - present]
+        self.vectors.delete(stale)
+        if embedded or stale:
+            logger.info(f"Rebuilt vectors: embedded {embedded} nodes, dropped {len(stale)} stale rows.")
+        return embedded
 
     def calculate_confidence(self, row: tuple) -> float:
-        # confidence = base_score × recency_factor × usage_factor
-        m_id, m_type, content, ts, last_acc, imp, usage, base_conf = row
-        
-        # Recency Decay
-        elapsed = time.time() - ts
-        half_life = DECAY_POLICIES.get(m_type, 180 * 24 * 3600)
-        recency_factor = math.pow(0.5, elapsed / half_life)
-        
-        # Usage Reinforcement
-        usage_factor = 1.0 + (math.log(usage + 1) * 0.1)
-        
-        return min(1.0, base_conf * recency_factor * usage_factor)
-
-    def store_memory(self, content: str, m_type: str = "fact"):
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
+        m_id, m_type, content, ts, last_acc, imp, usage, base_conf, tags = row
+        return decay_confidence(m_type, ts, usage, base_conf, time.time(), self.usage_weight)
+
+    def prune_low_confidence(self, threshold: float = PRUNE_THRESHOLD,
+                             cancel: Optional[threading.Event] = None) -> int:
+        """Auto-prune old or low-confidence vectors to keep database lean.
+
+        Walks the table in rowid windows, one short transaction per window, so
+        readers and store_memory are never locked out for the whole pass. Setting
+        `cancel` stops the pass after the current window.
+        """
+        conn = self._writer
+        now = time.time()
+        last_rowid = 0
+        pruned_count = 0
+        pruned_ids: List[str] = []
+        returning = " RETURNING id" if self.vectors else ""
+        while cancel is None or not cancel.is_set():
+            upper = self._reader().execute(
+                "SELECT MAX(rowid) FROM (SELECT rowid FROM memory_nodes WHERE rowid > ? ORDER BY rowid LIMIT ?)",
+                (last_rowid, PRUNE_BATCH_SIZE)
+            ).fetchone()[0]
+            if upper is None:
+                break
+            with self._write_lock, conn:
+                cursor = conn.execute(
+                    "DELETE FROM memory_nodes WHERE rowid > ? AND rowid <= ? "
+                    "AND nexus_conf(type, timestamp, usage_count, base_confidence, ?) < ?" + returning,
+                    (last_rowid, upper, now, threshold)
+                )
+                if returning:
+                    deleted = [r[0] for r in cursor.fetchall()]
+                    pruned_ids.extend(deleted)
+                    n_deleted = len(deleted)
+                else:
+                    n_deleted = cursor.rowcount
+            pruned_count += n_deleted
+            if n_deleted:
+                self._changed()
+            last_rowid = upper
+        if self.vectors:
+            self.vectors.delete(pruned_ids)
+        if pruned_count > 0:
+            ROWS_PRUNED.inc(pruned_count)
+            logger.info(f"Pruned {pruned_count} low-confidence memory nodes.")
+        return pruned_count
+
+    def store_memory(self, content: str, m_type: str = "fact", tags: str = ""):
+        return self.store_memories([{"content": content, "type": m_type, "tags": tags}])[0]
+
+    def store_memories(self, items: List[Dict]) -> List[str]:
+        """Bulk insert of {"content", "type", "tags"} dicts in a single transaction."""
+        started = time.perf_counter()
         now = int(time.time())
-        m_id = os.urandom(8).hex()
+        rows = [
+            (os.urandom(8).hex(), item.get("type", "fact"), item["content"], now, now,
+             ",".join(parse_tags(item.get("tags", ""))))
+            for item in items
+        ]
+        if self._flusher is not None:
+            with self._pending_cv:
+                self._pending.extend(rows)
+                self._pending_cv.notify()
+        else:
+            self._write_rows(rows)
+        STORE_SECONDS.observe(time.perf_counter() - started)
+        return [row[0] for row in rows]
+
+    def _write_rows(self, rows: List[tuple]):
+        with self._write_lock, self._writer:
+            self._writer.executemany(
+                "INSERT INTO memory_nodes (id, type, content, timestamp, last_accessed, tags) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._writer.executemany(
+                "INSERT OR IGNORE INTO memory_tags (tag, node_id) VALUES (?, ?)",
+                [(tag, row[0]) for row in rows if row[5] for tag in row[5].split(",")]
+            )
+        # Only committed nodes get vectors; a crash before this is backfilled on the next open
+        if self.vectors:
+            self.vectors.append([row[0] for row in rows], self.embedder.embed([row[2] for row in rows]))
+        ROWS_WRITTEN.inc(len(rows))
+        self._changed()
+
+    def _changed(self):
+        self.generation += 1
+        if self.cache:
+            self.cache.invalidate()
+
+    def _flush_loop(self):
+        while True:
+            with self._pending_cv:
+                while not self._closed and not self._pending:
+                    self._pending_cv.wait()
+                # First queued node starts the window; a full batch ends it early
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._pending_cv.wait(remaining)
+                rows, self._pending = self._pending, []
+                closed = self._closed
+            if rows:
+                try:
+                    self._write_rows(rows)
+                except sqlite3.Error as e:
+                    logger.error(f"Write-behind flush failed, dropped {len(rows)} nodes: {e}")
+            if closed:
+                return
+
+    def flush(self):
+        """Commits every node queued by the write-behind path."""
+        with self._pending_cv:
+            rows, self._pending = self._pending, []
+        if rows:
+            self._write_rows(rows)
+
+    def _record_hits(self, results: List[Dict]):
+        now = int(time.time())
+        with self._hits_lock:
+            for m in results:
+                entry = self._hits.get(m["id"])
+                if entry is None:
+                    self._hits[m["id"]] = [1, now]
+                else:
+                    entry[0] += 1
+                    entry[1] = now
+
+    def flush_reinforcement(self) -> int:
+        """Writes buffered recall hits back as one executemany UPDATE."""
+        with self._hits_lock:
+            hits, self._hits = self._hits, {}
+        if not hits:
+            return 0
+        # Cached recall results are left alone: the usage factor moves slowly and
+        # RECALL_CACHE_TTL bounds the drift
+        with self._write_lock, self._writer:
+            self._writer.executemany(
+                "UPDATE memory_nodes SET usage_count = usage_count + ?, "
+                "last_accessed = MAX(last_accessed, ?) WHERE id = ?",
+                [(count, ts, m_id) for m_id, (count, ts) in hits.items()]
+            )
+        return len(hits)
+
+    def _reinforce_loop(self):
+        while not self._reinforce_stop.wait(self.reinforce_interval):
+            try:
+                self.flush_reinforcement()
+            except sqlite3.Error as e:
+                logger.error(f"Reinforcement flush failed: {e}")
+
+    def close(self):
+        if self._closed:
+            return
+        with self._pending_cv:
+            self._closed = True
+            self._pending_cv.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        self._reinforce_stop.set()
+        self._reinforcer.join()
+        self.flush_reinforcement()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._write_lock:
+            self._writer.close()
+
+    def _fetch_candidates(self, cursor, keys: List[str], types: Optional[List[str]] = None,
+                          tags: Optional[List[str]] = None) -> List[tuple]:
+        """Returns (row, bm25) pairs for nodes in scope that contain at least one key term.
+
+        A small scope (fewer than SCOPE_SCAN_LIMIT nodes) is read straight from the
+        type/tag indexes, so its cost follows the subset size; otherwise the FTS
+        index drives and the scope is applied to its matches.
+        """
+        scope, params = _scope_sql(types, tags)
+        if scope:
+            small = cursor.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM memory_nodes n WHERE {scope} LIMIT ?)",
+                params + [SCOPE_SCAN_LIMIT]
+            ).fetchone()[0] < SCOPE_SCAN_LIMIT
+            if small or not self.fts_enabled:
+                cursor.execute(f"SELECT {NODE_SELECT} FROM memory_nodes n WHERE {scope}", params)
+                return [(row, 0.0) for row in cursor.fetchall()]
+        if not self.fts_enabled:
+            cursor.execute(f"SELECT {NODE_SELECT} FROM memory_nodes n")
+            return [(row, 0.0) for row in cursor.fetchall()]
         cursor.execute(
-            "INSERT INTO memory_nodes (id, type, content, timestamp, last_accessed) VALUES (?, ?, ?, ?, ?)", 
-            (m_id, m_type, content, now, now)
+            f"SELECT {NODE_SELECT}, bm25(memory_fts) FROM memory_fts "
+            "JOIN memory_nodes n ON n.seq = memory_fts.rowid "
+            "WHERE memory_fts MATCH ?" + (f" AND {scope}" if scope else ""),
+            [_fts_match_expr(keys)] + params
         )
-        conn.commit()
-        conn.close()
-        return m_id
-
-    def search_memory(self, query: str, k: int = 5) -> List[Dict]:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        # simplified search for skeleton
-        cursor.execute("SELECT * FROM memory_nodes")
-        rows = cursor.fetchall()
-        
+        return [(row[:-1], row[-1]) for row in cursor.fetchall()]
+
+    @staticmethod
+    def _fetch_nodes(cursor, ids, scope: str = "", params: Optional[list] = None) -> List[tuple]:
+        """Rows of the given node ids that are in `scope`."""
+        ids, rows = list(ids), []
+        for start in range(0, len(ids), ID_LOOKUP_BATCH):
+            batch = ids[start:start + ID_LOOKUP_BATCH]
+            cursor.execute(
+                f"SELECT {NODE_SELECT} FROM memory_nodes n WHERE n.id IN ({','.join('?' * len(batch))})"
+                + (f" AND {scope}" if scope else ""),
+                batch + (params or [])
+            )
+            rows.extend(cursor.fetchall())
+        return rows
+
+    def _semantic_search(self, query: str, k: int, types: Optional[List[str]] = None,
+                         tags: Optional[List[str]] = None) -> List[Dict]:
+        if self.vectors is None:
+            raise ValueError("Semantic recall requires MemoryManager(embedder=...)")
+        embedding = self.embedder.embed([query])[0]
+        want = k * SEMANTIC_OVERFETCH
+        cursor = self._reader().cursor()
+        scope, params = _scope_sql(types, tags)
+        if scope and cursor.execute(
+            f"SELECT COUNT(*) FROM (SELECT 1 FROM memory_nodes n WHERE {scope} LIMIT ?)", params + [SCOPE_SCAN_LIMIT]
+        ).fetchone()[0] < SCOPE_SCAN_LIMIT:
+            # Small scope: rank only its own vectors
+            in_scope = [r[0] for r in cursor.execute(f"SELECT n.id FROM memory_nodes n WHERE {scope}", params)]
+            hits = dict(self.vectors.search(embedding, want, among=in_scope))
+            rows = self._fetch_nodes(cursor, hits)
+        else:
+            # Large (or no) scope: filter the nearest rows, widening until `want` of them are in it
+            fetch = want
+            while True:
+                hits = dict(self.vectors.search(embedding, fetch))
+                rows = self._fetch_nodes(cursor, hits, scope, params)
+                if len(rows) >= want or len(hits) < fetch:
+                    break
+                fetch *= SEMANTIC_OVERFETCH
+        ROWS_SCANNED.observe(len(rows), ("semantic",))
+
         scored = []
         for row in rows:
+            similarity = hits[row[0]]
+            conf = self.calculate_confidence(row)
+            score = (similarity * 2) + conf + row[5]
+            scored.append({"content": row[2], "confidence": conf, "score": score, "similarity": similarity, "id": row[0]})
+        return sorted(scored, key=lambda x: x["score"], reverse=True)[:k]
+
+    def search_memory(self, query: str, k: int = 5, mode: str = "keyword",
+                      types: Optional[List[str]] = None, tags: Optional[List[str]] = None) -> List[Dict]:
+        """Top-k recall, optionally restricted to nodes of any of `types` and any of `tags`.
+
+        Keyword mode keeps only nodes containing at least one key term (three or
+        more characters, not a stopword) and ranks them by `relevance * 2 +
+        confidence + importance`, the enclave's scoring, where relevance counts
+        every query term. A query with no key terms, or matching nothing, returns
+        [] rather than the most confident nodes.
+        """
+        started = time.perf_counter()
+        if self._pending:
+            # Read-your-writes: queued nodes are committed before they can be missed or cached around
+            self.flush()
+        if self.cache is None:
+            result = self._search(query, k, mode, types, tags)
+            self._record_hits(result)
+            SEARCH_SECONDS.observe(time.perf_counter() - started, (mode, "off"))
+            return result
+        key = self.cache.key(query, k, mode, types, tags)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self._record_hits(cached)
+            SEARCH_SECONDS.observe(time.perf_counter() - started, (mode, "hit"))
+            return cached
+        generation = self.cache.generation
+        result = self._search(query, k, mode, types, tags)
+        self.cache.put(key, result, generation)
+        self._record_hits(result)
+        SEARCH_SECONDS.observe(time.perf_counter() - started, (mode, "miss"))
+        return result
+
+    def _search(self, query: str, k: int, mode: str, types: Optional[List[str]],
+                tags: Optional[List[str]]) -> List[Dict]:
+        if mode == "semantic":
+            return self._semantic_search(query, k, types, tags)
+        terms = query.lower().split()
+        keys = query_keys(terms)
+        if not keys:
+            ROWS_SCANNED.observe(0, ("keyword",))
+            return []
+        candidates = self._fetch_candidates(self._reader().cursor(), keys, types, tags)
+        ROWS_SCANNED.observe(len(candidates), ("keyword",))
+
+        scored = []
+        for row, bm25 in candidates:
+            content = row[2]
+            lowered = content.lower()
+            if not any(t in lowered for t in keys):
+                continue
+            relevance = sum(1 for t in terms if t in lowered)
             conf = self.calculate_confidence(row)
-            # update last_accessed on recall attempt
-            scored.append({"content": row[2], "confidence": conf, "id": row[0]})
-            
-        conn.close()
-        # return top k by confidence
-        return sorted(scored, key=lambda x: x["confidence"], reverse=True)[:k]
+            score = (relevance * 2) + conf + row[5]
+            scored.append((score, bm25, {"content": content, "confidence": conf, "score": score, "id": row[0]}))
+
+        # bm25() is negative, lower is more relevant; it only breaks score ties
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [m for _, _, m in scored[:k]]
 
     def nightly_decay_pass(self):
         """Deprioritize or flag for GC low confidence memories."""
         logger.info("Running neural decay pass...")
-        # In real impl, we'd delete nodes with conf < 0.05
-        pass
+        pruned = self.prune_low_confidence()
+        if self.vectors and self.vectors.dead_ratio >= VECTOR_COMPACT_RATIO:
+            self.vectors.compact()
+        return pruned
+
+class AsyncMemory:
+    """Awaitable facade over MemoryManager for the FastAPI handlers.
+
+    Calls run on a dedicated thread pool, each worker with its own reader
+    connection, so sqlite I/O never blocks the event loop. At most `max_pending`
+    jobs are handed to the pool; further callers wait asynchronously. Cancelling
+    the awaiting task interrupts an in-flight query (or stops a prune after
+    its current window).
+    """
+
+    def __init__(self, manager: Union[MemoryManager, Callable[[], MemoryManager]],
+                 max_workers: int = 2, max_pending: int = 32):
+        # A factory defers opening sqlite and the vector files until the first call
+        self._manager = manager if isinstance(manager, MemoryManager) else None
+        self._factory = None if self._manager is not None else manager
+        self._manager_lock = threading.Lock()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ncs-memory")
+        self._slots = asyncio.Semaphore(max_pending)
+        self._counter_lock = threading.Lock()
+        self._waiting = 0
+        self._submitted = 0
+        self._started = 0
+        self._finished = 0
+        self._cancelled = 0
+
+    @property
+    def manager(self) -> MemoryManager:
+        if self._manager is None:
+            with self._manager_lock:
+                if self._manager is None:
+                    with bootstrap.loading("memory"):
+                        self._manager = self._factory()
+        return self._manager
+
+    @property
+    def loaded(self) -> bool:
+        return self._manager is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        """Changes whenever recall results may change (any write, any restart); None until opened."""
+        manager = self._manager
+        return f"{manager.epoch}.{manager.generation}" if manager is not None else None
+
+    async def warm(self):
+        # Any job opens the manager on a pool thread, off the event loop
+        await self._submit(lambda cancel: None)
+
+    async def _submit(self, call: Callable[[threading.Event], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        cancel = threading.Event()
+        # The worker's reader connection while this job runs on it; readers are per thread and
+        # shared with later jobs, so it may only be interrupted while set (under job_lock)
+        job_lock = threading.Lock()
+        job_conn: List[sqlite3.Connection] = []
+
+        def job():
+            with self._counter_lock:
+                self._started += 1
+            try:
+                if cancel.is_set():
+                    return None
+                conn = self.manager._reader()
+                with job_lock:
+                    if cancel.is_set():
+                        return None
+                    job_conn.append(conn)
+                return call(cancel)
+            finally:
+                with job_lock:
+                    job_conn.clear()
+                with self._counter_lock:
+                    self._finished += 1
+
+        def done(f):
+            if f.cancelled():
+                # Dropped from the pool queue before a worker picked it up
+                with self._counter_lock:
+                    self._started += 1
+                    self._finished += 1
+            loop.call_soon_threadsafe(self._slots.release)
+
+        self._submitted += 1
+        cf = self._executor.submit(job)
+        cf.add_done_callback(done)
+        try:
+            return await asyncio.wrap_future(cf)
+        except asyncio.CancelledError:
+            self._cancelled += 1
+            with job_lock:
+                cancel.set()
+                if job_conn:
+                    job_conn[0].interrupt()
+            raise
+
+    async def search(self, query: str, k: int = 5, mode: str = "keyword",
+                     types: Optional[List[str]] = None, tags: Optional[List[str]] = None) -> List[Dict]:
+        return await self._submit(lambda cancel: self.manager.search_memory(query, k, mode, types, tags))
+
+    async def store(self, content: str, m_type: str = "fact", tags: str = "") -> str:
+        return await self._submit(lambda cancel: self.manager.store_memory(content, m_type, tags))
+
+    async def store_many(self, items: List[Dict]) -> List[str]:
+        return await self._submit(lambda cancel: self.manager.store_memories(items))
+
+    async def prune(self, threshold: float = PRUNE_THRESHOLD) -> int:
+        return await self._submit(lambda cancel: self.manager.prune_low_confidence(threshold, cancel=cancel))
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            started, finished = self._started, self._finished
+        return {
+            "waiting": self._waiting,
+            "queued": self._submitted - started,
+            "running": started - finished,
+            "completed": finished,
+            "cancelled": self._cancelled,
+            "workers": self.max_workers,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        if self._factory is not None and self._manager is not None:
+            self._manager.close()
+
+memory = AsyncMemory(MemoryManager)
+
+metrics.gauge("ncs_memory_queue_depth", "Memory jobs waiting for a slot or a pool worker",
+              func=lambda: sum(memory.stats()[k] for k in ("waiting", "queued")))
 
-memory_system = MemoryManager()
+def __getattr__(name):
+    # `memory_system` predates the lazy facade; resolving it opens the database
+    if name == "memory_system":
+        return memory.manager
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
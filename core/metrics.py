@@ -0,0 +1,254 @@
+import bisect
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# Latency buckets (seconds) shared by the per-stage histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Decode seconds per second of audio (real-time factor); < 1 keeps up with speech
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _series(self, suffix: str, labels: Labels, extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return f"{self.name}{suffix}{{{','.join(pairs)}}}" if pairs else f"{self.name}{suffix}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        return []
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self._series('_total', labels)} {_fmt(v)}" for labels, v in items]
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by `func` (a number, or {labels: number})."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 func: Optional[Callable[[], Union[float, Dict[Labels, float]]]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+        self.func = func
+
+    def set(self, value: float, labels: Labels = ()):
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self) -> Dict[Labels, float]:
+        if self.func is None:
+            with self._lock:
+                return dict(self._values)
+        try:
+            value = self.func()
+        except Exception:
+            return {}
+        if value is None:
+            return {}
+        return value if isinstance(value, dict) else {(): value}
+
+    def _samples(self) -> List[str]:
+        return [f"{self._series('', labels)} {_fmt(v)}" for labels, v in self.values().items()]
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; one bisect and a few increments per observation."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series_data: Dict[Labels, List[float]] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._series_data.get(labels)
+            if data is None:
+                data = self._series_data[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            data[i] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, labels: Labels = ()):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, labels)
+
+    def summary(self, labels: Optional[Labels] = None) -> Dict[str, float]:
+        """count/sum/mean and bucket-interpolated p50/p95/p99, for one label set or all merged."""
+        with self._lock:
+            if labels is not None:
+                series = [self._series_data[labels]] if labels in self._series_data else []
+            else:
+                series = list(self._series_data.values())
+            counts = [sum(col) for col in zip(*(s[:-1] for s in series))] if series else []
+            total = sum(s[-1] for s in series)
+        count = sum(counts)
+        if not count:
+            return {"count": 0}
+        out = {"count": count, "sum": total, "mean": total / count}
+        for q in (0.5, 0.95, 0.99):
+            out[f"p{int(q * 100)}"] = self._quantile(q, counts, count)
+        return out
+
+    def _quantile(self, q: float, counts: List[int], count: int) -> float:
+        """Same linear interpolation as Prometheus' histogram_quantile()."""
+        rank = q * count
+        seen = 0
+        for i, n in enumerate(counts):
+            if seen + n >= rank and n:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(data)) for labels, data in self._series_data.items()]
+        lines = []
+        for labels, data in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), data[:-1]):
+                cumulative += n
+                le = f'le="{_fmt(bound)}"'
+                lines.append(f"{self._series('_bucket', labels, le)} {cumulative}")
+            lines.append(f"{self._series('_sum', labels)} {_fmt(data[-1])}")
+            lines.append(f"{self._series('_count', labels)} {cumulative}")
+        return lines
+
+class CountingExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts its queued and running jobs, for queue-depth gauges."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = ""):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.max_workers = max_workers
+        self._count_lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        def run():
+            with self._count_lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._count_lock:
+                    self._running -= 1
+
+        with self._count_lock:
+            self._queued += 1
+        try:
+            future = super().submit(run)
+        except BaseException:
+            with self._count_lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._dropped)
+        return future
+
+    def _dropped(self, future: Future):
+        # Only a job no worker picked up yet can be cancelled
+        if future.cancelled():
+            with self._count_lock:
+                self._queued -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._count_lock:
+            return {"queued": self._queued, "running": self._running, "workers": self.max_workers}
+
+class MetricsRegistry:
+    """Process-wide metrics, rendered in the Prometheus text format by `/metrics`.
+
+    Modules declare their metrics at import time; asking again for an existing
+    name returns the same object.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), func=None) -> Gauge:
+        return self._get(Gauge, name, help, labelnames, func=func)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
@@ -1,40 +1,545 @@
-
 import httpx
 import json
 import asyncio
+import hashlib
 import logging
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional
+from fastapi import WebSocketDisconnect
+from core.streaming import TokenCoalescer, WS_SEND_SECONDS, WS_FRAMES
+from core.response_cache import ResponseCache
+from core.bootstrap import bootstrap
+from core.metrics import metrics
+
+# Optional: orjson decodes NDJSON lines several times faster than stdlib json
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 logger = logging.getLogger("NCS-Models")
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_BASE = "http://localhost:11434"
+OLLAMA_URL = f"{OLLAMA_BASE}/api/generate"
+OLLAMA_PS_URL = f"{OLLAMA_BASE}/api/ps"
 MODEL_NAME = "llama3:8b-instruct-q4_K_M"
+# Smaller model served while the device is short on memory
+FALLBACK_MODEL = "phi3:mini"
+
+# Telemetry hysteresis on free RAM (MB): warm the fallback early, swap down
+# below LOW_RAM_MB, and only return to the primary once well clear of it
+PRELOAD_RAM_MB = 1500
+LOW_RAM_MB = 1000
+RECOVER_RAM_MB = 2500
+# Minimum seconds between swaps, whatever telemetry says
+SWAP_COOLDOWN = 60.0
+# How long a swap waits for streams on the outgoing model before unloading it anyway
+DRAIN_TIMEOUT = 30.0
+KEEP_ALIVE = "30m"
+
+# One pooled client for the app lifetime; streams hold a connection each
+KEEPALIVE_EXPIRY = 60.0
+HTTP_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=16, keepalive_expiry=KEEPALIVE_EXPIRY)
+HTTP_TIMEOUT = httpx.Timeout(connect=5.0, read=None, write=10.0, pool=None)
+
+OLLAMA_CONNECT_SECONDS = metrics.histogram(
+    "ncs_ollama_connect_seconds", "Time from sending a generate request to Ollama's response headers")
+LLM_TTFT_SECONDS = metrics.histogram("ncs_llm_ttft_seconds", "Time from sending a generate request to its first token")
+LLM_TOKENS = metrics.counter("ncs_llm_tokens", "Tokens streamed from Ollama", ("model",))
+LLM_STREAMS = metrics.counter("ncs_llm_streams", "Backend generations by outcome", ("outcome",))
+
+class _Flight:
+    """One backend generation shared by every subscriber with the same request fingerprint."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._event = asyncio.Event()
+
+    def _notify(self):
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def push(self, token: str):
+        self.tokens.append(token)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    async def replay(self) -> AsyncIterator[str]:
+        """Yields every token from the start (late joiners catch up), then follows live."""
+        i = 0
+        while True:
+            event = self._event
+            while i < len(self.tokens):
+                yield self.tokens[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await event.wait()
+
+class ModelManager:
+    """Tracks which Ollama models are resident and which one serves new requests.
+
+    Swaps are driven by device telemetry with hysteresis and a cooldown so a
+    hovering `ramFree` does not flap between models. The incoming model is
+    warmed with a keep-alive request before it takes traffic, and the outgoing
+    one is unloaded only after its in-flight streams have drained.
+    """
+
+    def __init__(self, primary: str = MODEL_NAME, fallback: str = FALLBACK_MODEL):
+        self.primary = primary
+        self.fallback = fallback
+        self.active = primary
+        # name -> {"state": cold|loading|warm|unloading, "size_mb": .., "vram_mb": ..}
+        self.models: Dict[str, Dict] = {}
+        self._streams: Dict[str, int] = {}
+        self._drained: Dict[str, asyncio.Event] = {}
+        self._preloads: Dict[str, asyncio.Task] = {}
+        self._swap_lock = asyncio.Lock()
+        self._swap_task: Optional[asyncio.Task] = None
+        self.swapping = False
+        self.swaps = 0
+        self.last_swap = 0.0
+        self.ram_free_mb: Optional[float] = None
+        # Latest HardwareState from /ws/control, for model_status and /metrics
+        self.telemetry: Dict = {}
+
+    def _info(self, name: str) -> Dict:
+        return self.models.setdefault(name, {"state": "cold", "size_mb": None, "vram_mb": None})
+
+    def stream_started(self, name: str):
+        self._streams[name] = self._streams.get(name, 0) + 1
+        self._drained.setdefault(name, asyncio.Event()).clear()
+
+    def stream_finished(self, name: str):
+        remaining = self._streams.get(name, 1) - 1
+        self._streams[name] = remaining
+        if remaining <= 0:
+            del self._streams[name]
+            self._drained.setdefault(name, asyncio.Event()).set()
+
+    async def drain(self, name: str, timeout: float = DRAIN_TIMEOUT) -> bool:
+        if not self._streams.get(name):
+            return True
+        try:
+            await asyncio.wait_for(self._drained[name].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.warning(f"{self._streams.get(name, 0)} streams still on {name} after {timeout}s")
+            return False
+
+    async def preload(self, name: str):
+        """Loads `name` into Ollama with an empty prompt and pins it with keep_alive."""
+        info = self._info(name)
+        if info["state"] == "warm":
+            return
+        info["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            response = await GGUFChat.client().post(
+                OLLAMA_URL, json={"model": name, "prompt": "", "stream": False, "keep_alive": KEEP_ALIVE}
+            )
+            response.raise_for_status()
+        except Exception:
+            info["state"] = "cold"
+            raise
+        info["state"] = "warm"
+        logger.info(f"Preloaded {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        await self.refresh_footprint()
+
+    def preload_background(self, name: str) -> asyncio.Task:
+        task = self._preloads.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(self._preload_quietly(name))
+            self._preloads[name] = task
+        return task
+
+    async def _preload_quietly(self, name: str):
+        try:
+            await self.preload(name)
+        except Exception as e:
+            logger.warning(f"Preload of {name} failed: {e}")
+
+    async def unload(self, name: str):
+        info = self._info(name)
+        info["state"] = "unloading"
+        try:
+            await GGUFChat.client().post(OLLAMA_URL, json={"model": name, "prompt": "", "stream": False, "keep_alive": 0})
+        except Exception as e:
+            logger.warning(f"Unload of {name} failed: {e}")
+        info.update(state="cold", size_mb=None, vram_mb=None)
+
+    async def refresh_footprint(self):
+        """Pulls resident sizes from Ollama's /api/ps; models missing from it are cold."""
+        try:
+            response = await GGUFChat.client().get(OLLAMA_PS_URL)
+            response.raise_for_status()
+            running = json_loads(response.content).get("models", [])
+        except Exception as e:
+            logger.debug(f"Footprint refresh failed: {e}")
+            return
+        resident = set()
+        for m in running:
+            name = m.get("name") or m.get("model")
+            resident.add(name)
+            info = self._info(name)
+            info.update(state="warm", size_mb=m.get("size", 0) // 2**20, vram_mb=m.get("size_vram", 0) // 2**20)
+        for name, info in self.models.items():
+            if name not in resident and info["state"] == "warm":
+                info.update(state="cold", size_mb=None, vram_mb=None)
+
+    async def hot_swap(self, name: str):
+        """Points new requests at `name` once it is warm, then drains and unloads the previous model."""
+        async with self._swap_lock:
+            if name == self.active:
+                return
+            self.swapping = True
+            previous = self.active
+            try:
+                pending = self._preloads.get(name)
+                if pending is not None and not pending.done():
+                    await pending
+                await self.preload(name)
+                self.active = name
+                self.swaps += 1
+                self.last_swap = time.monotonic()
+                logger.info(f"Active model: {previous} -> {name}")
+                await self.drain(previous)
+                await self.unload(previous)
+            finally:
+                self.swapping = False
+
+    def on_telemetry(self, state: Dict):
+        """Feeds a HardwareState snapshot; may start a preload or a swap in the background."""
+        self.telemetry = dict(state)
+        ram_free = state.get("ramFree")
+        if ram_free is None:
+            return
+        self.ram_free_mb = ram_free
+        if self._swap_task is not None and not self._swap_task.done():
+            return
+        if self.last_swap and time.monotonic() - self.last_swap < SWAP_COOLDOWN:
+            return
+        target = None
+        if self.active == self.primary:
+            if ram_free < LOW_RAM_MB:
+                target = self.fallback
+            elif ram_free < PRELOAD_RAM_MB and self._info(self.fallback)["state"] == "cold":
+                self.preload_background(self.fallback)
+        elif ram_free > RECOVER_RAM_MB:
+            target = self.primary
+        if target is not None:
+            logger.warning(f"Telemetry ramFree={ram_free}MB: swapping to {target}")
+            self._swap_task = asyncio.create_task(self._swap_quietly(target))
+
+    async def _swap_quietly(self, name: str):
+        try:
+            await self.hot_swap(name)
+        except Exception as e:
+            logger.error(f"Hot-swap to {name} failed: {e}")
+            # A failed attempt counts toward the cooldown too, so telemetry cannot retry it on every tick
+            self.last_swap = time.monotonic()
+
+    async def close(self):
+        tasks = [t for t in (self._swap_task, *self._preloads.values()) if t is not None and not t.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def status(self) -> Dict:
+        return {
+            "active": self.active,
+            "primary": self.primary,
+            "fallback": self.fallback,
+            "swapping": self.swapping,
+            "swaps": self.swaps,
+            "ram_free_mb": self.ram_free_mb,
+            "streams": dict(self._streams),
+            "models": {name: dict(info) for name, info in self.models.items()},
+        }
+
+model_manager = ModelManager()
+
+metrics.gauge("ncs_llm_active_streams", "Open backend generations per model", ("model",),
+              func=lambda: {(name,): n for name, n in model_manager.status()["streams"].items()})
+metrics.gauge("ncs_device_ram_free_mb", "Free device RAM from the last TELEMETRY message",
+              func=lambda: model_manager.telemetry.get("ramFree"))
+metrics.gauge("ncs_device_thermal_level", "Device thermal level from the last TELEMETRY message",
+              func=lambda: model_manager.telemetry.get("thermalLevel"))
 
 class GGUFChat:
+    _client: Optional[httpx.AsyncClient] = None
+    _stats = {"requests": 0, "tokens": 0, "frames": 0, "ttft_ms_total": 0.0, "decode_us_total": 0.0, "errors": 0,
+              "dedup_joins": 0}
+    _inflight: Dict[str, _Flight] = {}
+    response_cache: Optional[ResponseCache] = None
+    # monotonic time of the last request to Ollama; older than KEEPALIVE_EXPIRY means a cold pool
+    _last_io = 0.0
+
+    @classmethod
+    async def warm(cls):
+        """Opens the client and response cache and loads the active model into Ollama."""
+        with bootstrap.loading("llm"):
+            cls.client()
+            cls.responses()
+            await model_manager.preload(model_manager.active)
+
+    @classmethod
+    async def shutdown(cls):
+        await model_manager.close()
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
+        if cls.response_cache is not None:
+            cls.response_cache.close()
+            cls.response_cache = None
+
+    @classmethod
+    def client(cls) -> httpx.AsyncClient:
+        # Created on first use; building the TLS context is not free
+        if cls._client is None:
+            cls._client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+        return cls._client
+
+    @classmethod
+    async def prepare(cls):
+        """Re-opens a pooled connection to Ollama if the pool has probably gone idle.
+
+        Called while a prompt is still being assembled, so the TCP handshake
+        overlaps with memory recall instead of delaying the first token.
+        """
+        if time.monotonic() - cls._last_io < KEEPALIVE_EXPIRY / 2:
+            return
+        cls._last_io = time.monotonic()
+        await cls.client().get(OLLAMA_PS_URL)
+
+    @classmethod
+    def responses(cls) -> ResponseCache:
+        if cls.response_cache is None:
+            cls.response_cache = ResponseCache()
+        return cls.response_cache
+
+    @classmethod
+    def stats(cls) -> Dict[str, float]:
+        s = cls._stats
+        requests = max(s["requests"], 1)
+        tokens = max(s["tokens"], 1)
+        return {
+            "requests": s["requests"],
+            "tokens": s["tokens"],
+            "frames": s["frames"],
+            "errors": s["errors"],
+            "avg_ttft_ms": round(s["ttft_ms_total"] / requests, 2),
+            "avg_decode_us_per_token": round(s["decode_us_total"] / tokens, 2),
+            "json": json_loads.__module__,
+            "inflight": len(cls._inflight),
+            "dedup_joins": s["dedup_joins"],
+        }
+
+    @classmethod
+    def get_current_model(cls) -> str:
+        return model_manager.active
+
+    @classmethod
+    async def hot_swap(cls, name: str):
+        await model_manager.hot_swap(name)
+
     @staticmethod
-    async def stream_to_ws(ws, prompt: str):
-        payload = {
-            "model": MODEL_NAME,
+    def build_payload(prompt: str, options: Optional[Dict] = None) -> Dict:
+        return {
+            "model": model_manager.active,
+            "keep_alive": KEEP_ALIVE,
             "prompt": prompt,
             "stream": True,
             "options": {
                 "temperature": 0.7,
-                "num_predict": 4096
+                "num_predict": 4096,
+                **(options or {})
             }
         }
-        
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                async with client.stream("POST", OLLAMA_URL, json=payload) as response:
-                    async for line in response.aiter_lines():
-                        if not line: continue
-                        try:
-                            data = json.loads(line)
-                            token = data.get("response", "")
-                            if token:
-                                await ws.send_text(token)
-                            if data.get("done"):
-                                break
-                        except json.JSONDecodeError:
-                            continue
+
+    @staticmethod
+    def fingerprint(payload: Dict) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def request_key(cls, prompt: str, options: Optional[Dict] = None, origin: Optional[Dict] = None) -> str:
+        """Single-flight and response cache key.
+
+        `origin` describes how `prompt` was built (e.g. PendingPrompt.origin); when
+        given it replaces the prompt text, so requests built the same way share a key
+        whatever their assembly happened to produce.
+        """
+        payload = cls.build_payload(prompt, options)
+        if origin is not None:
+            payload["prompt"] = origin
+        return cls.fingerprint(payload)
+
+    @classmethod
+    def is_inflight(cls, prompt: str, options: Optional[Dict] = None, origin: Optional[Dict] = None) -> bool:
+        return cls.request_key(prompt, options, origin) in cls._inflight
+
+    @classmethod
+    async def stream_tokens(cls, prompt: str, options: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Private backend stream for this caller; see `subscribe` for the shared variant."""
+        async for token in cls._stream_payload(cls.build_payload(prompt, options)):
+            yield token
+
+    @classmethod
+    async def subscribe(cls, prompt: str, options: Optional[Dict] = None,
+                        origin: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Single-flight token stream.
+
+        Identical concurrent requests (same model, prompt or origin, and options)
+        share one backend generation; late joiners get the tokens emitted so far
+        replayed first. The backend stream is cancelled only when the last
+        subscriber leaves.
+        """
+        payload = cls.build_payload(prompt, options)
+        key = cls.request_key(prompt, options, origin)
+        flight = cls._inflight.get(key)
+        if flight is None:
+            flight = _Flight()
+            cls._inflight[key] = flight
+            flight.task = asyncio.create_task(cls._run_flight(key, flight, payload))
+        else:
+            cls._stats["dedup_joins"] += 1
+        flight.subscribers += 1
+        try:
+            async for token in flight.replay():
+                yield token
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+                if cls._inflight.get(key) is flight:
+                    del cls._inflight[key]
+
+    @classmethod
+    async def generate(cls, prompt: str, options: Optional[Dict] = None, cache: bool = False,
+                       origin: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Token stream for a chat turn: response cache first, then a single-flight generation.
+
+        Only deterministic requests (temperature 0) or ones with `cache=True` are
+        looked up and stored; a reply is cached only if it streamed to completion.
+        """
+        payload = cls.build_payload(prompt, options)
+        cacheable = cache or payload["options"].get("temperature") == 0
+        if cacheable:
+            key = cls.request_key(prompt, options, origin)
+            cached = await cls.responses().get(key)
+            if cached is not None:
+                for token in cached:
+                    yield token
+                return
+        collected: List[str] = []
+        async with aclosing(cls.subscribe(prompt, options, origin)) as tokens:
+            async for token in tokens:
+                if cacheable:
+                    collected.append(token)
+                yield token
+        if cacheable and collected:
+            await cls.responses().put(key, collected)
+
+    @classmethod
+    async def _run_flight(cls, key: str, flight: _Flight, payload: Dict):
+        try:
+            async for token in cls._stream_payload(payload):
+                flight.push(token)
+            flight.finish()
+        except asyncio.CancelledError:
+            flight.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            flight.finish(e)
+        finally:
+            # Finished flights are no longer joinable; new requests start fresh
+            if cls._inflight.get(key) is flight:
+                del cls._inflight[key]
+
+    @classmethod
+    async def _stream_payload(cls, payload: Dict) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        ttft_ms = None
+        tokens = 0
+        decode_s = 0.0
+        outcome = "error"
+        model_manager.stream_started(payload["model"])
+        try:
+            async with cls.client().stream("POST", OLLAMA_URL, json=payload) as response:
+                OLLAMA_CONNECT_SECONDS.observe(time.perf_counter() - started)
+                async for line in response.aiter_lines():
+                    if not line: continue
+                    t0 = time.perf_counter()
+                    try:
+                        data = json_loads(line)
+                    except ValueError:
+                        continue
+                    finally:
+                        decode_s += time.perf_counter() - t0
+                    token = data.get("response", "")
+                    if token:
+                        if ttft_ms is None:
+                            ttft_ms = (time.perf_counter() - started) * 1000
+                            LLM_TTFT_SECONDS.observe(ttft_ms / 1000)
+                            if bootstrap.engines.get("llm") != "ready":
+                                bootstrap.set_state("llm", "ready")
+                        tokens += 1
+                        yield token
+                    if data.get("done"):
+                        break
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            cls._last_io = time.monotonic()
+            model_manager.stream_finished(payload["model"])
+            LLM_STREAMS.inc(1, (outcome,))
+            LLM_TOKENS.inc(tokens, (payload["model"],))
+            s = cls._stats
+            s["requests"] += 1
+            s["tokens"] += tokens
+            s["ttft_ms_total"] += ttft_ms or 0.0
+            s["decode_us_total"] += decode_s * 1e6
+            if tokens:
+                logger.info(
+                    f"Stream done: ttft={ttft_ms:.1f}ms tokens={tokens} "
+                    f"decode={decode_s * 1e6 / tokens:.1f}us/token"
+                )
+
+    @classmethod
+    async def stream_to_ws(cls, ws, prompt: str, coalesce: Optional[Dict] = None,
+                           options: Optional[Dict] = None, cache: bool = False, origin: Optional[Dict] = None):
+        """Streams the reply to `ws`; `coalesce` holds TokenCoalescer options, None sends one frame per token."""
+        try:
+            async with aclosing(cls.generate(prompt, options, cache, origin)) as tokens:
+                if coalesce is not None:
+                    coalescer = TokenCoalescer(ws, **coalesce)
+                    try:
+                        await coalescer.run(tokens)
+                    finally:
+                        cls._stats["frames"] += coalescer.frames
+                else:
+                    async for token in tokens:
+                        sent = time.perf_counter()
+                        await ws.send_text(token)
+                        WS_SEND_SECONDS.observe(time.perf_counter() - sent, ("chat",))
+                        WS_FRAMES.inc(1, ("chat",))
+                        cls._stats["frames"] += 1
+        except WebSocketDisconnect:
+            raise
         except Exception as e:
+            cls._stats["errors"] += 1
             logger.error(f"GGUF Stream Error: {e}")
             await ws.send_text(f"NCS: Engine Error - {e}")
@@ -0,0 +1,110 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("NCS-Profiler")
+PROFILE_DIR = "runtime/profiles"
+DEFAULT_INTERVAL_MS = 10
+# A forgotten profiler stops itself after this long
+MAX_PROFILE_SECONDS = 300
+MAX_STACK_DEPTH = 64
+TOP_STACKS = 20
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler for the live service.
+
+    A daemon thread snapshots every thread's Python stack each `interval_ms`
+    and counts collapsed stacks ("thread;file:function;..."), so the cost is
+    paid only while it runs and nothing is hooked into the code being measured.
+    `stop()` writes the counts as a .folded file for flamegraph.pl/speedscope.
+    """
+
+    def __init__(self, profile_dir: str = PROFILE_DIR):
+        self.profile_dir = profile_dir
+        self.interval = DEFAULT_INTERVAL_MS / 1000
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval_ms: float = DEFAULT_INTERVAL_MS, max_seconds: float = MAX_PROFILE_SECONDS) -> bool:
+        """Starts sampling; returns False if a profile is already running."""
+        with self._lock:
+            if self.running:
+                return False
+            self.interval = max(float(interval_ms), 1.0) / 1000
+            self.samples = 0
+            self._stacks = Counter()
+            self._stop.clear()
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(
+                target=self._run, args=(max_seconds,), name="ncs-profiler", daemon=True
+            )
+            self._thread.start()
+        logger.info(f"Sampling profiler started ({self.interval * 1000:g}ms interval)")
+        return True
+
+    def _run(self, max_seconds: float):
+        own = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                logger.warning(f"Sampling profiler stopped after {max_seconds:g}s limit")
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack: List[str] = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> Dict:
+        """Stops sampling and writes the folded stacks; returns a summary with the top stacks."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return {"running": False, "samples": 0}
+            self._stop.set()
+            thread.join()
+        elapsed = time.monotonic() - self.started_at
+        stacks = self._stacks
+        path = None
+        if stacks:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        logger.info(f"Sampling profiler stopped: {self.samples} samples in {elapsed:.1f}s -> {path}")
+        return {
+            "running": False,
+            "samples": self.samples,
+            "seconds": round(elapsed, 2),
+            "path": path,
+            "top": [{"stack": s, "samples": n} for s, n in stacks.most_common(TOP_STACKS)],
+        }
+
+    def status(self) -> Dict:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+        }
+
+profiler = SamplingProfiler()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import math
+import re
+import time
+from typing import Dict, List, Optional
+
+from core.metrics import metrics, ROW_BUCKETS
+
+logger = logging.getLogger("NCS-Prompting")
+
+# Recall gets this long from prompt arrival; after that the bare prompt is sent
+RECALL_DEADLINE_MS = 60
+# Context added ahead of the prompt, in estimated tokens (~4 chars each for llama-style BPE)
+CONTEXT_TOKEN_BUDGET = 384
+CHARS_PER_TOKEN = 4
+RECALL_K = 12
+# Recall query: at most this many distinct content words from the prompt
+MAX_QUERY_TERMS = 8
+# Word-set Jaccard similarity at which two memories count as the same fact
+DEDUP_SIMILARITY = 0.8
+CONTEXT_HEADER = "Relevant memories about the user:"
+
+WORD = re.compile(r"[\w']+")
+STOPWORDS = frozenset("""
+a about after again all also am an and any are as at be because been before being but by can could did do
+does doing for from had has have having he her here him his how i if in into is it its just me more most my
+no not now of off on once only or other our out over own please same she should so some such tell than that
+the their them then there these they this those to too under until up very was we were what when where which
+while who whom why will with would you your yours
+""".split())
+
+RECALL_SECONDS = metrics.histogram("ncs_prompt_recall_seconds", "Memory recall time for prompt assembly")
+RECALL_OUTCOMES = metrics.counter("ncs_prompt_recall", "Prompt assembly recall outcomes", ("outcome",))
+CONTEXT_TOKENS = metrics.histogram(
+    "ncs_prompt_context_tokens", "Estimated tokens of recalled context added to a prompt", buckets=ROW_BUCKETS)
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def recall_query(prompt: str) -> str:
+    """Distinct content words of `prompt`, longest first, so recall does not match on filler words."""
+    words = []
+    seen = set()
+    for word in WORD.findall(prompt.lower()):
+        if len(word) < 3 or word in STOPWORDS or word in seen:
+            continue
+        seen.add(word)
+        words.append(word)
+    words.sort(key=len, reverse=True)
+    return " ".join(words[:MAX_QUERY_TERMS])
+
+def _words(text: str) -> frozenset:
+    return frozenset(WORD.findall(text.lower()))
+
+def pack_memories(results: List[Dict], budget: int, similarity: float = DEDUP_SIMILARITY) -> List[str]:
+    """Highest-scoring memories that fit in `budget` tokens, skipping near-duplicates of ones already taken."""
+    packed: List[str] = []
+    taken: List[frozenset] = []
+    used = 0
+    for result in sorted(results, key=lambda r: r.get("score", 0.0), reverse=True):
+        content = " ".join(result["content"].split())
+        if not content:
+            continue
+        words = _words(content)
+        if any(len(words & other) / max(len(words | other), 1) >= similarity for other in taken):
+            continue
+        cost = estimate_tokens(content) + 1
+        if used + cost > budget:
+            # A shorter, lower-ranked memory may still fit
+            continue
+        packed.append(content)
+        taken.append(words)
+        used += cost
+    return packed
+
+def render_prompt(prompt: str, memories: List[str]) -> str:
+    if not memories:
+        return prompt
+    lines = "\n".join(f"- {m}" for m in memories)
+    return f"{CONTEXT_HEADER}\n{lines}\n\n{prompt}"
+
+class PromptAssembler:
+    """Enriches chat prompts with recalled memories without holding up the first token.
+
+    `start()` is called the moment a prompt arrives and kicks off recall (and a
+    backend connection warm-up) in the background, so both overlap with
+    scheduler queueing. The returned PendingPrompt waits for recall only until
+    `deadline_ms` after arrival; a late, empty or failed recall falls back to
+    the bare prompt, which bounds what enrichment can add to TTFT.
+    """
+
+    def __init__(self, memory, deadline_ms: float = RECALL_DEADLINE_MS, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 k: int = RECALL_K, prepare=None):
+        self.memory = memory
+        self.deadline = deadline_ms / 1000
+        self.token_budget = token_budget
+        self.k = k
+        # Optional coroutine function run alongside recall, e.g. opening the backend connection
+        self.prepare = prepare
+
+    def start(self, prompt: str, token_budget: Optional[int] = None) -> "PendingPrompt":
+        return PendingPrompt(self, prompt, token_budget)
+
+    async def _recall(self, query: str) -> List[Dict]:
+        started = time.perf_counter()
+        try:
+            return await self.memory.search(query, self.k)
+        finally:
+            RECALL_SECONDS.observe(time.perf_counter() - started)
+
+class PendingPrompt:
+    """A prompt whose recall is in flight; await `prompt()` for the text to send.
+
+    `origin` (bare prompt, memory version, budget) is known up front and stands
+    in for the enriched text when deduplicating or caching generations: the
+    same question against the same memory state gets the same answer.
+    """
+
+    def __init__(self, assembler: PromptAssembler, prompt: str, token_budget: Optional[int] = None):
+        self.assembler = assembler
+        self.bare = prompt
+        self.token_budget = assembler.token_budget if token_budget is None else token_budget
+        self.origin = {"prompt": prompt, "memory": assembler.memory.version, "context_tokens": self.token_budget}
+        self.deadline = time.monotonic() + assembler.deadline
+        self._result: Optional[str] = None
+        query = recall_query(prompt)
+        self._recall = asyncio.create_task(assembler._recall(query)) if query else None
+        if self._recall is not None:
+            # Marks a failure as retrieved even if nobody ends up awaiting the recall
+            self._recall.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._prepare = asyncio.create_task(self._warm()) if assembler.prepare is not None else None
+
+    async def _warm(self):
+        try:
+            await self.assembler.prepare()
+        except Exception as e:
+            logger.debug(f"Backend warm-up failed: {e}")
+
+    async def prompt(self, token_budget: Optional[int] = None) -> str:
+        if self._result is not None:
+            return self._result
+        self._result = self.bare
+        if self._recall is None:
+            RECALL_OUTCOMES.inc(1, ("no_query",))
+            return self._result
+        if self._recall.cancelled():
+            return self._result
+        remaining = self.deadline - time.monotonic()
+        try:
+            results = await asyncio.wait_for(asyncio.shield(self._recall), max(remaining, 0))
+        except asyncio.TimeoutError:
+            RECALL_OUTCOMES.inc(1, ("timeout",))
+            self.cancel()
+            return self._result
+        except Exception as e:
+            RECALL_OUTCOMES.inc(1, ("error",))
+            logger.warning(f"Memory recall failed, sending bare prompt: {e}")
+            return self._result
+        budget = self.token_budget if token_budget is None else token_budget
+        memories = pack_memories(results, budget)
+        if not memories:
+            RECALL_OUTCOMES.inc(1, ("empty",))
+            return self._result
+        RECALL_OUTCOMES.inc(1, ("hit",))
+        CONTEXT_TOKENS.observe(sum(estimate_tokens(m) + 1 for m in memories))
+        self._result = render_prompt(self.bare, memories)
+        return self._result
+
+    def cancel(self):
+        """Stops a recall that is no longer wanted (deadline missed, client gone)."""
+        if self._recall is not None and not self._recall.done():
+            self._recall.cancel()
@@ -0,0 +1,105 @@
+import sqlite3
+import os
+import json
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("NCS-ResponseCache")
+CACHE_PATH = "runtime/cache/responses.db"
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+CACHE_TTL = 7 * 24 * 3600
+
+class ResponseCache:
+    """Disk-backed LRU of finished generations, stored as their token lists.
+
+    Keeping tokens (not joined text) lets a hit be replayed through the same
+    delivery path as a live stream, so clients see identical framing. Entries
+    expire after `ttl` seconds; least recently used ones are evicted once the
+    payload total passes `max_bytes`.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, ttl: float = CACHE_TTL):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                tokens BLOB,
+                size INTEGER,
+                created REAL,
+                last_used REAL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_sync(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT tokens, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._bytes -= row[1]
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put_sync(self, key: str, tokens: List[str]):
+        blob = json.dumps(tokens).encode()
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._bytes -= old[0]
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, tokens, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, len(blob), now, now)
+            )
+            self._bytes += len(blob)
+            while self._bytes > self.max_bytes:
+                victim = self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used LIMIT 1"
+                ).fetchone()
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (victim[0],))
+                self._bytes -= victim[1]
+                self.evictions += 1
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def put(self, key: str, tokens: List[str]):
+        await asyncio.to_thread(self.put_sync, key, tokens)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self._bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Set
+from core.metrics import metrics
+
+logger = logging.getLogger("NCS-Scheduler")
+
+# Lower runs first: live voice turns ahead of typed chat ahead of background agents
+PRIORITIES = {"voice": 0, "interactive": 1, "agent": 2}
+PRIORITY_NAMES = {v: k for k, v in PRIORITIES.items()}
+DEFAULT_PRIORITY = "interactive"
+# Concurrent backend generations; Ollama serializes beyond its own parallelism anyway
+MAX_ACTIVE_GENERATIONS = 4
+# Admission control: requests beyond this many waiters are rejected outright
+MAX_QUEUED_GENERATIONS = 64
+
+WAIT_SECONDS = metrics.histogram("ncs_scheduler_wait_seconds", "Time a generation queued for a slot", ("priority",))
+
+class SchedulerFull(Exception):
+    pass
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "session_id", "future")
+
+    def __init__(self, priority: int, seq: int, session_id: str, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.session_id = session_id
+        self.future = future
+
+class ChatScheduler:
+    """Bounded slot pool in front of GGUFChat generations.
+
+    Waiters are granted slots by priority, then by how many slots their session
+    already holds (so one chatty session cannot starve the rest), then FIFO.
+    Every task is tracked per session so `cancel(session_id)` stops exactly
+    that session's queued or running generations.
+    """
+
+    def __init__(self, max_active: int = MAX_ACTIVE_GENERATIONS, max_queued: int = MAX_QUEUED_GENERATIONS):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self._running = 0
+        self._active: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._tasks: Dict[str, Set[asyncio.Task]] = {}
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def submit(self, session_id: str, run: Callable[[], Awaitable[Any]],
+               priority: str = DEFAULT_PRIORITY, needs_slot: bool = True) -> asyncio.Task:
+        """Schedules `run()` under `session_id`; the returned task covers queueing and generation.
+
+        `needs_slot=False` only tracks the task for cancellation, for work that
+        does not start a backend generation of its own (e.g. joining one in flight).
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        if needs_slot and self._running >= self.max_active and len(self._waiters) >= self.max_queued:
+            self.rejected += 1
+            raise SchedulerFull(f"{len(self._waiters)} generations already queued")
+        task = asyncio.create_task(self._run(session_id, PRIORITIES[priority], run) if needs_slot else run())
+        tasks = self._tasks.setdefault(session_id, set())
+        tasks.add(task)
+        task.add_done_callback(lambda t: self._forget(session_id, t))
+        return task
+
+    def _forget(self, session_id: str, task: asyncio.Task):
+        tasks = self._tasks.get(session_id)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[session_id]
+
+    async def _run(self, session_id: str, priority: int, run: Callable[[], Awaitable[Any]]):
+        loop = asyncio.get_running_loop()
+        enqueued = loop.time()
+        await self._acquire(session_id, priority)
+        wait_ms = (loop.time() - enqueued) * 1000
+        self.admitted += 1
+        self.wait_ms_total += wait_ms
+        self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+        WAIT_SECONDS.observe(wait_ms / 1000, (PRIORITY_NAMES[priority],))
+        try:
+            return await run()
+        finally:
+            self._release(session_id)
+
+    async def _acquire(self, session_id: str, priority: int):
+        if self._running < self.max_active and not self._waiters:
+            self._take(session_id)
+            return
+        waiter = _Waiter(priority, next(self._seq), session_id, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just as we were cancelled; hand it on
+                self._release(session_id)
+            raise
+
+    def _take(self, session_id: str):
+        self._running += 1
+        self._active[session_id] = self._active.get(session_id, 0) + 1
+
+    def _release(self, session_id: str):
+        self._running -= 1
+        remaining = self._active.get(session_id, 1) - 1
+        if remaining:
+            self._active[session_id] = remaining
+        else:
+            self._active.pop(session_id, None)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._running < self.max_active and self._waiters:
+            waiter = min(self._waiters, key=lambda w: (w.priority, self._active.get(w.session_id, 0), w.seq))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                # Cancelled while queued; its task has not unwound yet but no longer wants the slot
+                continue
+            self._take(waiter.session_id)
+            waiter.future.set_result(None)
+
+    def cancel(self, session_id: str) -> int:
+        tasks = list(self._tasks.get(session_id, ()))
+        for task in tasks:
+            task.cancel()
+        self.cancelled += len(tasks)
+        return len(tasks)
+
+    def sessions(self) -> List[str]:
+        return list(self._tasks)
+
+    def queue_depth(self) -> Dict[str, int]:
+        queued = {name: 0 for name in PRIORITIES}
+        for w in self._waiters:
+            queued[PRIORITY_NAMES[w.priority]] += 1
+        return queued
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_slots": self._running,
+            "max_active": self.max_active,
+            "queued": self.queue_depth(),
+            "sessions": len(self._tasks),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "cancelled": self.cancelled,
+            "avg_wait_ms": round(self.wait_ms_total / self.admitted, 2) if self.admitted else 0.0,
+            "max_wait_ms": round(self.wait_ms_max, 2),
+        }
+
+chat_scheduler = ChatScheduler()
+
+metrics.gauge("ncs_scheduler_queue_depth", "Generations waiting for a slot", ("priority",),
+              func=lambda: {(name,): n for name, n in chat_scheduler.queue_depth().items()})
+metrics.gauge("ncs_scheduler_active_slots", "Generations holding a slot", func=lambda: chat_scheduler.stats()["active_slots"])
@@ -1,38 +1,214 @@
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.middleware.cors import CORSMiddleware
+from core.bootstrap import bootstrap, AcceptTimer
+with bootstrap.phase("import:fastapi"):
+    from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import PlainTextResponse
 import asyncio
 import logging
-from core.models import GGUFChat
-from core.voice import WhisperStreamer, PiperStreamer
+import os
+import time
+import uuid
+from typing import Optional
+from core.metrics import metrics
+from core.profiler import profiler, DEFAULT_INTERVAL_MS
+with bootstrap.phase("import:models"):
+    from core.models import GGUFChat, model_manager
+    from core.scheduler import chat_scheduler, SchedulerFull
+    from core.streaming import delivery_options, phrase_stream, WS_SEND_SECONDS, WS_FRAMES
+with bootstrap.phase("import:voice"):
+    from core.voice import WhisperStreamer, PiperStreamer
+with bootstrap.phase("import:memory"):
+    from core.memory import memory
+    from core.prompting import PromptAssembler
+with bootstrap.phase("import:tools"):
+    from core.tools import tool_stats, warm_workspace_index
 
-app = FastAPI(title="Nexus AI Core Service", version="1.0.0")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+logger = logging.getLogger("NCS-Server")
 
-# Initialize heavy dependencies lazily if needed
+with bootstrap.phase("init:app"):
+    app = FastAPI(title="Nexus AI Core Service", version="1.0.0")
+    app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    app.add_middleware(AcceptTimer)
+
+# Engines load on first use, or ahead of time via POST /warmup
 stt = WhisperStreamer(model_name="base")
 tts = PiperStreamer(model_path="runtime/voice.onnx")
+bootstrap.register("llm", GGUFChat.warm)
+bootstrap.register("stt", stt.warm)
+bootstrap.register("tts", tts.warm)
+bootstrap.register("memory", memory.warm)
+# Chat prompts are enriched with recalled memories; recall overlaps queueing and connection setup
+prompt_assembler = PromptAssembler(memory, prepare=GGUFChat.prepare)
+
+# Prometheus text exposition format
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+metrics.gauge("ncs_engine_ready", "1 once an engine has loaded", ("engine",),
+              func=lambda: {(name,): float(state == "ready") for name, state in bootstrap.engines.items()})
+metrics.gauge("ncs_tts_workers_busy", "Piper workers synthesizing", func=lambda: tts.pool.stats()["busy"])
+metrics.gauge("ncs_process_resident_memory_bytes", "Resident set size of the service", func=resident_bytes)
+
+def generation_options(params) -> dict:
+    """Sampling overrides from the /chat/stream query string (?temperature=0&num_predict=256)."""
+    options = {}
+    if "temperature" in params:
+        options["temperature"] = float(params["temperature"])
+    if "num_predict" in params:
+        options["num_predict"] = int(params["num_predict"])
+    return options
 
-active_chat_tasks = {}
+def context_budget(params) -> Optional[int]:
+    """Recalled-context token budget (?context_tokens=256); 0 (or ?memory=0) sends the bare prompt."""
+    if params.get("memory") in ("0", "false"):
+        return 0
+    if "context_tokens" in params:
+        return max(int(params["context_tokens"]), 0)
+    return None
+
+@app.on_event("startup")
+async def startup():
+    # The first workspace search should not pay for the initial index build
+    warm_workspace_index()
+    report = bootstrap.report()
+    phases = ", ".join(f"{name}={ms:.0f}ms" for name, ms in report["phases"].items())
+    logger.info(f"Cold start ready in {report['uptime_ms']:.0f}ms ({phases})")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await GGUFChat.shutdown()
+    await tts.close()
+    memory.close()
+    if profiler.running:
+        profiler.stop()
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "engine": "gguf-v3-ollama"}
+    return {
+        "status": "ok",
+        "engine": "gguf-v3-ollama",
+        "ready": bootstrap.engines,
+        "startup": bootstrap.report(),
+        "model": model_manager.status(),
+        "llm": GGUFChat.stats(),
+        "scheduler": chat_scheduler.stats(),
+        "response_cache": GGUFChat.response_cache.stats() if GGUFChat.response_cache else None,
+        "memory": memory.stats(),
+        "recall_cache": memory.manager.cache.stats() if memory.loaded and memory.manager.cache else None,
+        "tts": tts.stats(),
+        "tools": tool_stats(),
+        "profiler": profiler.status()
+    }
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.post("/warmup")
+async def warmup(engines: str = ""):
+    """Loads engines in the background (?engines=llm,stt; default all); poll /health for readiness."""
+    try:
+        started = bootstrap.warm_up(engines.split(",") if engines else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"warming": started, "ready": bootstrap.engines}
 
 @app.websocket("/chat/stream")
 async def chat_stream(ws: WebSocket):
     await ws.accept()
-    session_id = "active"
+    # Clients pass ?session_id= to address INTERRUPTs; otherwise one is assigned and announced
+    session_id = ws.query_params.get("session_id")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        await ws.send_text(f"[SESSION]: {session_id}")
+    task = None
+    pending = None
+    try:
+        coalesce = delivery_options(ws.query_params)
+        options = generation_options(ws.query_params)
+        cache = ws.query_params.get("cache") in ("1", "true")
+        priority = ws.query_params.get("priority", "interactive")
+        budget = context_budget(ws.query_params)
+        prompt = await ws.receive_text()
+        pending = prompt_assembler.start(prompt, budget) if budget != 0 else None
+        # Enriched prompts are deduplicated and cached by how they were built, not by their text
+        origin = pending.origin if pending else None
+
+        async def answer():
+            full_prompt = await pending.prompt() if pending else prompt
+            await GGUFChat.stream_to_ws(ws, full_prompt, coalesce, options, cache, origin)
+
+        # Joining an identical in-flight generation costs no backend slot
+        task = chat_scheduler.submit(
+            session_id, answer, priority, needs_slot=not GGUFChat.is_inflight(prompt, options, origin)
+        )
+        await task
+        await ws.send_text("[DONE]")
+    except WebSocketDisconnect:
+        pass
+    except asyncio.CancelledError:
+        if task is None or not task.cancelled():
+            raise
+        await ws.send_text("[INTERRUPTED]")
+    except SchedulerFull as e:
+        await ws.send_text(f"[BUSY]: {e}")
+    except ValueError as e:
+        await ws.send_text(f"[ERROR]: {e}")
+    finally:
+        if task is not None and not task.done():
+            task.cancel()
+        if pending is not None:
+            pending.cancel()
+
+@app.websocket("/voice/chat")
+async def voice_chat(ws: WebSocket):
+    """Prompt in, spoken reply out: LLM tokens are cut into phrases and synthesized as they arrive."""
+    await ws.accept()
+    session_id = ws.query_params.get("session_id")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        await ws.send_text(f"[SESSION]: {session_id}")
+    task = None
+    pending = None
     try:
+        options = generation_options(ws.query_params)
+        priority = ws.query_params.get("priority", "voice")
+        budget = context_budget(ws.query_params)
         prompt = await ws.receive_text()
-        task = asyncio.create_task(GGUFChat.stream_to_ws(ws, prompt))
-        active_chat_tasks[session_id] = task
+        pending = prompt_assembler.start(prompt, budget) if budget != 0 else None
+        origin = pending.origin if pending else None
+
+        async def answer():
+            full_prompt = await pending.prompt() if pending else prompt
+            await tts.speak(ws, phrase_stream(GGUFChat.generate(full_prompt, options, origin=origin)))
+
+        task = chat_scheduler.submit(
+            session_id, answer, priority, needs_slot=not GGUFChat.is_inflight(prompt, options, origin)
+        )
         await task
         await ws.send_text("[DONE]")
     except WebSocketDisconnect:
         pass
+    except asyncio.CancelledError:
+        if task is None or not task.cancelled():
+            raise
+        await ws.send_text("[INTERRUPTED]")
+    except SchedulerFull as e:
+        await ws.send_text(f"[BUSY]: {e}")
+    except Exception as e:
+        await ws.send_text(f"[ERROR]: {e}")
     finally:
-        active_chat_tasks.pop(session_id, None)
+        if task is not None and not task.done():
+            task.cancel()
+        if pending is not None:
+            pending.cancel()
 
 @app.websocket("/voice/stt")
 async def voice_stt(ws: WebSocket):
@@ -48,7 +224,10 @@ async def voice_tts(ws: WebSocket):
     await ws.accept()
     try:
         async for audio_chunk in tts.stream(ws):
+            sent = time.perf_counter()
             await ws.send_bytes(audio_chunk)
+            WS_SEND_SECONDS.observe(time.perf_counter() - sent, ("voice",))
+            WS_FRAMES.inc(1, ("voice",))
     except WebSocketDisconnect:
         pass
 
@@ -59,9 +238,25 @@ async def control_endpoint(ws: WebSocket):
         while True:
             msg = await ws.receive_json()
             if msg.get("signal") == "INTERRUPT":
-                task = active_chat_tasks.get("active")
-                if task:
-                    task.cancel()
+                session_id = msg.get("session_id")
+                sessions = chat_scheduler.sessions()
+                # Single-client setups may omit the id when there is nothing to confuse it with
+                if session_id is None and len(sessions) == 1:
+                    session_id = sessions[0]
+                if session_id is not None:
+                    chat_scheduler.cancel(session_id)
+            elif msg.get("type") == "TELEMETRY":
+                model_manager.on_telemetry(msg.get("state", {}))
+            elif msg.get("type") == "PROFILE":
+                # {"type": "PROFILE", "action": "start", "interval_ms": 10}, later {"type": "PROFILE", "action": "stop"}
+                if msg.get("action") == "start":
+                    started = profiler.start(float(msg.get("interval_ms", DEFAULT_INTERVAL_MS)))
+                    await ws.send_json({"type": "PROFILE", **profiler.status(), "started": started})
+                elif msg.get("action") == "stop":
+                    result = await asyncio.to_thread(profiler.stop)
+                    await ws.send_json({"type": "PROFILE", **result})
+                else:
+                    await ws.send_json({"type": "PROFILE", **profiler.status()})
     except WebSocketDisconnect:
         pass
 
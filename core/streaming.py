@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import re
+import time
+from typing import AsyncIterator, Dict, List, Optional
+from core.metrics import metrics
+
+logger = logging.getLogger("NCS-Streaming")
+
+# /chat/stream delivery modes: one frame per token, or time/byte coalesced frames
+DELIVERY_MODES = ("token", "coalesce")
+DEFAULT_WINDOW_MS = 20
+DEFAULT_MAX_BYTES = 1024
+# Upper bound the window may stretch to for a slow consumer
+MAX_WINDOW_MS = 250
+
+# Phrase chunking for speech: clause breaks only count past MIN_CLAUSE_CHARS so
+# TTS is not fed one-word fragments; nothing waits longer than PHRASE_MAX_LATENCY_MS
+MIN_CLAUSE_CHARS = 24
+MAX_PHRASE_CHARS = 180
+PHRASE_MAX_LATENCY_MS = 350
+CODE_FENCE = "```"
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s|\n")
+CLAUSE_END = re.compile(r"[,;:]\s|\s[-\u2013\u2014]\s")
+# Markdown that should not be read aloud
+UNSPOKEN = re.compile(r"[*_#`>|]+")
+
+# Shared by every WebSocket writer; `stream` is chat (LLM text) or voice (TTS audio)
+WS_SEND_SECONDS = metrics.histogram("ncs_ws_send_seconds", "Time spent awaiting WebSocket sends", ("stream",))
+WS_FRAMES = metrics.counter("ncs_ws_frames", "WebSocket frames sent", ("stream",))
+
+class TokenCoalescer:
+    """Delivers a token stream as fewer, larger WebSocket text frames.
+
+    The first token goes out immediately. After that, tokens collect for up to
+    `window_ms` or until `max_bytes` are buffered. Sends that take longer than the
+    current window (the client is draining slowly) double the window, up to
+    MAX_WINDOW_MS; fast sends shrink it back towards `window_ms`.
+    """
+
+    def __init__(self, ws, window_ms: int = DEFAULT_WINDOW_MS, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_window_ms: int = MAX_WINDOW_MS):
+        self.ws = ws
+        self.base_window = window_ms / 1000.0
+        self.max_window = max(max_window_ms, window_ms) / 1000.0
+        self.window = self.base_window
+        self.max_bytes = max_bytes
+        self.frames = 0
+        self.tokens = 0
+        self._buf: List[str] = []
+        self._bytes = 0
+        self._eof = False
+        self._wake = asyncio.Event()
+
+    async def _pump(self, tokens: AsyncIterator[str]):
+        try:
+            async for token in tokens:
+                self._buf.append(token)
+                self._bytes += len(token)
+                self.tokens += 1
+                # Wake the sender to open a window, or because the budget is full
+                if len(self._buf) == 1 or self._bytes >= self.max_bytes:
+                    self._wake.set()
+        finally:
+            self._eof = True
+            self._wake.set()
+
+    async def _flush(self):
+        text = "".join(self._buf)
+        self._buf.clear()
+        self._bytes = 0
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await self.ws.send_text(text)
+        elapsed = loop.time() - started
+        WS_SEND_SECONDS.observe(elapsed, ("chat",))
+        WS_FRAMES.inc(1, ("chat",))
+        self.frames += 1
+        if elapsed > self.window:
+            self.window = min(self.window * 2, self.max_window)
+        else:
+            self.window = max(self.base_window, self.window * 0.75)
+
+    async def run(self, tokens: AsyncIterator[str]):
+        loop = asyncio.get_running_loop()
+        pump = asyncio.create_task(self._pump(tokens))
+        try:
+            while True:
+                await self._wake.wait()
+                self._wake.clear()
+                if self._buf and self.frames:
+                    deadline = loop.time() + self.window
+                    while not self._eof and self._bytes < self.max_bytes:
+                        remaining = deadline - loop.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            await asyncio.wait_for(self._wake.wait(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                        self._wake.clear()
+                if self._buf:
+                    await self._flush()
+                if self._eof and not self._buf:
+                    break
+            # Surface backend errors raised inside the pump
+            await pump
+        finally:
+            if not pump.done():
+                pump.cancel()
+        logger.debug(f"Coalesced {self.tokens} tokens into {self.frames} frames")
+
+class PhraseChunker:
+    """Turns LLM tokens into speakable phrases for TTS.
+
+    Phrases end at sentence ends and newlines, or at clause punctuation once
+    MIN_CLAUSE_CHARS have built up. Text that has waited PHRASE_MAX_LATENCY_MS
+    without a boundary is flushed up to its last complete word. Fenced code
+    blocks are dropped and markdown symbols stripped.
+    """
+
+    def __init__(self, max_latency_ms: int = PHRASE_MAX_LATENCY_MS):
+        self.max_latency = max_latency_ms / 1000.0
+        self.in_code = False
+        self._raw = ""
+        self._phrase = ""
+        self._since: Optional[float] = None
+
+    def feed(self, token: str) -> List[str]:
+        self._raw += token
+        out: List[str] = []
+        while True:
+            fence = self._raw.find(CODE_FENCE)
+            if self.in_code:
+                if fence < 0:
+                    # Keep a possible partial fence, drop the code itself
+                    self._raw = self._raw[-(len(CODE_FENCE) - 1):]
+                    break
+                self._raw = self._raw[fence + len(CODE_FENCE):]
+                self.in_code = False
+                continue
+            if fence < 0:
+                held = len(self._raw) - len(self._raw.rstrip("`"))
+                self._append(self._raw[:len(self._raw) - held])
+                self._raw = self._raw[len(self._raw) - held:]
+                break
+            self._append(self._raw[:fence])
+            self._raw = self._raw[fence + len(CODE_FENCE):]
+            self.in_code = True
+            out += self._split()
+            out += self._cut(len(self._phrase))
+        return out + self._split()
+
+    def _append(self, text: str):
+        if text:
+            if self._since is None:
+                self._since = time.monotonic()
+            self._phrase += text
+
+    def _cut(self, at: int) -> List[str]:
+        phrase = " ".join(UNSPOKEN.sub(" ", self._phrase[:at]).split())
+        self._phrase = self._phrase[at:]
+        self._since = time.monotonic() if self._phrase.strip() else None
+        if not self._phrase.strip():
+            self._phrase = ""
+        return [phrase] if any(c.isalnum() for c in phrase) else []
+
+    def _split(self) -> List[str]:
+        out: List[str] = []
+        while self._phrase:
+            m = SENTENCE_END.search(self._phrase)
+            at = m.end() if m else None
+            if at is None:
+                for m in CLAUSE_END.finditer(self._phrase):
+                    if m.end() >= MIN_CLAUSE_CHARS:
+                        at = m.end()
+                        break
+            if at is None and len(self._phrase) >= MAX_PHRASE_CHARS:
+                at = self._phrase.rfind(" ", 0, MAX_PHRASE_CHARS) + 1 or MAX_PHRASE_CHARS
+            if at is None:
+                break
+            out += self._cut(at)
+        return out
+
+    def deadline(self) -> Optional[float]:
+        """Monotonic time at which buffered text is due for a latency flush, if any."""
+        return None if self._since is None else self._since + self.max_latency
+
+    def flush_due(self) -> List[str]:
+        deadline = self.deadline()
+        if deadline is None or time.monotonic() < deadline:
+            return []
+        # Only complete words; a trailing fragment waits for the rest of its token
+        at = self._phrase.rfind(" ") + 1
+        if at <= 0:
+            return []
+        return self._cut(at)
+
+    def flush(self) -> List[str]:
+        """End of stream: everything still buffered outside a code block."""
+        if not self.in_code:
+            self._append(self._raw)
+        self._raw = ""
+        return self._cut(len(self._phrase))
+
+async def phrase_stream(tokens: AsyncIterator[str], chunker: Optional[PhraseChunker] = None) -> AsyncIterator[str]:
+    """Yields phrases from `tokens` as they form, including latency flushes between tokens."""
+    chunker = chunker or PhraseChunker()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for token in tokens:
+                queue.put_nowait(token)
+        finally:
+            queue.put_nowait(None)
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            deadline = chunker.deadline()
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                token = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                for phrase in chunker.flush_due():
+                    yield phrase
+                continue
+            if token is None:
+                break
+            for phrase in chunker.feed(token):
+                yield phrase
+        # Surface backend errors raised inside the pump
+        await pump_task
+        for phrase in chunker.flush():
+            yield phrase
+    finally:
+        if not pump_task.done():
+            pump_task.cancel()
+
+def delivery_options(params) -> Optional[Dict]:
+    """Parses ?delivery=coalesce&window_ms=..&max_bytes=.. into TokenCoalescer kwargs (None = per token)."""
+    mode = params.get("delivery", "token")
+    if mode not in DELIVERY_MODES:
+        raise ValueError(f"Unknown delivery mode '{mode}'")
+    if mode == "token":
+        return None
+    return {
+        "window_ms": int(params.get("window_ms", DEFAULT_WINDOW_MS)),
+        "max_bytes": int(params.get("max_bytes", DEFAULT_MAX_BYTES)),
+    }
@@ -1,12 +1,29 @@
 
 from pydantic import BaseModel
-from typing import Callable, Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import asyncio
 import os
 import logging
 import json
+import re
+import shutil
+import tempfile
+import threading
+import time
+from core.metrics import metrics, CountingExecutor
+from core.workspace_index import WorkspaceIndex
 
 logger = logging.getLogger("NCS-Tools")
 
+# Blocking handlers run here, never on the event loop
+TOOL_WORKERS = 4
+DEFAULT_TOOL_TIMEOUT = 30.0
+# edit_file_patch streams the target in chunks of this size; memory stays bounded by it
+PATCH_CHUNK_BYTES = 1024 * 1024
+
+TOOL_SECONDS = metrics.histogram("ncs_tool_seconds", "Tool execution time, including time queued for a worker", ("tool",))
+TOOL_CALLS = metrics.counter("ncs_tool_calls", "Tool calls by outcome", ("tool", "outcome"))
+
 class ToolPermissions(BaseModel):
     read: bool = False
     write: bool = False
@@ -25,13 +42,43 @@ class ToolDefinition(BaseModel):
     side_effects: bool = True
     audit_level: str = "full"
 
+class TokenBucket:
+    """Allows `per_minute` calls per minute on average, with bursts up to the same number."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(per_minute, 1))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1.0:
+                return False
+            self.tokens -= 1.0
+            return True
+
+    def retry_after(self) -> float:
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
 TOOL_REGISTRY: Dict[str, Dict[str, Any]] = {}
 WORKSPACE_ROOT = os.path.abspath("runtime/workspace")
+_tool_pool = CountingExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="ncs-tools")
+metrics.gauge("ncs_tool_queue_depth", "Blocking tool calls waiting for a worker", func=lambda: _tool_pool.stats()["queued"])
 
 def register_tool(definition: ToolDefinition, handler: Callable):
     TOOL_REGISTRY[definition.name] = {
         "definition": definition,
-        "handler": handler
+        "handler": handler,
+        # Resolved once here rather than on every call
+        "required": tuple(p for p, val in definition.permissions.dict().items() if val),
+        "is_async": asyncio.iscoroutinefunction(handler),
+        "bucket": TokenBucket(definition.rate_limit.get("calls_per_minute", 10)),
+        "stats": {"calls": 0, "failures": 0, "timeouts": 0, "rate_limited": 0, "denied": 0, "total_ms": 0.0},
     }
     logger.info(f"Registered Tool v1.1: {definition.name}")
 
@@ -41,19 +88,117 @@ def safe_path(path: str) -> str:
         raise PermissionError(f"Access denied: Path escape detected.")
     return abs_path
 
+_workspace_index: Optional[WorkspaceIndex] = None
+_workspace_index_lock = threading.Lock()
+
+def get_workspace_index() -> WorkspaceIndex:
+    global _workspace_index
+    with _workspace_index_lock:
+        if _workspace_index is None:
+            _workspace_index = WorkspaceIndex(WORKSPACE_ROOT)
+        return _workspace_index
+
+def warm_workspace_index():
+    """Builds or catches up the workspace index in the background, e.g. at service startup."""
+    get_workspace_index().refresh_in_background()
+
+def _workspace_changed(path: str):
+    # Keep search results consistent with the agent's own edits without waiting for a rescan
+    if _workspace_index is not None:
+        _workspace_index.update_paths([os.path.relpath(path, WORKSPACE_ROOT).replace(os.sep, "/")])
+
 # --- New v1.1 Tools ---
 
+def apply_hunks(path: str, hunks: List[Tuple[bytes, bytes]], chunk_size: int = PATCH_CHUNK_BYTES,
+                dry_run: bool = False) -> List[int]:
+    """Applies every (search, replace) hunk to `path` in one streaming pass; returns match counts.
+
+    Matches are non-overlapping and leftmost-first across all hunks, like
+    str.replace applied to all of them at once. The scan keeps the last
+    (longest search - 1) bytes of each chunk for the next one, so matches
+    spanning chunk boundaries are found. Output goes to a temp file in the same
+    directory that replaces the original atomically; with no matches (or
+    `dry_run`) the file is left untouched.
+    """
+    pattern = re.compile(b"|".join(b"(" + re.escape(search) + b")" for search, _ in hunks))
+    keep = max(len(search) for search, _ in hunks) - 1
+    counts = [0] * len(hunks)
+    tmp_path = None
+    dst = None
+    try:
+        if not dry_run:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".patch-")
+            dst = os.fdopen(fd, "wb")
+        write = dst.write if dst is not None else (lambda data: None)
+        with open(path, "rb") as src:
+            carry = b""
+            while True:
+                chunk = src.read(chunk_size)
+                buf = carry + chunk
+                # A match starting before safe_end lies wholly inside buf
+                safe_end = len(buf) if not chunk else len(buf) - keep
+                pos = 0
+                for m in pattern.finditer(buf):
+                    if m.start() >= safe_end:
+                        break
+                    hunk = m.lastindex - 1
+                    write(buf[pos:m.start()])
+                    write(hunks[hunk][1])
+                    counts[hunk] += 1
+                    pos = m.end()
+                cut = max(pos, safe_end)
+                write(buf[pos:cut])
+                carry = buf[cut:]
+                if not chunk:
+                    break
+        if dst is not None:
+            dst.flush()
+            os.fsync(dst.fileno())
+            dst.close()
+            dst = None
+            if any(counts):
+                shutil.copymode(path, tmp_path)
+                os.replace(tmp_path, path)
+    finally:
+        if dst is not None:
+            dst.close()
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return counts
+
 def edit_file_patch(input_data: str) -> str:
-    """Simplified patch tool. Format: 'filename|search_str|replace_str'"""
+    """Search/replace patch tool.
+
+    Formats: 'filename|search_str|replace_str', or JSON
+    {"path": .., "hunks": [{"search": .., "replace": .., "expect": n}, ..]}
+    where the optional `expect` aborts the whole patch unless that hunk matches
+    exactly n times.
+    """
     try:
-        filename, search, replace = input_data.split('|', 2)
+        if input_data.lstrip().startswith("{"):
+            spec = json.loads(input_data)
+            filename = spec["path"]
+            hunks = spec["hunks"]
+        else:
+            filename, search, replace = input_data.split('|', 2)
+            hunks = [{"search": search, "replace": replace}]
+        if not hunks or any(not h["search"] for h in hunks):
+            return "Patch Error: every hunk needs a non-empty search string."
         path = safe_path(filename.strip())
-        with open(path, "r") as f:
-            content = f.read()
-        new_content = content.replace(search, replace)
-        with open(path, "w") as f:
-            f.write(new_content)
-        return f"Patch applied to {filename}."
+        expected = [h.get("expect") for h in hunks]
+        if any(e is not None for e in expected):
+            # Count first so a mismatch leaves the file untouched
+            counts = apply_hunks(path, [(h["search"].encode(), b"") for h in hunks], dry_run=True)
+            mismatched = [i for i, (c, e) in enumerate(zip(counts, expected)) if e is not None and c != e]
+            if mismatched:
+                detail = ", ".join(f"hunk {i + 1}: {counts[i]} matches (expected {expected[i]})" for i in mismatched)
+                return f"Patch Error: not applied to {filename}; {detail}."
+        counts = apply_hunks(path, [(h["search"].encode(), h["replace"].encode()) for h in hunks])
+        summary = ", ".join(f"hunk {i + 1}: {c} {'match' if c == 1 else 'matches'}" for i, c in enumerate(counts))
+        if not any(counts):
+            return f"Patch not applied to {filename}: no matches ({summary})."
+        _workspace_changed(path)
+        return f"Patch applied to {filename} ({summary})."
     except Exception as e:
         return f"Patch Error: {e}"
 
@@ -61,12 +206,80 @@ def delete_file(filename: str) -> str:
     path = safe_path(filename)
     if os.path.exists(path):
         os.remove(path)
+        _workspace_changed(path)
         return f"File {filename} deleted."
     return "File not found."
 
+def workspace_search(input_data: str) -> str:
+    """Indexed search over the workspace.
+
+    Input is a plain substring, or JSON {"query": .., "regex": false,
+    "case_sensitive": false, "path": "subdir", "max_results": 50}.
+    """
+    try:
+        if input_data.lstrip().startswith("{"):
+            spec = json.loads(input_data)
+        else:
+            spec = {"query": input_data}
+        query = spec.get("query", "")
+        if not query:
+            return "Search Error: empty query."
+        prefix = ""
+        if spec.get("path"):
+            prefix = os.path.relpath(safe_path(spec["path"]), WORKSPACE_ROOT).replace(os.sep, "/")
+            if prefix == ".":
+                prefix = ""
+        max_results = int(spec.get("max_results", 50))
+        index = get_workspace_index()
+        hits = index.search(query, bool(spec.get("regex")), bool(spec.get("case_sensitive")), prefix, max_results)
+        note = None if index.built.is_set() else "(workspace index still building; results may be incomplete)"
+        if not hits:
+            return f"No matches for '{query}'." + (f" {note}" if note else "")
+        lines = [f"{path}:{lineno}: {text}" for path, lineno, text in hits]
+        if len(hits) >= max_results:
+            lines.append(f"(stopped at {max_results} results)")
+        if note:
+            lines.append(note)
+        return "\n".join(lines)
+    except re.error as e:
+        return f"Search Error: invalid regex: {e}"
+    except Exception as e:
+        return f"Search Error: {e}"
+
+def _percentiles(summary: Dict[str, float]) -> str:
+    if not summary.get("count"):
+        return "n/a"
+    return "/".join(f"{summary[k] * 1000:.3g}ms" for k in ("p50", "p95"))
+
 def model_status(_: str) -> str:
-    # This would normally query the model manager
-    return "Model: Llama-3-8B | Quant: Q4_K_M | Temp: 42C"
+    """Live model, latency and load figures from the model manager and the metrics registry."""
+    from core.models import model_manager, LLM_TTFT_SECONDS, LLM_TOKENS
+    from core.scheduler import chat_scheduler
+    status = model_manager.status()
+    active = status["active"]
+    info = status["models"].get(active, {})
+    parts = [f"Model: {active} ({info.get('state', 'cold')})"]
+    if info.get("size_mb"):
+        parts.append(f"Size: {info['size_mb']:.0f}MB")
+    if status["swapping"]:
+        parts.append("Swapping")
+    ttft = LLM_TTFT_SECONDS.summary()
+    parts.append(f"TTFT p50/p95: {_percentiles(ttft)}")
+    parts.append(f"Tokens: {LLM_TOKENS.total():.0f}")
+    scheduler = chat_scheduler.stats()
+    parts.append(
+        f"Queue: {sum(scheduler['queued'].values())} ({scheduler['active_slots']}/{scheduler['max_active']} slots busy, "
+        f"{status['streams'].get(active, 0)} streams)"
+    )
+    search = metrics.get("ncs_memory_search_seconds")
+    if search is not None:
+        parts.append(f"Memory search p50/p95: {_percentiles(search.summary())}")
+    telemetry = model_manager.telemetry
+    if "thermalLevel" in telemetry:
+        parts.append(f"Thermal: {telemetry['thermalLevel']}")
+    if status["ram_free_mb"] is not None:
+        parts.append(f"RAM free: {status['ram_free_mb']:.0f}MB")
+    return " | ".join(parts)
 
 # Initialize Registry v1.1
 register_tool(
@@ -100,19 +313,103 @@ register_tool(
     model_status
 )
 
-async def execute_tool(name: str, input_data: str, user_perms: Dict[str, bool]) -> str:
+register_tool(
+    ToolDefinition(
+        name="workspace_search",
+        description="Substring or regex search across the workspace (trigram index)",
+        category="filesystem",
+        permissions=ToolPermissions(read=True),
+        rate_limit={"calls_per_minute": 60},
+        side_effects=False
+    ),
+    workspace_search
+)
+
+async def execute_tool(name: str, input_data: str, user_perms: Dict[str, bool],
+                       timeout: float = DEFAULT_TOOL_TIMEOUT) -> str:
     if name not in TOOL_REGISTRY:
         return f"Error: Tool '{name}' not found."
     
     tool = TOOL_REGISTRY[name]
-    required = tool["definition"].permissions
+    stats = tool["stats"]
     
     # Permission check
-    for p, val in required.dict().items():
-        if val and not user_perms.get(p, False):
+    for p in tool["required"]:
+        if not user_perms.get(p, False):
+            stats["denied"] += 1
+            TOOL_CALLS.inc(1, (name, "denied"))
             return f"Permission Denied: Missing '{p}' capability."
-            
+
+    bucket = tool["bucket"]
+    if not bucket.try_acquire():
+        stats["rate_limited"] += 1
+        TOOL_CALLS.inc(1, (name, "rate_limited"))
+        return f"Rate Limited: '{name}' allows {int(bucket.capacity)} calls per minute; retry in {bucket.retry_after():.1f}s."
+
+    stats["calls"] += 1
+    started = time.perf_counter()
+    # Stays "cancelled" if the awaiting task is cancelled mid-call
+    outcome = "cancelled"
     try:
-        return str(tool["handler"](input_data))
+        if tool["is_async"]:
+            result = await asyncio.wait_for(tool["handler"](input_data), timeout)
+        else:
+            loop = asyncio.get_running_loop()
+            # A timed-out thread cannot be killed; it finishes in the background and its result is dropped
+            result = await asyncio.wait_for(loop.run_in_executor(_tool_pool, tool["handler"], input_data), timeout)
+        outcome = "ok"
+        return str(result)
+    except asyncio.TimeoutError:
+        stats["timeouts"] += 1
+        outcome = "timeout"
+        return f"Tool Timeout: '{name}' exceeded {timeout:g}s."
     except Exception as e:
+        stats["failures"] += 1
+        outcome = "failure"
         return f"Tool Failure: {e}"
+    finally:
+        elapsed = time.perf_counter() - started
+        stats["total_ms"] += elapsed * 1000
+        TOOL_SECONDS.observe(elapsed, (name,))
+        TOOL_CALLS.inc(1, (name, outcome))
+
+def _is_pure(name: str) -> bool:
+    tool = TOOL_REGISTRY.get(name)
+    return tool is None or not tool["definition"].side_effects
+
+async def execute_tools(calls: List[Dict[str, str]], user_perms: Dict[str, bool],
+                        timeout: float = DEFAULT_TOOL_TIMEOUT) -> List[str]:
+    """Runs a batch of {"tool", "input"} calls and returns their results in order.
+
+    Consecutive side-effect-free calls run concurrently; a call with side
+    effects waits for everything before it and runs alone, so reads never race
+    writes from the same turn. Each call gets its own `timeout`; cancelling the
+    batch cancels whatever is still running.
+    """
+    results: List[Optional[str]] = [None] * len(calls)
+    i = 0
+    while i < len(calls):
+        if not _is_pure(calls[i]["tool"]):
+            results[i] = await execute_tool(calls[i]["tool"], calls[i].get("input", ""), user_perms, timeout)
+            i += 1
+            continue
+        j = i
+        while j < len(calls) and _is_pure(calls[j]["tool"]):
+            j += 1
+        group = await asyncio.gather(*(
+            execute_tool(c["tool"], c.get("input", ""), user_perms, timeout) for c in calls[i:j]
+        ))
+        results[i:j] = group
+        i = j
+    return results
+
+def tool_stats() -> Dict[str, Dict[str, float]]:
+    out = {}
+    for name, tool in TOOL_REGISTRY.items():
+        s = tool["stats"]
+        out[name] = {
+            **{k: v for k, v in s.items() if k != "total_ms"},
+            "avg_ms": round(s["total_ms"] / s["calls"], 2) if s["calls"] else 0.0,
+            "tokens_left": round(tool["bucket"].tokens, 2),
+        }
+    return out
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import unicodedata
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger("NCS-TTSCache")
+TTS_CACHE_DIR = "runtime/cache/tts"
+# Hot phrases kept as bytes in RAM; the rest live in one PCM file read through mmap
+MEMORY_MAX_BYTES = 16 * 1024 * 1024
+DISK_MAX_BYTES = 256 * 1024 * 1024
+# Clips larger than this (~20s of audio) are not worth caching
+MAX_ENTRY_BYTES = 1024 * 1024
+# Rewrite the PCM file once evicted clips make up this share of it
+COMPACT_RATIO = 0.5
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+class TTSCache:
+    """Content-addressed cache of synthesized PCM, keyed on text, voice model and params.
+
+    Two tiers: an in-memory LRU of recent clips, and an append-only `audio.pcm`
+    with an `index.jsonl` of (key, offset, length) records, read through mmap.
+    Disk entries beyond the byte cap are evicted least recently used first and
+    the file is compacted once enough of it is dead.
+    """
+
+    def __init__(self, cache_dir: str = TTS_CACHE_DIR, memory_bytes: int = MEMORY_MAX_BYTES,
+                 disk_bytes: int = DISK_MAX_BYTES):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.data_path = os.path.join(cache_dir, "audio.pcm")
+        self.index_path = os.path.join(cache_dir, "index.jsonl")
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_used = 0
+        # key -> (offset, length), least recently used first
+        self._index: "OrderedDict[str, tuple]" = OrderedDict()
+        self._disk_used = 0
+        self._map: Optional[mmap.mmap] = None
+        self._compacting = False
+        self._load_index()
+        self._data = open(self.data_path, "ab")
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, model_path: str, params: Optional[Dict] = None) -> str:
+        material = json.dumps([normalize_text(text), model_path, params or {}], sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _load_index(self):
+        size = os.path.getsize(self.data_path) if os.path.exists(self.data_path) else 0
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # torn final line after a crash
+                if rec.get("del"):
+                    entry = self._index.pop(rec["key"], None)
+                    if entry:
+                        self._disk_used -= entry[1]
+                elif rec["offset"] + rec["length"] <= size:
+                    old = self._index.pop(rec["key"], None)
+                    if old:
+                        self._disk_used -= old[1]
+                    self._index[rec["key"]] = (rec["offset"], rec["length"])
+                    self._disk_used += rec["length"]
+        logger.info(f"TTS cache: {len(self._index)} clips, {self._disk_used // 1024}KB on disk")
+
+    def _view(self, offset: int, length: int) -> bytes:
+        if self._map is None or offset + length > len(self._map):
+            if self._map is not None:
+                self._map.close()
+            self._data.flush()
+            with open(self.data_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            pcm = self._memory.get(key)
+            if pcm is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return pcm
+            entry = self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            pcm = self._view(*entry)
+            self.hits_disk += 1
+            self._remember(key, pcm)
+            return pcm
+
+    def _remember(self, key: str, pcm: bytes):
+        if key in self._memory:
+            return
+        self._memory[key] = pcm
+        self._memory_used += len(pcm)
+        while self._memory_used > self.memory_bytes:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= len(old)
+
+    def put_sync(self, key: str, pcm: bytes):
+        if not pcm or len(pcm) > MAX_ENTRY_BYTES:
+            return
+        with self._lock:
+            self._remember(key, pcm)
+            if key in self._index:
+                return
+            offset = self._data.tell()
+            self._data.write(pcm)
+            self._data.flush()
+            self._index[key] = (offset, len(pcm))
+            self._disk_used += len(pcm)
+            records = [{"key": key, "offset": offset, "length": len(pcm)}]
+            while self._disk_used > self.disk_bytes:
+                victim, (_, length) = self._index.popitem(last=False)
+                self._disk_used -= length
+                self.evictions += 1
+                records.append({"key": victim, "del": 1})
+            with open(self.index_path, "a") as f:
+                f.write("".join(json.dumps(r) + "\n" for r in records))
+            compact = (not self._compacting
+                       and offset + len(pcm) - self._disk_used > COMPACT_RATIO * (offset + len(pcm)))
+            self._compacting = self._compacting or compact
+        if compact:
+            self._compact()
+
+    async def put(self, key: str, pcm: bytes):
+        await asyncio.to_thread(self.put_sync, key, pcm)
+
+    @staticmethod
+    def _copy_clips(src, dst, entries, moved: Dict[str, int]):
+        for key, (offset, length) in entries:
+            src.seek(offset)
+            moved[key] = dst.tell()
+            dst.write(src.read(length))
+
+    def _compact(self):
+        """Copies live clips into a fresh PCM file in LRU order and rewrites the index.
+
+        The bulk copy runs without the lock, so lookups are never stuck behind
+        it; clips stored meanwhile are copied over under the lock before the swap.
+        """
+        started = time.perf_counter()
+        tmp_data, tmp_index = self.data_path + ".tmp", self.index_path + ".tmp"
+        try:
+            with self._lock:
+                self._data.flush()
+                live = list(self._index.items())
+            moved: Dict[str, int] = {}
+            with open(self.data_path, "rb") as src, open(tmp_data, "wb") as dst:
+                self._copy_clips(src, dst, live, moved)
+                with self._lock:
+                    if self._data.closed:
+                        return
+                    self._data.flush()
+                    # Keys are content hashes, so a clip copied earlier is still valid if re-stored
+                    self._copy_clips(src, dst, [(k, e) for k, e in self._index.items() if k not in moved], moved)
+                    dst.flush()
+                    index: "OrderedDict[str, tuple]" = OrderedDict(
+                        (key, (moved[key], length)) for key, (_, length) in self._index.items()
+                    )
+                    with open(tmp_index, "w") as idx:
+                        idx.write("".join(
+                            json.dumps({"key": key, "offset": offset, "length": length}) + "\n"
+                            for key, (offset, length) in index.items()
+                        ))
+                    if self._map is not None:
+                        self._map.close()
+                        self._map = None
+                    self._data.close()
+                    os.replace(tmp_data, self.data_path)
+                    os.replace(tmp_index, self.index_path)
+                    self._data = open(self.data_path, "ab")
+                    self._index = index
+        finally:
+            self._compacting = False
+        logger.info(f"TTS cache compacted to {self._disk_used // 1024}KB in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def stats(self) -> Dict[str, float]:
+        hits = self.hits_memory + self.hits_disk
+        lookups = hits + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._index),
+            "memory_bytes": self._memory_used,
+            "disk_bytes": self._disk_used,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._data.close()
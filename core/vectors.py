@@ -0,0 +1,265 @@
+import hashlib
+import os
+import re
+import logging
+import threading
+import numpy as np
+from typing import List, Tuple
+
+logger = logging.getLogger("NCS-Vectors")
+
+# Rows preallocated on first use; the matrix file doubles when full
+INITIAL_CAPACITY = 4096
+COMPACT_SLAB_ROWS = 65536
+# Tombstoned ids; node ids are 8 random bytes, so 0 never collides in practice
+TOMBSTONE = 0
+# Above this many rows, search prefilters on 1-bit sign codes and re-ranks exactly in float32
+CODE_SCAN_ROWS = 262144
+# Nearest rows by code distance that get an exact re-rank
+RERANK_ROWS = 16384
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def node_key(node_id: str) -> int:
+    """Packs a 16-hex-digit memory node id into the uint64 stored per matrix row."""
+    return int(node_id, 16)
+
+def node_id(key: int) -> str:
+    return f"{key:016x}"
+
+class Embedder:
+    """Local text embedder. Implementations return L2-normalized float32 rows."""
+    dim: int = 384
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class HashEmbedder(Embedder):
+    """Deterministic feature-hashing embedder (signed token + bigram buckets).
+
+    Needs no model weights, so it works offline and gives repeatable vectors in tests.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _bucket(self, feature: str) -> Tuple[int, float]:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+        return h % self.dim, (1.0 if (h >> 63) & 1 else -1.0)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = _TOKEN_RE.findall(text.lower())
+            features = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+            for feature in features:
+                idx, sign = self._bucket(feature)
+                out[i, idx] += sign
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+class VectorStore:
+    """Append-only float32 matrix in a memory-mapped file next to the SQLite DB.
+
+    `<base>.vec` holds one normalized row per node and `<base>.ids` the matching
+    uint64 node keys; the row count is the ids file length. Deletes only tombstone
+    the id, `compact()` rewrites both files without the dead rows.
+
+    Past CODE_SCAN_ROWS rows a full float32 scan no longer fits the latency budget,
+    so an in-memory copy of each row's sign bits (dim / 8 bytes per row) is kept
+    and searched by Hamming distance first; only the RERANK_ROWS closest rows are
+    scored exactly. That pass is approximate: a true neighbour whose sign pattern
+    is far from the query's can be missed.
+    """
+
+    def __init__(self, base_path: str, dim: int):
+        self.dim = dim
+        self.vec_path = base_path + ".vec"
+        self.ids_path = base_path + ".ids"
+        self._lock = threading.Lock()
+        self._dead = 0
+        self._words = (dim + 63) // 64
+        self._open()
+
+    def _open(self):
+        self.count = os.path.getsize(self.ids_path) // 8 if os.path.exists(self.ids_path) else 0
+        row_bytes = self.dim * 4
+        capacity = os.path.getsize(self.vec_path) // row_bytes if os.path.exists(self.vec_path) else 0
+        if capacity < max(self.count, 1):
+            self._resize(max(INITIAL_CAPACITY, self.count))
+        else:
+            self._map(capacity)
+        self._dead = int(np.count_nonzero(self._ids[:self.count] == TOMBSTONE)) if self.count else 0
+        # Rebuilt lazily: sorted keys for scoped search, sign codes once the store is large
+        self._sorted = None
+        self._codes = None
+        if self.count >= CODE_SCAN_ROWS:
+            self._build_codes()
+
+    def _pack(self, vectors: np.ndarray) -> np.ndarray:
+        """Sign bits of each row as `words` uint64s, column-major: shape (words, rows)."""
+        bits = np.packbits(vectors > 0, axis=1)
+        padded = np.zeros((len(vectors), self._words * 8), dtype=np.uint8)
+        padded[:, :bits.shape[1]] = bits
+        return padded.view(np.uint64).T
+
+    def _build_codes(self):
+        self._codes = np.zeros((self._words, self.capacity), dtype=np.uint64)
+        for start in range(0, self.count, COMPACT_SLAB_ROWS):
+            end = min(start + COMPACT_SLAB_ROWS, self.count)
+            self._codes[:, start:end] = self._pack(self._matrix[start:end])
+
+    def _map(self, capacity: int):
+        self.capacity = capacity
+        self._matrix = np.memmap(self.vec_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+        self._remap_ids()
+
+    def _resize(self, capacity: int):
+        with open(self.vec_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        if not os.path.exists(self.ids_path):
+            open(self.ids_path, "wb").close()
+        self._map(capacity)
+
+    def _remap_ids(self):
+        if self.count:
+            self._ids = np.memmap(self.ids_path, dtype=np.uint64, mode="r+", shape=(self.count,))
+        else:
+            self._ids = np.zeros(0, dtype=np.uint64)
+
+    def append(self, node_ids: List[str], vectors: np.ndarray):
+        if not node_ids:
+            return
+        keys = np.array([node_key(i) for i in node_ids], dtype=np.uint64)
+        with self._lock:
+            start, end = self.count, self.count + len(keys)
+            if end > self.capacity:
+                self._resize(max(end, self.capacity * 2))
+            # Rows first, ids last: a crash in between leaves rows that are never counted
+            self._matrix[start:end] = vectors
+            self._matrix.flush()
+            with open(self.ids_path, "ab") as f:
+                f.write(keys.tobytes())
+            self.count = end
+            self._remap_ids()
+            self._sorted = None
+            if self._codes is not None:
+                if self._codes.shape[1] < self.capacity:
+                    grown = np.zeros((self._words, self.capacity), dtype=np.uint64)
+                    grown[:, :start] = self._codes[:, :start]
+                    self._codes = grown
+                self._codes[:, start:end] = self._pack(vectors)
+            elif end >= CODE_SCAN_ROWS:
+                self._build_codes()
+
+    def delete(self, node_ids: List[str]):
+        if not node_ids or not self.count:
+            return
+        keys = np.array([node_key(i) for i in node_ids], dtype=np.uint64)
+        with self._lock:
+            hits = np.isin(self._ids, keys)
+            self._ids[hits] = TOMBSTONE
+            self._dead += int(np.count_nonzero(hits))
+
+    def live_keys(self) -> np.ndarray:
+        """uint64 keys of every row that is not tombstoned."""
+        with self._lock:
+            ids = np.array(self._ids[:self.count])
+        return ids[ids != TOMBSTONE]
+
+    @property
+    def live_count(self) -> int:
+        return self.count - self._dead
+
+    @property
+    def dead_ratio(self) -> float:
+        return self._dead / self.count if self.count else 0.0
+
+    def search(self, query: np.ndarray, k: int, among=None) -> List[Tuple[str, float]]:
+        """Top-k (node_id, cosine) pairs over the live rows, or only those of the `among` node ids.
+
+        `among` is scored exactly, row by row, so its cost follows its size.
+        """
+        query = query.astype(np.float32, copy=False)
+        if among is not None:
+            rows = self._rows_of(among)
+            with self._lock:
+                matrix, ids = self._matrix, self._ids
+            return self._top(rows, matrix[rows] @ query, ids, k)
+        with self._lock:
+            matrix, ids, count, dead, codes = self._matrix, self._ids, self.count, self._dead, self._codes
+        if count == 0 or k <= 0:
+            return []
+        if codes is not None and count > RERANK_ROWS:
+            # Hamming distance over the sign codes, one word column at a time to stay in cache
+            qcode = self._pack(query[None])[:, 0]
+            distance = np.bitwise_count(codes[0, :count] ^ qcode[0]).astype(np.uint16)
+            for w in range(1, self._words):
+                distance += np.bitwise_count(codes[w, :count] ^ qcode[w])
+            if dead:
+                distance[ids[:count] == TOMBSTONE] = np.iinfo(np.uint16).max
+            n = max(k, RERANK_ROWS)
+            rows = np.sort(np.argpartition(distance, n - 1)[:n])
+            return self._top(rows, matrix[rows] @ query, ids, k)
+        # One pass over the matrix; the scan is memory-bandwidth bound, so avoid extra copies of the scores
+        return self._top(None, matrix[:count] @ query, ids, k)
+
+    @staticmethod
+    def _top(rows, scores: np.ndarray, ids: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """Best k of `scores`, which belong to `rows` (or to rows 0..n when None); skips tombstones."""
+        keys = ids[:len(scores)] if rows is None else ids[rows]
+        scores[keys == TOMBSTONE] = -np.inf
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(node_id(int(keys[i])), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def _rows_of(self, node_ids) -> np.ndarray:
+        """Row numbers holding the live vectors of `node_ids`; unknown ids are skipped."""
+        keys = np.array([node_key(i) for i in node_ids], dtype=np.uint64)
+        with self._lock:
+            if self._sorted is None:
+                order = np.argsort(self._ids[:self.count])
+                self._sorted = (np.array(self._ids[:self.count])[order], order)
+            (sorted_keys, order), ids = self._sorted, self._ids
+        if not len(sorted_keys) or not len(keys):
+            return np.zeros(0, dtype=np.intp)
+        at = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        rows = order[at[sorted_keys[at] == keys]]
+        # Deletes tombstone in place without touching the sorted copy
+        return np.sort(rows[ids[rows] != TOMBSTONE])
+
+    def compact(self) -> int:
+        """Rewrites the matrix without tombstoned rows; returns the number of rows dropped."""
+        with self._lock:
+            if not self._dead:
+                return 0
+            live = self._ids[:self.count] != TOMBSTONE
+            n_live = int(np.count_nonzero(live))
+            capacity = max(INITIAL_CAPACITY, n_live)
+            tmp_vec, tmp_ids = self.vec_path + ".tmp", self.ids_path + ".tmp"
+            with open(tmp_vec, "wb") as f:
+                f.truncate(capacity * self.dim * 4)
+            new_matrix = np.memmap(tmp_vec, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            with open(tmp_ids, "wb") as f:
+                # Copy in slabs so compaction never pulls the whole matrix into RAM
+                out = 0
+                for start in range(0, self.count, COMPACT_SLAB_ROWS):
+                    end = min(start + COMPACT_SLAB_ROWS, self.count)
+                    keep = live[start:end]
+                    rows = self._matrix[start:end][keep]
+                    new_matrix[out:out + len(rows)] = rows
+                    f.write(np.ascontiguousarray(self._ids[start:end][keep]).tobytes())
+                    out += len(rows)
+            new_matrix.flush()
+            del new_matrix
+            dropped = self.count - n_live
+            del self._matrix, self._ids
+            os.replace(tmp_vec, self.vec_path)
+            os.replace(tmp_ids, self.ids_path)
+            self._open()
+        logger.info(f"Compacted vector store: dropped {dropped} rows, {n_live} live.")
+        return dropped
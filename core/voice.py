@@ -1,65 +1,560 @@
 
-from fastapi import WebSocket
+from fastapi import WebSocket, WebSocketDisconnect
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+import numpy as np
 import asyncio
-import subprocess
 import os
 import logging
+import threading
+import time
+from core.bootstrap import bootstrap
+from core.metrics import metrics, CountingExecutor, RTF_BUCKETS
+from core.streaming import WS_SEND_SECONDS, WS_FRAMES
+from core.tts_cache import TTSCache
 
 logger = logging.getLogger("NCS-Voice")
 
-# Optional: Load whisper if available locally
-try:
-    import whisper
-    STT_MODEL = whisper.load_model("base")
-except ImportError:
-    STT_MODEL = None
+# Incoming microphone audio: 16 kHz mono signed 16-bit PCM (what Whisper expects)
+SAMPLE_RATE = 16000
+# Longest utterance held per session; older audio is overwritten
+RING_SECONDS = 30
+# VAD frame size and RMS level (normalized float) above which a frame counts as speech
+FRAME_MS = 20
+VAD_RMS_THRESHOLD = 0.01
+# Audio kept from before speech onset so the first syllable is not clipped
+PREROLL_MS = 200
+# Trailing silence that ends an utterance and triggers the final transcript
+ENDPOINT_SILENCE_MS = 700
+# New speech between partial decodes, and how much recent audio a partial covers
+PARTIAL_STEP_MS = 800
+PARTIAL_WINDOW_SECONDS = 8
+# Whisper inference threads shared by all sessions
+STT_WORKERS = 2
+
+# Long-lived `piper --output_raw` processes; also the cap on concurrent syntheses
+PIPER_BIN = "piper"
+PIPER_WORKERS = 2
+# Voice settings shared with the python_runtime enclave; part of every TTS cache key
+PIPER_PARAMS = {"pitch": 1.0, "rate": 1.0, "emphasis": 0.75}
+# Audio goes out in frames of this many bytes (16-bit mono; ~93ms at 22.05 kHz)
+TTS_CHUNK_BYTES = 4096
+# Piper logs this to stderr after finishing each input line; it marks the end of an utterance
+PIPER_DONE_MARKER = "Real-time factor"
+# Wait for trailing stdout bytes after the marker, and the hard limit for one utterance
+PIPER_DRAIN_GRACE = 0.02
+PIPER_UTTERANCE_TIMEOUT = 30.0
+PIPER_HEALTH_INTERVAL = 5.0
+
+# Optional: whisper is imported and loaded on first use (torch alone takes seconds to import)
+_stt_models: Dict[str, object] = {}
+_stt_lock = threading.Lock()
+
+def load_stt_model(name: str = "base"):
+    """Loads Whisper model `name` once per process; None when whisper is not installed."""
+    with _stt_lock:
+        if name not in _stt_models:
+            try:
+                with bootstrap.loading("stt"):
+                    import whisper
+                    _stt_models[name] = whisper.load_model(name)
+            except ImportError:
+                _stt_models[name] = None
+        return _stt_models[name]
+
+_stt_pool = CountingExecutor(max_workers=STT_WORKERS, thread_name_prefix="nexus-stt")
+
+STT_DECODE_SECONDS = metrics.histogram("ncs_stt_decode_seconds", "Whisper decode time per partial or final pass")
+STT_DECODE_RTF = metrics.histogram(
+    "ncs_stt_decode_seconds_per_audio_second", "Whisper decode time divided by the audio duration decoded",
+    buckets=RTF_BUCKETS)
+metrics.gauge("ncs_stt_queue_depth", "Decodes waiting for a Whisper worker", func=lambda: _stt_pool.stats()["queued"])
+TTS_TTFA_SECONDS = metrics.histogram(
+    "ncs_tts_first_audio_seconds", "Time from phrase text to its first audio frame", ("source",))
+
+def pcm16_to_float(audio_bytes: bytes) -> np.ndarray:
+    """Converts raw little-endian int16 PCM to normalized float32 samples."""
+    usable = len(audio_bytes) - len(audio_bytes) % 2
+    return np.frombuffer(audio_bytes[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+class PCMRingBuffer:
+    """Fixed-capacity float32 sample buffer; writes past capacity overwrite the oldest audio."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._buf = np.zeros(capacity, dtype=np.float32)
+        self._pos = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def write(self, samples: np.ndarray):
+        n = len(samples)
+        if n >= self.capacity:
+            self._buf[:] = samples[-self.capacity:]
+            self._pos = 0
+            self._count = self.capacity
+            return
+        end = self._pos + n
+        if end <= self.capacity:
+            self._buf[self._pos:end] = samples
+        else:
+            split = self.capacity - self._pos
+            self._buf[self._pos:] = samples[:split]
+            self._buf[:n - split] = samples[split:]
+        self._pos = end % self.capacity
+        self._count = min(self._count + n, self.capacity)
+
+    def tail(self, n: int) -> np.ndarray:
+        """Copy of the most recent `n` samples, oldest first."""
+        n = min(n, self._count)
+        start = self._pos - n
+        if start >= 0:
+            return self._buf[start:self._pos].copy()
+        return np.concatenate((self._buf[start:], self._buf[:self._pos]))
+
+    def clear(self):
+        self._pos = 0
+        self._count = 0
+
+class SpeechSegmenter:
+    """Energy VAD over fixed frames that cuts the mic stream into utterances.
+
+    `feed` returns decode jobs: ("partial", audio) every PARTIAL_STEP_MS of new
+    audio while someone is speaking, covering at most PARTIAL_WINDOW_SECONDS,
+    and ("final", audio) with the whole utterance once ENDPOINT_SILENCE_MS of
+    silence follows it. Silence outside an utterance produces no jobs.
+    """
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.frame = sample_rate * FRAME_MS // 1000
+        self.preroll = sample_rate * PREROLL_MS // 1000
+        self.endpoint = sample_rate * ENDPOINT_SILENCE_MS // 1000
+        self.partial_step = sample_rate * PARTIAL_STEP_MS // 1000
+        self.partial_window = sample_rate * PARTIAL_WINDOW_SECONDS
+        self.ring = PCMRingBuffer(sample_rate * RING_SECONDS)
+        self._pending = np.zeros(0, dtype=np.float32)
+        self.in_speech = False
+        self.utterance = 0
+        self._length = 0
+        self._silence = 0
+        self._since_partial = 0
+
+    def feed(self, samples: np.ndarray) -> List[Tuple[str, np.ndarray]]:
+        if len(self._pending):
+            samples = np.concatenate((self._pending, samples))
+        usable = len(samples) - len(samples) % self.frame
+        self._pending = samples[usable:]
+        if not usable:
+            return []
+        frames = samples[:usable].reshape(-1, self.frame)
+        voiced = np.sqrt(np.mean(frames * frames, axis=1)) >= VAD_RMS_THRESHOLD
+        jobs = []
+        for frame, is_voiced in zip(frames, voiced):
+            self.ring.write(frame)
+            if not self.in_speech:
+                if not is_voiced:
+                    self._length = min(self._length + self.frame, self.preroll)
+                    continue
+                self.in_speech = True
+                self._silence = 0
+                self._since_partial = 0
+            self._length = min(self._length + self.frame, self.ring.capacity)
+            self._since_partial += self.frame
+            self._silence = 0 if is_voiced else self._silence + self.frame
+            if self._silence >= self.endpoint:
+                # Trailing endpoint silence is the newest audio; cut it off the end
+                jobs.append(("final", self.ring.tail(self._length)[:self._length - self._silence]))
+                self.in_speech = False
+                self.utterance += 1
+                self._length = 0
+            elif self._since_partial >= self.partial_step:
+                jobs.append(("partial", self.ring.tail(min(self._length, self.partial_window))))
+                self._since_partial = 0
+        return jobs
 
 class WhisperStreamer:
+    """Streaming Whisper STT over /voice/stt.
+
+    Audio stays in memory in a per-session ring buffer. Decodes run on a shared
+    bounded thread pool; each session keeps at most one partial in flight (newer
+    speech supersedes stale partials) and emits finals in utterance order.
+    Messages are "[PARTIAL]: text" and "[FINAL]: text".
+    """
+
     def __init__(self, model_name="base"):
-        self.model = STT_MODEL
+        self.model_name = model_name
+        self.model = None
+        self._loaded = False
+
+    async def warm(self):
+        if not self._loaded:
+            self.model = await asyncio.to_thread(load_stt_model, self.model_name)
+            self._loaded = True
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        started = time.perf_counter()
+        try:
+            result = self.model.transcribe(audio, fp16=False, condition_on_previous_text=False)
+        except Exception as e:
+            logger.error(f"STT Decode Error: {e}")
+            return ""
+        elapsed = time.perf_counter() - started
+        STT_DECODE_SECONDS.observe(elapsed)
+        if len(audio):
+            STT_DECODE_RTF.observe(elapsed * SAMPLE_RATE / len(audio))
+        return result.get("text", "").strip()
 
     async def stream(self, ws: WebSocket):
-        while True:
-            try:
-                # Receive raw PCM bytes from mobile microphone
-                audio_bytes = await ws.receive_bytes()
-                
-                if not self.model:
-                    yield "[Whisper not loaded on host]"
-                    continue
+        try:
+            await self.warm()
+        except Exception as e:
+            logger.error(f"STT Load Error: {e}")
+        if not self.model:
+            while True:
+                await ws.receive_bytes()
+                yield "[Whisper not loaded on host]"
+        loop = asyncio.get_running_loop()
+        segmenter = SpeechSegmenter()
+        out: asyncio.Queue = asyncio.Queue()
+        partial: Optional[asyncio.Task] = None
+        final: Optional[asyncio.Task] = None
+
+        async def decode_partial(audio: np.ndarray, utterance: int):
+            text = await loop.run_in_executor(_stt_pool, self._transcribe, audio)
+            # Drop partials that finished after their utterance was finalized
+            if text and utterance == segmenter.utterance:
+                out.put_nowait(f"[PARTIAL]: {text}")
 
-                # Temp file for Whisper (mobile optimization would use buffers)
-                with open("runtime/stt_chunk.wav", "wb") as f:
-                    f.write(audio_bytes)
-                
-                result = self.model.transcribe("runtime/stt_chunk.wav")
-                yield result.get("text", "")
+        async def decode_final(audio: np.ndarray, previous: Optional[asyncio.Task]):
+            text = await loop.run_in_executor(_stt_pool, self._transcribe, audio)
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            if text:
+                out.put_nowait(f"[FINAL]: {text}")
+
+        async def receive():
+            nonlocal partial, final
+            try:
+                while True:
+                    audio_bytes = await ws.receive_bytes()
+                    for kind, audio in segmenter.feed(pcm16_to_float(audio_bytes)):
+                        if kind == "final":
+                            final = asyncio.create_task(decode_final(audio, final))
+                        elif partial is None or partial.done():
+                            partial = asyncio.create_task(decode_partial(audio, segmenter.utterance))
+            except WebSocketDisconnect:
+                pass
             except Exception as e:
                 logger.error(f"STT Pipeline Error: {e}")
-                break
+            finally:
+                out.put_nowait(None)
+
+        receiver = asyncio.create_task(receive())
+        try:
+            while True:
+                message = await out.get()
+                if message is None:
+                    break
+                yield message
+        finally:
+            for task in (receiver, partial, final):
+                if task is not None and not task.done():
+                    task.cancel()
+
+class PiperWorker:
+    """One resident Piper process; text lines go in on stdin, raw PCM comes back on stdout."""
+
+    def __init__(self, binary: str, model_path: str, args: Sequence[str] = ()):
+        self.binary = binary
+        self.model_path = model_path
+        self.args = list(args)
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.busy = False
+        self.restarts = -1
+        self._markers: asyncio.Queue = asyncio.Queue()
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        await self.stop()
+        self._markers = asyncio.Queue()
+        self.proc = await asyncio.create_subprocess_exec(
+            self.binary, "--model", self.model_path, "--output_raw", *self.args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        self._stderr_task = asyncio.create_task(self._watch_stderr(self.proc, self._markers))
+        self.restarts += 1
+
+    async def stop(self):
+        if self._stderr_task is not None:
+            self._stderr_task.cancel()
+            self._stderr_task = None
+        if self.alive:
+            self.proc.kill()
+            await self.proc.wait()
+        self.proc = None
+
+    @staticmethod
+    async def _watch_stderr(proc: asyncio.subprocess.Process, markers: asyncio.Queue):
+        async for line in proc.stderr:
+            text = line.decode(errors="replace").strip()
+            if PIPER_DONE_MARKER in text:
+                markers.put_nowait(True)
+            elif text:
+                logger.debug(f"piper[{proc.pid}]: {text}")
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        """Yields stdout reads for one line of text until Piper reports the utterance done."""
+        self.proc.stdin.write(text.encode() + b"\n")
+        await self.proc.stdin.drain()
+        deadline = time.monotonic() + PIPER_UTTERANCE_TIMEOUT
+        marker = asyncio.ensure_future(self._markers.get())
+        read = asyncio.ensure_future(self.proc.stdout.read(TTS_CHUNK_BYTES))
+        try:
+            while not marker.done():
+                done, _ = await asyncio.wait(
+                    {read, marker}, timeout=deadline - time.monotonic(), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    raise TimeoutError(f"piper produced no end marker in {PIPER_UTTERANCE_TIMEOUT}s")
+                if read in done:
+                    data = read.result()
+                    if not data:
+                        raise RuntimeError(f"piper exited with code {self.proc.returncode}")
+                    yield data
+                    read = asyncio.ensure_future(self.proc.stdout.read(TTS_CHUNK_BYTES))
+            # stdout is flushed before the marker is logged; collect what is still in the pipe
+            while True:
+                try:
+                    data = await asyncio.wait_for(read, PIPER_DRAIN_GRACE)
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    break
+                yield data
+                read = asyncio.ensure_future(self.proc.stdout.read(TTS_CHUNK_BYTES))
+        finally:
+            for task in (read, marker):
+                if not task.done():
+                    task.cancel()
+
+class PiperPool:
+    """Fixed set of PiperWorkers handed out one utterance at a time.
+
+    At most `size` syntheses run at once; further requests wait for a free
+    worker. Dead workers are restarted when handed out and by a periodic health
+    check; a worker whose utterance fails or is abandoned midway is restarted
+    too, since its pipes may still hold audio for that utterance.
+    """
+
+    def __init__(self, model_path: str, binary: str = PIPER_BIN, size: int = PIPER_WORKERS,
+                 chunk_bytes: int = TTS_CHUNK_BYTES, args: Sequence[str] = ()):
+        self.model_path = model_path
+        self.binary = binary
+        self.args = list(args)
+        self.size = size
+        self.chunk_bytes = chunk_bytes
+        self.workers: List[PiperWorker] = []
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._health_task: Optional[asyncio.Task] = None
+        self._start_lock = asyncio.Lock()
+        self.utterances = 0
+        self.failures = 0
+        self.ttfa_ms_total = 0.0
+
+    async def start(self):
+        async with self._start_lock:
+            if self.workers:
+                return
+            workers = [PiperWorker(self.binary, self.model_path, self.args) for _ in range(self.size)]
+            try:
+                with bootstrap.loading("tts"):
+                    for worker in workers:
+                        await worker.start()
+            except BaseException:
+                for worker in workers:
+                    await worker.stop()
+                raise
+            for worker in workers:
+                self.workers.append(worker)
+                self._idle.put_nowait(worker)
+            self._health_task = asyncio.create_task(self._health_loop())
+            logger.info(f"Piper pool started: {self.size} workers ({self.model_path})")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(PIPER_HEALTH_INTERVAL)
+            for worker in self.workers:
+                if not worker.busy and not worker.alive:
+                    logger.warning("Piper worker died while idle; restarting")
+                    try:
+                        await worker.start()
+                    except Exception as e:
+                        logger.error(f"Piper restart failed: {e}")
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        """Streams PCM for `text` in `chunk_bytes` frames (the last one may be shorter)."""
+        text = " ".join(text.split())
+        if not text:
+            return
+        if not self.workers:
+            await self.start()
+        worker: PiperWorker = await self._idle.get()
+        worker.busy = True
+        started = time.perf_counter()
+        first = True
+        clean = False
+        buf = bytearray()
+        try:
+            if not worker.alive:
+                await worker.start()
+            async for data in worker.synthesize(text):
+                if first:
+                    self.ttfa_ms_total += (time.perf_counter() - started) * 1000
+                    first = False
+                buf += data
+                while len(buf) >= self.chunk_bytes:
+                    yield bytes(buf[:self.chunk_bytes])
+                    del buf[:self.chunk_bytes]
+            if buf:
+                yield bytes(buf[:len(buf) - len(buf) % 2])
+            clean = True
+            self.utterances += 1
+        finally:
+            if not clean:
+                self.failures += 1
+                try:
+                    await worker.start()
+                except Exception as e:
+                    logger.error(f"Piper restart failed: {e}")
+            worker.busy = False
+            self._idle.put_nowait(worker)
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for worker in self.workers:
+            await worker.stop()
+        self.workers.clear()
+        self._idle = asyncio.Queue()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "workers": len(self.workers),
+            "alive": sum(w.alive for w in self.workers),
+            "busy": sum(w.busy for w in self.workers),
+            "restarts": sum(max(w.restarts, 0) for w in self.workers),
+            "utterances": self.utterances,
+            "failures": self.failures,
+            "avg_ttfa_ms": round(self.ttfa_ms_total / self.utterances, 2) if self.utterances else 0.0,
+        }
 
 class PiperStreamer:
-    def __init__(self, model_path="voice.onnx"):
+    def __init__(self, model_path="voice.onnx", binary=PIPER_BIN, workers=PIPER_WORKERS,
+                 piper_params: Optional[Dict] = None, cache: bool = True):
         self.model_path = model_path
+        self.piper_params = dict(piper_params or PIPER_PARAMS)
+        # Piper's CLI only exposes speaking rate (as length_scale); pitch/emphasis just key the cache
+        rate = self.piper_params.get("rate", 1.0)
+        args = ["--length_scale", f"{1.0 / rate:.3f}"] if rate != 1.0 else []
+        self.pool = PiperPool(model_path, binary, workers, args=args)
+        self.use_cache = cache
+        self.cache: Optional[TTSCache] = None
+
+    async def warm(self):
+        self._cache()
+        await self.pool.start()
+
+    def _cache(self) -> Optional[TTSCache]:
+        # Opened on first use so importing the server touches no cache files
+        if self.use_cache and self.cache is None:
+            self.cache = TTSCache()
+        return self.cache
+
+    async def synthesize(self, text: str) -> AsyncIterator[bytes]:
+        """PCM frames for `text`: replayed from the TTS cache on a hit, else synthesized and stored."""
+        started = time.perf_counter()
+        first = True
+        cache = self._cache()
+        if cache is None:
+            async for audio_chunk in self.pool.synthesize(text):
+                if first:
+                    TTS_TTFA_SECONDS.observe(time.perf_counter() - started, ("piper",))
+                    first = False
+                yield audio_chunk
+            return
+        key = cache.key(text, self.model_path, self.piper_params)
+        pcm = cache.get(key)
+        if pcm is not None:
+            TTS_TTFA_SECONDS.observe(time.perf_counter() - started, ("cache",))
+            for i in range(0, len(pcm), self.pool.chunk_bytes):
+                yield pcm[i:i + self.pool.chunk_bytes]
+            return
+        collected = bytearray()
+        async for audio_chunk in self.pool.synthesize(text):
+            if first:
+                TTS_TTFA_SECONDS.observe(time.perf_counter() - started, ("piper",))
+                first = False
+            collected += audio_chunk
+            yield audio_chunk
+        await cache.put(key, bytes(collected))
+
+    def stats(self) -> Dict:
+        return {"pool": self.pool.stats(), "cache": self.cache.stats() if self.cache else None}
 
     async def stream(self, ws: WebSocket):
         while True:
             try:
                 # Receive text chunk from LLM token stream
                 text = await ws.receive_text()
-                
-                # Pipe to Piper binary
-                # piper --model <model> --output_raw
-                proc = subprocess.Popen(
-                    ["piper", "--model", self.model_path, "--output_raw"],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE
-                )
-                
-                audio_out, _ = proc.communicate(input=text.encode())
-                if audio_out:
-                    yield audio_out
+                async for audio_chunk in self.synthesize(text):
+                    yield audio_chunk
+            except WebSocketDisconnect:
+                raise
             except Exception as e:
                 logger.error(f"TTS Pipeline Error: {e}")
                 break
+
+    async def speak(self, ws: WebSocket, phrases: AsyncIterator[str]):
+        """Voices `phrases` while they are still being produced.
+
+        Each phrase is announced as "[PHRASE]: text" and followed by its PCM
+        frames; the phrase source keeps running while earlier phrases synthesize.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            try:
+                async for phrase in phrases:
+                    queue.put_nowait(phrase)
+            finally:
+                queue.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                phrase = await queue.get()
+                if phrase is None:
+                    break
+                await ws.send_text(f"[PHRASE]: {phrase}")
+                async for audio_chunk in self.synthesize(phrase):
+                    sent = time.perf_counter()
+                    await ws.send_bytes(audio_chunk)
+                    WS_SEND_SECONDS.observe(time.perf_counter() - sent, ("voice",))
+                    WS_FRAMES.inc(1, ("voice",))
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+
+    async def close(self):
+        await self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+            self.cache = None
@@ -0,0 +1,260 @@
+import sqlite3
+import os
+import re
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = logging.getLogger("NCS-WorkspaceIndex")
+INDEX_PATH = "runtime/cache/workspace_index.db"
+# Larger files and anything that looks binary are skipped
+MAX_INDEX_FILE_BYTES = 2 * 1024 * 1024
+BINARY_SNIFF_BYTES = 8192
+# Searches trigger a background mtime/size rescan at most this often
+REFRESH_INTERVAL = 2.0
+# Trigram tokenizer: shorter literals cannot narrow candidates
+MIN_LITERAL_LEN = 3
+REINDEX_BATCH = 500
+MAX_LINE_CHARS = 200
+
+def _match_expr(literals: List[str]) -> str:
+    """AND-query of quoted substrings; every candidate must contain all of them (case-insensitively)."""
+    return " AND ".join('"' + t.replace('"', '""') + '"' for t in literals)
+
+def required_literals(pattern: str, flags: int = 0) -> List[str]:
+    """Literal runs every match of `pattern` must contain, taken from its top-level sequence.
+
+    Anything inside alternation, optional or repeated parts is ignored, so the
+    result is conservative: a file lacking one of these literals cannot match.
+    """
+    literals: List[str] = []
+    run: List[str] = []
+    for op, arg in sre_parse.parse(pattern, flags):
+        if op is sre_parse.LITERAL:
+            run.append(chr(arg))
+            continue
+        if run:
+            literals.append("".join(run))
+            run = []
+    if run:
+        literals.append("".join(run))
+    return [lit for lit in literals if len(lit) >= MIN_LITERAL_LEN]
+
+class WorkspaceIndex:
+    """Persistent FTS5 trigram index over the text files under `root`.
+
+    `refresh()` walks the tree comparing each file's mtime and size with the
+    index and re-reads only new or changed files (deleted ones are dropped).
+    Searches kick that off in the background when the index is older than
+    REFRESH_INTERVAL, narrow candidates through the trigram index, then confirm
+    matches line by line against the indexed text, so no file is opened at
+    query time. Each searching thread reads through its own connection, so a
+    long scan never blocks indexing or other searches. Until the first refresh
+    completes (`built`), searches only see what has been indexed so far.
+    """
+
+    def __init__(self, root: str, path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.root = os.path.abspath(root)
+        self.path = path
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT UNIQUE,
+                mtime_ns INTEGER,
+                size INTEGER
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS file_text USING fts5(body, tokenize='trigram');
+        """)
+        self._conn.commit()
+        self.last_refresh = 0.0
+        self.files_indexed = 0
+        self.built = threading.Event()
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        skip = len(self.root) + 1
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                # Dot entries: VCS metadata, virtualenvs, in-progress patch temp files
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        found[entry.path[skip:].replace(os.sep, "/")] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+        return found
+
+    def _read_text(self, rel: str, size: int) -> Optional[str]:
+        if size > MAX_INDEX_FILE_BYTES:
+            return None
+        try:
+            with open(os.path.join(self.root, rel), "rb") as f:
+                data = f.read(MAX_INDEX_FILE_BYTES + 1)
+        except OSError:
+            return None
+        if b"\0" in data[:BINARY_SNIFF_BYTES]:
+            return None
+        return data.decode("utf-8", errors="replace")
+
+    def _index_batch(self, entries: List[Tuple[str, Optional[Tuple[int, int]]]]):
+        """Applies (path, (mtime_ns, size)) updates; a None stat drops the path from the index."""
+        with self._lock:
+            cur = self._conn.cursor()
+            for rel, stat in entries:
+                row = cur.execute("SELECT id FROM files WHERE path = ?", (rel,)).fetchone()
+                if row is not None:
+                    cur.execute("DELETE FROM file_text WHERE rowid = ?", row)
+                if stat is None:
+                    if row is not None:
+                        cur.execute("DELETE FROM files WHERE id = ?", row)
+                    continue
+                # Unindexable files are still recorded so they are not re-read every refresh
+                cur.execute(
+                    "INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?) "
+                    "ON CONFLICT(path) DO UPDATE SET mtime_ns = excluded.mtime_ns, size = excluded.size",
+                    (rel, stat[0], stat[1])
+                )
+                text = self._read_text(rel, stat[1])
+                if text is not None:
+                    fid = row[0] if row is not None else cur.lastrowid
+                    cur.execute("INSERT INTO file_text (rowid, body) VALUES (?, ?)", (fid, text))
+            self._conn.commit()
+
+    def refresh(self) -> Dict[str, int]:
+        """Re-indexes files whose mtime or size changed; returns counts of added/updated/removed.
+
+        The tree is scanned without holding the index lock and changes are
+        applied in batches, so searches keep being served during a long refresh.
+        """
+        with self._refresh_lock:
+            started = time.perf_counter()
+            on_disk = self._scan()
+            with self._lock:
+                known = {path: (mtime, size) for path, mtime, size in
+                         self._conn.execute("SELECT path, mtime_ns, size FROM files")}
+            changes: List[Tuple[str, Optional[Tuple[int, int]]]] = [(p, None) for p in known.keys() - on_disk.keys()]
+            removed = len(changes)
+            changes += [(p, stat) for p, stat in on_disk.items() if known.get(p) != stat]
+            for i in range(0, len(changes), REINDEX_BATCH):
+                self._index_batch(changes[i:i + REINDEX_BATCH])
+            self.last_refresh = time.monotonic()
+            self.files_indexed = len(on_disk)
+            self.built.set()
+            added = sum(1 for p, stat in changes if stat is not None and p not in known)
+            updated = len(changes) - removed - added
+            if changes:
+                logger.info(
+                    f"Workspace index: +{added} ~{updated} -{removed} "
+                    f"in {(time.perf_counter() - started) * 1000:.0f}ms"
+                )
+            return {"added": added, "updated": updated, "removed": removed}
+
+    def _refresh_quietly(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.error(f"Workspace index refresh failed: {e}")
+
+    def _maybe_refresh(self):
+        if self.last_refresh and time.monotonic() - self.last_refresh < REFRESH_INTERVAL:
+            return
+        self.refresh_in_background()
+
+    def refresh_in_background(self):
+        """Starts a refresh thread unless one is running; searches keep serving the current index."""
+        if self._refresh_lock.locked():
+            return
+        self.last_refresh = time.monotonic()
+        threading.Thread(target=self._refresh_quietly, name="ncs-workspace-index", daemon=True).start()
+
+    def update_paths(self, paths: List[str]):
+        """Re-indexes specific workspace-relative paths now, e.g. right after a tool edited them."""
+        entries = []
+        for rel in paths:
+            try:
+                st = os.stat(os.path.join(self.root, rel))
+                entries.append((rel, (st.st_mtime_ns, st.st_size)))
+            except FileNotFoundError:
+                entries.append((rel, None))
+        self._index_batch(entries)
+
+    def search(self, query: str, regex: bool = False, case_sensitive: bool = False,
+               prefix: str = "", max_results: int = 50) -> List[Tuple[str, int, str]]:
+        """(path, line number, line) hits for a substring or regex query, under the relative `prefix`."""
+        self._maybe_refresh()
+        flags = 0 if case_sensitive else re.IGNORECASE
+        if regex:
+            matcher = re.compile(query, flags)
+            literals = required_literals(query, flags)
+        else:
+            matcher = re.compile(re.escape(query), flags)
+            literals = [query] if len(query) >= MIN_LITERAL_LEN else []
+        sql = "SELECT f.path, t.body FROM file_text t JOIN files f ON f.id = t.rowid"
+        where, params = [], []
+        if literals:
+            where.append("file_text MATCH ?")
+            params.append(_match_expr(literals))
+        if prefix:
+            # Paths are case-sensitive; LIKE would fold ASCII case
+            where.append("instr(f.path, ?) = 1")
+            params.append(prefix.rstrip("/") + "/")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY f.path"
+        hits: List[Tuple[str, int, str]] = []
+        rows = self._reader().execute(sql, params)
+        try:
+            for path, body in rows:
+                if not matcher.search(body):
+                    continue
+                for lineno, line in enumerate(body.split("\n"), 1):
+                    if matcher.search(line):
+                        hits.append((path, lineno, line.strip()[:MAX_LINE_CHARS]))
+                        if len(hits) >= max_results:
+                            return hits
+        finally:
+            # Ends the read snapshot even when we stop early, so WAL checkpoints can proceed
+            rows.close()
+        return hits
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._lock:
+            self._conn.close()
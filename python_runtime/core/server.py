@@ -1,10 +1,15 @@
-
+# Runs with the repository root on sys.path: `core.*` below is the root service
+# package (scheduler, metrics, model manager), not the modules next to this file.
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 import asyncio
 import logging
 import json
-from core.models import GGUFChat
+import uuid
+from core.metrics import metrics
+from core.models import GGUFChat, model_manager
+from core.scheduler import chat_scheduler, SchedulerFull
 from core.voice import WhisperStreamer, PiperStreamer
 
 # Setup production logging
@@ -18,28 +23,37 @@ app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], all
 stt = WhisperStreamer(model_name="base")
 tts = PiperStreamer(model_path="voice.onnx")
 
-active_chat_tasks = {}
-
 @app.get("/health")
 def health():
     return {
         "status": "stable", 
         "engine": "llama-cpp-embedded",
-        "model": GGUFChat.get_current_model()
+        "model": GGUFChat.get_current_model(),
+        "models": model_manager.status(),
+        "scheduler": chat_scheduler.stats()
     }
 
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.websocket("/chat/stream")
 async def chat_stream(ws: WebSocket):
     await ws.accept()
-    session_id = "active"
+    # Clients pass ?session_id= to address INTERRUPTs; otherwise one is assigned and announced
+    session_id = ws.query_params.get("session_id")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        await ws.send_text(f"[SESSION]: {session_id}")
+    task = None
     try:
         # Prompt is expected as the first text message
         prompt = await ws.receive_text()
-        logger.info(f"Inference Request: {prompt[:50]}...")
+        logger.info(f"Inference Request [{session_id}]: {prompt[:50]}...")
         
         # Priority Queue for token delivery
-        task = asyncio.create_task(GGUFChat.stream_to_ws(ws, prompt))
-        active_chat_tasks[session_id] = task
+        priority = ws.query_params.get("priority", "interactive")
+        task = chat_scheduler.submit(session_id, lambda: GGUFChat.stream_to_ws(ws, prompt), priority)
         await task
         
         await ws.send_text("[DONE]")
@@ -47,11 +61,18 @@ async def chat_stream(ws: WebSocket):
         logger.info("Chat WS Disconnected")
     except asyncio.CancelledError:
         logger.warning("Inference Task Cancelled")
+        if task is None or not task.cancelled():
+            raise
+        await ws.send_text("[INTERRUPTED]")
+    except SchedulerFull as e:
+        logger.warning(f"Inference Rejected: {e}")
+        await ws.send_text(f"[BUSY]: {e}")
     except Exception as e:
         logger.error(f"Pipeline Failure: {e}")
         await ws.send_text(f"[ERROR]: Internal Neural Error - {str(e)}")
     finally:
-        active_chat_tasks.pop(session_id, None)
+        if task is not None and not task.done():
+            task.cancel()
 
 @app.websocket("/ws/control")
 async def control_endpoint(ws: WebSocket):
@@ -63,17 +84,17 @@ async def control_endpoint(ws: WebSocket):
             m_type = msg.get("type")
             
             if signal == "INTERRUPT":
-                task = active_chat_tasks.get("active")
-                if task:
-                    task.cancel()
-                    logger.info("Kernel signal received: INTERRUPT")
+                session_id = msg.get("session_id")
+                sessions = chat_scheduler.sessions()
+                # Single-client setups may omit the id when there is nothing to confuse it with
+                if session_id is None and len(sessions) == 1:
+                    session_id = sessions[0]
+                if session_id is not None and chat_scheduler.cancel(session_id):
+                    logger.info(f"Kernel signal received: INTERRUPT [{session_id}]")
             
             elif m_type == "TELEMETRY":
-                # Handle hardware-aware scaling
-                state = msg.get("state", {})
-                if state.get("ramFree", 8192) < 1000:
-                    logger.warning("Low RAM detected. Hot-swapping to Phi-3 Mini.")
-                    await GGUFChat.hot_swap("phi3-mini.gguf")
+                # Hardware-aware scaling; the manager applies hysteresis and swaps in the background
+                model_manager.on_telemetry(msg.get("state", {}))
     except WebSocketDisconnect:
         pass
 
@@ -0,0 +1,42 @@
+import os
+import sys
+
+# Tests import the service's `core` package from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socket
+import threading
+
+import pytest
+import uvicorn
+
+# bench.fake_ollama timing used by the generation tests: tokens echo the prompt's words
+FAKE_TOKENS = 20
+FAKE_TOKEN_MS = 10
+FAKE_TTFT_MS = 200
+
+@pytest.fixture
+def fake_ollama(monkeypatch):
+    """Runs bench.fake_ollama on a free port and points core.models at it."""
+    from bench.fake_ollama import build_app
+    import core.models as models
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(build_app(FAKE_TOKENS, FAKE_TOKEN_MS, FAKE_TTFT_MS),
+                                           host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        thread.join(0.01)
+    base = f"http://127.0.0.1:{port}"
+    monkeypatch.setattr(models, "OLLAMA_BASE", base)
+    monkeypatch.setattr(models, "OLLAMA_URL", f"{base}/api/generate")
+    monkeypatch.setattr(models, "OLLAMA_PS_URL", f"{base}/api/ps")
+    # The pooled client and in-flight table belong to the previous test's event loop
+    monkeypatch.setattr(models.GGUFChat, "_client", None)
+    monkeypatch.setattr(models.GGUFChat, "_inflight", {})
+    yield base
+    server.should_exit = True
+    thread.join()
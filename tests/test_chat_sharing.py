@@ -0,0 +1,62 @@
+from fastapi.testclient import TestClient
+
+import time
+
+import core.memory as memory
+import core.server as server
+from core.models import GGUFChat
+from core.response_cache import ResponseCache
+
+QUESTION = "which database should the new service use"
+
+def receive_reply(ws) -> str:
+    frames = []
+    while True:
+        frame = ws.receive_text()
+        if frame == "[DONE]":
+            return "".join(frames)
+        frames.append(frame)
+
+def backend_requests() -> int:
+    return GGUFChat.stats()["requests"]
+
+def test_enriched_prompts_share_flights_and_hit_the_response_cache(fake_ollama, tmp_path, monkeypatch):
+    manager = memory.MemoryManager(cache_bytes=0, db_path=str(tmp_path / "memory.db"))
+    manager.store_memory("the user's favourite database is postgres")
+    store = memory.AsyncMemory(manager)
+    monkeypatch.setattr(server, "memory", store)
+    monkeypatch.setattr(server.prompt_assembler, "memory", store)
+    monkeypatch.setattr(server, "warm_workspace_index", lambda: None)
+    # Recall must not miss its deadline on a slow test machine
+    monkeypatch.setattr(server.prompt_assembler, "deadline", 5.0)
+    monkeypatch.setattr(GGUFChat, "response_cache", ResponseCache(path=str(tmp_path / "responses.db")))
+    # A single slot: the second request only overlaps the first if it is admitted as a joiner
+    monkeypatch.setattr(server.chat_scheduler, "max_active", 1)
+    url = "/chat/stream?temperature=0&session_id="
+
+    with TestClient(server.app) as client:
+        before = backend_requests()
+        joins = GGUFChat.stats()["dedup_joins"]
+        with client.websocket_connect(url + "a") as first, client.websocket_connect(url + "b") as second:
+            first.send_text(QUESTION)
+            while not GGUFChat._inflight:
+                time.sleep(0.005)
+            second.send_text(QUESTION)
+            replies = [receive_reply(first), receive_reply(second)]
+        # Both were enriched the same way, so they shared one backend generation
+        assert replies[0] == replies[1] and replies[0].startswith("Relevant memories")
+        assert backend_requests() - before == 1
+        assert GGUFChat.stats()["dedup_joins"] - joins == 1
+
+        with client.websocket_connect(url + "c") as ws:
+            ws.send_text(QUESTION)
+            assert receive_reply(ws) == replies[0]
+        assert backend_requests() - before == 1
+        assert GGUFChat.response_cache.stats()["hits"] == 1
+
+        # New memories change what recall can return, so the cached reply no longer applies
+        manager.store_memory("the service now runs on sqlite")
+        with client.websocket_connect(url + "d") as ws:
+            ws.send_text(QUESTION)
+            receive_reply(ws)
+        assert backend_requests() - before == 2
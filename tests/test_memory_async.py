@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import pytest
+
+import core.memory as memory
+
+# Recursive count that keeps a reader busy for a noticeable while
+SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 3000000) SELECT COUNT(*) FROM c"
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "DB_PATH", str(tmp_path / "memory.db"))
+    m = memory.MemoryManager(cache_bytes=0)
+    yield m
+    m.close()
+
+def test_cancel_interrupts_running_query(manager):
+    facade = memory.AsyncMemory(manager, max_workers=1)
+
+    async def main():
+        started = threading.Event()
+
+        def slow(cancel):
+            started.set()
+            return manager._reader().execute(SLOW_QUERY).fetchone()[0]
+
+        task = asyncio.create_task(facade._submit(slow))
+        await asyncio.to_thread(started.wait)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    facade.close()
+    assert facade.stats()["cancelled"] == 1
+
+def test_late_cancel_does_not_interrupt_the_next_job_on_that_worker(manager):
+    facade = memory.AsyncMemory(manager, max_workers=1)
+
+    async def main():
+        finished = threading.Event()
+        next_started = threading.Event()
+
+        def quick(cancel):
+            finished.set()
+            return 1
+
+        def slow():
+            next_started.set()
+            return manager._reader().execute(SLOW_QUERY).fetchone()[0]
+
+        task = asyncio.create_task(facade._submit(quick))
+        await asyncio.sleep(0)
+        # Block the loop so the first job's result is not delivered before the cancel
+        finished.wait()
+        follower = facade._executor.submit(slow)
+        next_started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await asyncio.wrap_future(follower)
+
+    assert asyncio.run(main()) == 3000000
+    facade.close()
@@ -0,0 +1,197 @@
+import importlib.util
+import os
+import sqlite3
+
+import pytest
+
+import core.memory as memory
+
+RUNTIME_MEMORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              "python_runtime", "core", "memory.py")
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "DB_PATH", str(tmp_path / "memory.db"))
+    m = memory.MemoryManager(cache_bytes=0)
+    yield m
+    m.close()
+
+@pytest.fixture
+def runtime_manager(tmp_path, monkeypatch):
+    # The enclave copy opens its module-level manager at import, relative to the cwd
+    monkeypatch.chdir(tmp_path)
+    spec = importlib.util.spec_from_file_location("enclave_memory", RUNTIME_MEMORY)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module.memory_system
+    module.memory_system.close()
+
+def contents(results):
+    return [r["content"] for r in results]
+
+def rows_scanned() -> float:
+    return memory.ROWS_SCANNED.summary(("keyword",)).get("sum", 0.0)
+
+def test_short_terms_only_score_rows_found_by_key_terms(manager):
+    assert manager.fts_enabled
+    manager.store_memories([
+        {"content": "ai research notes"},
+        {"content": "database migration plan"},
+        {"content": "ai database tuning"},
+    ])
+    found = contents(manager.search_memory("ai database", k=5))
+    assert found == ["ai database tuning", "database migration plan"]
+
+def test_query_of_short_and_stop_words_scans_nothing(manager):
+    manager.store_memories([{"content": "ai is what it is"}])
+    before = rows_scanned()
+    assert manager.search_memory("what is it my ai", k=5) == []
+    assert rows_scanned() == before
+
+def test_natural_language_query_scans_only_matching_rows(manager):
+    manager.store_memories([{"content": f"note {i}: this is my list of errands"} for i in range(300)])
+    manager.store_memories([{"content": "my favourite database is postgres"}])
+    before = rows_scanned()
+    found = contents(manager.search_memory("what is my favourite database", k=5))
+    assert found == ["my favourite database is postgres"]
+    assert rows_scanned() - before == 1
+
+def test_scoped_recall_needs_a_key_term(manager):
+    manager.store_memories([
+        {"content": "database notes", "type": "project"},
+        {"content": "ai art prompts", "type": "project"},
+        {"content": "database art", "type": "fact"},
+    ])
+    found = contents(manager.search_memory("ai database", k=5, types=["project"]))
+    assert found == ["database notes"]
+
+def test_non_ascii_terms_match_case_insensitively(manager):
+    manager.store_memories([{"content": "Ég heiti Nexus"}, {"content": "Ægir Straumur"}])
+    assert contents(manager.search_memory("ég nexus", k=5)) == ["Ég heiti Nexus"]
+    assert contents(manager.search_memory("ægir", k=5)) == ["Ægir Straumur"]
+
+def test_more_matching_terms_rank_first(manager):
+    manager.store_memories([
+        {"content": "ai database tuning"},
+        {"content": "database backup schedule"},
+    ])
+    assert contents(manager.search_memory("ai database", k=5))[0] == "ai database tuning"
+
+def test_query_without_matches_returns_nothing(manager):
+    manager.store_memories([{"content": "grocery list"}])
+    assert manager.search_memory("quantum", k=5) == []
+
+def test_enclave_recall_is_text_formatted(runtime_manager):
+    runtime_manager.store_memories([{"content": "ai research notes"}, {"content": "grocery list"}])
+    assert runtime_manager.search_memory("research database") == "- ai research notes"
+
+def test_manager_creates_its_database_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "DB_PATH", str(tmp_path / "fresh" / "memory" / "memory.db"))
+    m = memory.MemoryManager(cache_bytes=0)
+    m.close()
+    assert (tmp_path / "fresh" / "memory" / "memory.db").exists()
+
+def test_enclave_uses_the_service_store_with_its_own_file(runtime_manager, tmp_path):
+    assert isinstance(runtime_manager, memory.MemoryManager)
+    assert (tmp_path / "runtime" / "memory" / "nexus_enclave.db").exists()
+    assert runtime_manager.usage_weight == 0.15
+
+# Schema of databases created before v3: FTS keyed on the implicit rowid
+V2_SCHEMA = """
+    CREATE TABLE memory_nodes (
+        id TEXT PRIMARY KEY, type TEXT, content TEXT, timestamp INTEGER, last_accessed INTEGER,
+        importance INTEGER DEFAULT 1, usage_count INTEGER DEFAULT 0, base_confidence REAL DEFAULT 1.0, tags TEXT
+    );
+    CREATE VIRTUAL TABLE memory_fts USING fts5(content, content='memory_nodes', content_rowid='rowid', tokenize='trigram');
+    CREATE TRIGGER memory_nodes_ai AFTER INSERT ON memory_nodes BEGIN
+        INSERT INTO memory_fts(rowid, content) VALUES (new.rowid, new.content);
+    END;
+    CREATE TRIGGER memory_nodes_ad AFTER DELETE ON memory_nodes BEGIN
+        INSERT INTO memory_fts(memory_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+    END;
+    PRAGMA user_version = 2;
+"""
+
+def test_recall_survives_vacuum(manager):
+    ids = manager.store_memories([{"content": f"filler row {i}"} for i in range(5)])
+    manager.store_memories([{"content": "postgres tuning notes"}])
+    with manager._write_lock, manager._writer:
+        manager._writer.executemany("DELETE FROM memory_nodes WHERE id = ?", [(i,) for i in ids])
+    manager._writer.execute("VACUUM")
+    assert contents(manager.search_memory("postgres", k=5)) == ["postgres tuning notes"]
+
+def test_v2_database_is_rekeyed_and_reindexed(tmp_path, monkeypatch):
+    path = str(tmp_path / "memory.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(V2_SCHEMA)
+    conn.executemany("INSERT INTO memory_nodes (id, type, content, timestamp, last_accessed, tags) "
+                     "VALUES (?, 'fact', ?, strftime('%s'), strftime('%s'), '')",
+                     [(f"{i:016x}", f"filler row {i}") for i in range(1, 6)] + [("00000000000000ff", "postgres notes")])
+    conn.execute("DELETE FROM memory_nodes WHERE content LIKE 'filler%'")
+    # Renumber the implicit rowids behind the FTS index's back, as VACUUM or a dump/restore may
+    conn.executescript("""
+        DROP TRIGGER memory_nodes_ai;
+        DROP TRIGGER memory_nodes_ad;
+        CREATE TEMP TABLE copy AS SELECT * FROM memory_nodes;
+        DELETE FROM memory_nodes;
+        INSERT INTO memory_nodes SELECT * FROM copy;
+    """)
+    assert conn.execute("SELECT rowid FROM memory_nodes").fetchall() == [(1,)]
+    conn.close()
+
+    monkeypatch.setattr(memory, "DB_PATH", path)
+    m = memory.MemoryManager(cache_bytes=0)
+    columns = [c[1] for c in m._writer.execute("PRAGMA table_info(memory_nodes)")]
+    found = contents(m.search_memory("postgres", k=5))
+    m.close()
+    assert found == ["postgres notes"]
+    assert columns[0] == "seq"
+
+def test_recall_cache_keys_scopes_like_the_query_does(tmp_path):
+    m = memory.MemoryManager(db_path=str(tmp_path / "cached.db"))
+    m.store_memories([{"content": "alpha planning note", "type": "task", "tags": "Work"}])
+    assert contents(m.search_memory("alpha planning", types="task")) == ["alpha planning note"]
+    # A string type is one type, not a set of characters
+    assert m.search_memory("alpha planning", types=["k", "s", "a", "t"]) == []
+    m.close()
+
+    key = memory.RecallCache.key
+    assert key("alpha", 5, "keyword", tags="Work, home") == key("alpha", 5, "keyword", tags=["home", "work"])
+    assert key("alpha", 5, "keyword", types="task") == key("alpha", 5, "keyword", types=["task"])
+
+def store_scoped_corpus(manager):
+    manager.store_memories(
+        [{"content": f"general note {i} about deployment", "type": "fact"} for i in range(40)]
+        + [{"content": f"deployment runbook step {i}", "type": "project", "tags": "ops"} for i in range(6)]
+        + [{"content": "release checklist", "type": "project", "tags": "ops"},
+           {"content": "deployment freeze dates", "type": "preference", "tags": "Ops, calendar"},
+           {"content": "deployment retro", "type": "project", "tags": "team"}]
+    )
+
+def test_small_scope_is_read_from_the_indexes_and_large_scope_through_fts(manager, monkeypatch):
+    store_scoped_corpus(manager)
+    before = rows_scanned()
+    small = contents(manager.search_memory("deployment", k=20, types=["project"]))
+    # Every project node was read, including the one without the term
+    assert rows_scanned() - before == 8
+
+    monkeypatch.setattr(memory, "SCOPE_SCAN_LIMIT", 5)
+    before = rows_scanned()
+    large = contents(manager.search_memory("deployment", k=20, types=["project"]))
+    # Only FTS matches inside the scope were read
+    assert rows_scanned() - before == 7
+    assert sorted(small) == sorted(large) and len(large) == 7
+
+def test_types_and_tags_each_match_any_and_combine_with_and(manager):
+    store_scoped_corpus(manager)
+
+    def found(**scope):
+        return sorted(contents(manager.search_memory("deployment", k=50, **scope)))
+
+    runbook = [f"deployment runbook step {i}" for i in range(6)]
+    assert found(types="preference") == ["deployment freeze dates"]
+    assert found(types=["preference", "project"]) == sorted(runbook + ["deployment freeze dates", "deployment retro"])
+    assert found(tags="OPS") == sorted(runbook + ["deployment freeze dates"])
+    assert found(tags="calendar, team") == ["deployment freeze dates", "deployment retro"]
+    assert found(types=["project"], tags=["ops"]) == sorted(runbook)
+    assert found(types=["fact"], tags=["ops"]) == []
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+import core.memory as memory
+import core.vectors as vectors
+from core.vectors import HashEmbedder, VectorStore
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "memory.db")
+    monkeypatch.setattr(memory, "DB_PATH", path)
+    return path
+
+def open_manager(embedder=None):
+    return memory.MemoryManager(cache_bytes=0, embedder=embedder)
+
+def test_semantic_recall_finds_the_closest_node(db_path):
+    m = open_manager(HashEmbedder())
+    m.store_memories([
+        {"content": "the user prefers dark roast coffee"},
+        {"content": "deploy the service on friday"},
+        {"content": "kubernetes cluster upgrade notes"},
+    ])
+    found = m.search_memory("dark roast coffee", k=1, mode="semantic")
+    m.close()
+    assert [r["content"] for r in found] == ["the user prefers dark roast coffee"]
+
+def test_open_backfills_nodes_stored_without_an_embedder(db_path):
+    m = open_manager()
+    m.store_memories([{"content": "the user prefers dark roast coffee"}, {"content": "deploy on friday"}])
+    m.close()
+
+    m = open_manager(HashEmbedder())
+    assert m.vectors.live_count == 2
+    found = m.search_memory("dark roast coffee", k=1, mode="semantic")
+    assert m.rebuild_vectors() == 0
+    m.close()
+    assert [r["content"] for r in found] == ["the user prefers dark roast coffee"]
+
+def test_rebuild_drops_vectors_of_deleted_nodes(db_path):
+    m = open_manager(HashEmbedder())
+    ids = m.store_memories([{"content": "keep this note"}, {"content": "drop this note"}])
+    m.close()
+
+    m = open_manager()
+    with m._writer:
+        m._writer.execute("DELETE FROM memory_nodes WHERE id = ?", (ids[1],))
+    m.close()
+
+    m = open_manager(HashEmbedder())
+    live = m.vectors.live_keys().tolist()
+    m.close()
+    assert live == [int(ids[0], 16)]
+
+def test_search_skips_tombstones_and_orders_by_score(tmp_path):
+    store = VectorStore(str(tmp_path / "v"), 4)
+    ids = [f"{i:016x}" for i in range(1, 5)]
+    store.append(ids, np.eye(4, dtype=np.float32))
+    query = np.array([0.9, 0.1, 0.4, 0.0], dtype=np.float32)
+    assert [i for i, _ in store.search(query, 3)] == [ids[0], ids[2], ids[1]]
+    store.delete([ids[0]])
+    assert [i for i, _ in store.search(query, 3)] == [ids[2], ids[1], ids[3]]
+
+def test_scoped_recall_ranks_within_a_small_scope(db_path):
+    m = open_manager(HashEmbedder())
+    m.store_memories([{"content": f"dark roast coffee order {i}"} for i in range(30)])
+    m.store_memories([{"content": "kubernetes upgrade notes", "type": "task"},
+                      {"content": "deploy the service on friday", "type": "task"}])
+    found = m.search_memory("dark roast coffee", k=2, mode="semantic", types=["task"])
+    m.close()
+    # The task nodes are far from the query; filtering after top-k would drop both
+    assert sorted(r["content"] for r in found) == ["deploy the service on friday", "kubernetes upgrade notes"]
+
+def test_scoped_recall_widens_until_k_nodes_are_in_a_large_scope(db_path, monkeypatch):
+    monkeypatch.setattr(memory, "SCOPE_SCAN_LIMIT", 2)
+    m = open_manager(HashEmbedder())
+    m.store_memories([{"content": f"dark roast coffee order {i}"} for i in range(30)])
+    m.store_memories([{"content": f"kubernetes upgrade step {i}", "type": "task"} for i in range(3)])
+    found = m.search_memory("dark roast coffee", k=3, mode="semantic", types=["task"])
+    m.close()
+    assert len(found) == 3 and all(r["content"].startswith("kubernetes") for r in found)
+
+def test_vectors_are_appended_only_for_committed_nodes(db_path):
+    m = open_manager(HashEmbedder())
+    with m._writer:
+        m._writer.execute("CREATE TRIGGER reject BEFORE INSERT ON memory_nodes BEGIN SELECT RAISE(ABORT, 'disk full'); END")
+    with pytest.raises(Exception):
+        m.store_memory("never committed")
+    assert m.vectors.live_count == 0
+    m.close()
+
+    m = memory.MemoryManager(cache_bytes=0, embedder=HashEmbedder(), write_behind=True, flush_interval_ms=60000)
+    with m._writer:
+        m._writer.execute("DROP TRIGGER reject")
+    m.store_memory("queued note")
+    assert m.vectors.live_count == 0
+    m.flush()
+    assert m.vectors.live_count == 1
+    m.close()
+
+def test_code_prefilter_finds_the_nearest_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectors, "CODE_SCAN_ROWS", 1000)
+    monkeypatch.setattr(vectors, "RERANK_ROWS", 64)
+    rng = np.random.default_rng(0)
+    rows = rng.standard_normal((3000, 32)).astype(np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    ids = [f"{i:016x}" for i in range(1, 3001)]
+    store = VectorStore(str(tmp_path / "v"), 32)
+    store.append(ids[:500], rows[:500])
+    assert store._codes is None
+    store.append(ids[500:], rows[500:])
+    assert store._codes is not None
+
+    assert [i for i, _ in store.search(rows[2500], 1)] == [ids[2500]]
+    store.delete([ids[2500]])
+    assert ids[2500] not in [i for i, _ in store.search(rows[2500], 5)]
+    store.compact()
+    assert [i for i, _ in store.search(rows[10], 1)] == [ids[10]]
+    assert [i for i, _ in store.search(rows[10], 2, among=[ids[20], ids[2500], ids[10]])] == [ids[10], ids[20]]
@@ -0,0 +1,126 @@
+import sqlite3
+import time
+
+import pytest
+
+import core.memory as memory
+
+DAY = 24 * 3600
+FACT_HALF_LIFE = memory.DECAY_POLICIES["fact"]
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "memory.db")
+
+def age(m, node_id, seconds, usage=0):
+    with m._writer:
+        m._writer.execute("UPDATE memory_nodes SET timestamp = ?, usage_count = ? WHERE id = ?",
+                          (time.time() - seconds, usage, node_id))
+
+def committed(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [r[0] for r in conn.execute("SELECT content FROM memory_nodes ORDER BY seq")]
+    finally:
+        conn.close()
+
+def test_prune_removes_nodes_whose_decayed_confidence_is_below_the_threshold(db_path, monkeypatch):
+    # Small windows, so the pass spans several transactions
+    monkeypatch.setattr(memory, "PRUNE_BATCH_SIZE", 2)
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path)
+    ids = m.store_memories([
+        {"content": "fresh fact"},
+        {"content": "fact at three half-lives"},   # 0.125
+        {"content": "fact at four half-lives"},    # 0.0625
+        {"content": "preference at the same age", "type": "preference"},
+        {"content": "fact at four half-lives, recalled often"},
+    ])
+    age(m, ids[1], 3 * FACT_HALF_LIFE)
+    age(m, ids[2], 4 * FACT_HALF_LIFE)
+    age(m, ids[3], 3 * FACT_HALF_LIFE)
+    # usage factor 1 + ln(2001) * 0.1 = 1.76 lifts 0.0625 to 0.11
+    age(m, ids[4], 4 * FACT_HALF_LIFE, usage=2000)
+
+    assert m.prune_low_confidence() == 2
+    assert committed(db_path) == ["fresh fact", "fact at three half-lives", "fact at four half-lives, recalled often"]
+    assert m.prune_low_confidence(threshold=0.12) == 1
+    assert committed(db_path) == ["fresh fact", "fact at three half-lives"]
+    m.close()
+
+def test_prune_drops_pruned_nodes_from_cached_recall(db_path):
+    m = memory.MemoryManager(db_path=db_path)
+    ids = m.store_memories([{"content": "stale deployment note"}, {"content": "current deployment note"}])
+    age(m, ids[0], 10 * FACT_HALF_LIFE)
+    assert len(m.search_memory("deployment")) == 2
+    m.prune_low_confidence()
+    assert [r["content"] for r in m.search_memory("deployment")] == ["current deployment note"]
+    m.close()
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def test_write_behind_commits_a_full_batch_without_waiting_for_the_interval(db_path):
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path, write_behind=True, batch_size=3,
+                             flush_interval_ms=60000)
+    m.store_memory("first")
+    m.store_memory("second")
+    time.sleep(0.05)
+    assert committed(db_path) == []
+    m.store_memory("third")
+    wait_for(lambda: len(committed(db_path)) == 3)
+    m.close()
+
+def test_write_behind_commits_a_partial_batch_after_the_interval(db_path):
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path, write_behind=True, batch_size=100,
+                             flush_interval_ms=50)
+    started = time.monotonic()
+    m.store_memory("lonely note")
+    wait_for(lambda: committed(db_path) == ["lonely note"])
+    assert time.monotonic() - started >= 0.04
+    m.close()
+
+def test_recall_sees_queued_writes(db_path):
+    m = memory.MemoryManager(db_path=db_path, write_behind=True, batch_size=100, flush_interval_ms=60000)
+    m.store_memory("the standup moved to ten")
+    assert committed(db_path) == []
+    assert [r["content"] for r in m.search_memory("standup")] == ["the standup moved to ten"]
+    # A cached result must not hide a node queued after it
+    m.store_memory("the standup is cancelled on fridays")
+    assert len(m.search_memory("standup")) == 2
+    m.close()
+
+def test_close_commits_queued_writes(db_path):
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path, write_behind=True, flush_interval_ms=60000)
+    m.store_memories([{"content": f"note {i}"} for i in range(5)])
+    m.close()
+    assert committed(db_path) == [f"note {i}" for i in range(5)]
+
+def test_reinforcement_raises_the_scores_of_recalled_nodes(db_path):
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path, reinforce_interval=3600)
+    ids = m.store_memories([{"content": "alpha release checklist"}, {"content": "alpha rollout plan"},
+                            {"content": "beta rollout plan"}])
+    for node_id in ids:
+        age(m, node_id, FACT_HALF_LIFE)
+    before = {r["id"]: r["score"] for r in m.search_memory("rollout plan", k=3)}
+    for _ in range(4):
+        m.search_memory("alpha release", k=1)
+
+    # Every recalled node, however often it was hit, is one row of the batched UPDATE
+    assert m.flush_reinforcement() == 3
+    assert m.flush_reinforcement() == 0
+    usage = dict(m._reader().execute("SELECT id, usage_count FROM memory_nodes"))
+    assert usage == {ids[0]: 4, ids[1]: 1, ids[2]: 1}
+    after = {r["id"]: r["score"] for r in m.search_memory("rollout plan", k=3)}
+    assert after[ids[1]] > before[ids[1]] and after[ids[2]] > before[ids[2]]
+    assert after[ids[1]] == pytest.approx(after[ids[2]])
+    m.close()
+
+def test_reinforcement_is_written_back_in_the_background(db_path):
+    m = memory.MemoryManager(cache_bytes=0, db_path=db_path, reinforce_interval=0.02)
+    node = m.store_memory("background reinforcement note")
+    m.search_memory("reinforcement")
+    wait_for(lambda: m._reader().execute("SELECT usage_count FROM memory_nodes WHERE id = ?", (node,)).fetchone()[0] == 1)
+    m.close()
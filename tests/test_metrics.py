@@ -0,0 +1,11 @@
+import core.models  # noqa: F401 -- modules register their gauges at import
+import core.scheduler  # noqa: F401
+import core.tools  # noqa: F401
+import core.voice  # noqa: F401
+from core.metrics import metrics
+
+def test_load_gauges_render_from_public_stats():
+    rendered = metrics.render().splitlines()
+    for series in ("ncs_scheduler_active_slots 0", "ncs_tool_queue_depth 0", "ncs_stt_queue_depth 0"):
+        assert series in rendered
+    assert any(line.startswith("# TYPE ncs_llm_active_streams gauge") for line in rendered)
@@ -0,0 +1,22 @@
+import asyncio
+
+from core.models import ModelManager, LOW_RAM_MB
+
+def test_failed_swap_waits_out_the_cooldown():
+    manager = ModelManager(primary="big", fallback="small")
+    attempts = []
+
+    async def failing_preload(name):
+        attempts.append(name)
+        raise RuntimeError("ollama unreachable")
+
+    manager.preload = failing_preload
+
+    async def main():
+        for _ in range(3):
+            manager.on_telemetry({"ramFree": LOW_RAM_MB - 100})
+            await manager._swap_task
+
+    asyncio.run(main())
+    assert attempts == ["small"]
+    assert manager.active == "big" and not manager.swapping
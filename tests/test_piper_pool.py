@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+from core.voice import PiperPool
+
+FAKE_PIPER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fake_piper.py")
+# Must match bench/fake_piper.py
+BYTES_PER_CHAR = 1000
+
+def make_pool(**kwargs) -> PiperPool:
+    return PiperPool("voice.onnx", binary=FAKE_PIPER, **kwargs)
+
+async def collect(pool: PiperPool, text: str):
+    return [chunk async for chunk in pool.synthesize(text)]
+
+def test_chunks_are_framed_to_chunk_bytes():
+    async def main():
+        pool = make_pool(size=1, chunk_bytes=4096)
+        try:
+            return await collect(pool, "hello world"), await collect(pool, "again")
+        finally:
+            await pool.close()
+
+    first, second = asyncio.run(main())
+    assert [len(c) for c in first] == [4096, 4096, 11 * BYTES_PER_CHAR - 8192]
+    assert all(len(c) % 2 == 0 for c in first)
+    # The previous utterance's tail never leaks into the next one
+    assert sum(map(len, second)) == 5 * BYTES_PER_CHAR
+
+def test_dead_worker_is_restarted_when_handed_out():
+    async def main():
+        pool = make_pool(size=1)
+        try:
+            await pool.start()
+            worker = pool.workers[0]
+            worker.proc.kill()
+            await worker.proc.wait()
+            audio = await collect(pool, "still speaking")
+            return audio, pool.stats()
+        finally:
+            await pool.close()
+
+    audio, stats = asyncio.run(main())
+    assert sum(map(len, audio)) == len("still speaking") * BYTES_PER_CHAR
+    assert stats["restarts"] == 1 and stats["utterances"] == 1
+
+def test_abandoned_utterance_restarts_the_worker():
+    async def main():
+        pool = make_pool(size=1, chunk_bytes=1024)
+        try:
+            stream = pool.synthesize("a long sentence that is cut off midway")
+            await stream.__anext__()
+            await stream.aclose()
+            audio = await collect(pool, "next")
+            return audio, pool.stats()
+        finally:
+            await pool.close()
+
+    audio, stats = asyncio.run(main())
+    assert sum(map(len, audio)) == 4 * BYTES_PER_CHAR
+    assert stats["failures"] == 1 and stats["restarts"] == 1
+
+def test_concurrent_syntheses_are_bounded_by_pool_size():
+    async def main():
+        pool = make_pool(size=2, chunk_bytes=1024)
+        peak = 0
+
+        async def speak(text):
+            nonlocal peak
+            out = []
+            async for chunk in pool.synthesize(text):
+                peak = max(peak, pool.stats()["busy"])
+                out.append(chunk)
+            return out
+
+        try:
+            results = await asyncio.gather(*(speak(f"utterance number {i}") for i in range(5)))
+            return results, peak, pool.stats()
+        finally:
+            await pool.close()
+
+    results, peak, stats = asyncio.run(main())
+    assert peak == 2
+    assert [sum(map(len, r)) for r in results] == [len("utterance number 0") * BYTES_PER_CHAR] * 5
+    assert stats["utterances"] == 5 and stats["restarts"] == 0
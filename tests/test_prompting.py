@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from core.prompting import (
+    CONTEXT_HEADER, RECALL_OUTCOMES, PromptAssembler, estimate_tokens, pack_memories, recall_query
+)
+
+class FakeMemory:
+    """AsyncMemory stand-in: canned results after `delay` seconds, or raises `error`."""
+
+    def __init__(self, results=(), delay=0.0, error=None):
+        self.results = list(results)
+        self.delay = delay
+        self.error = error
+        self.queries = []
+        self.cancelled = False
+        self.version = "feed.1"
+
+    async def search(self, query, k=5):
+        self.queries.append(query)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.results[:k]
+
+def assemble(memory, prompt, **kwargs):
+    async def main():
+        pending = PromptAssembler(memory, **kwargs).start(prompt)
+        started = time.monotonic()
+        text = await pending.prompt()
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(0)
+        return pending, text, elapsed
+    return asyncio.run(main())
+
+def memory_result(content, score=1.0):
+    return {"content": content, "score": score}
+
+def test_recall_within_the_deadline_enriches_the_prompt():
+    memory = FakeMemory([memory_result("the user's database is postgres")], delay=0.01)
+    pending, text, _ = assemble(memory, "Which database should I use?")
+    assert memory.queries == ["database use"]
+    assert text == f"{CONTEXT_HEADER}\n- the user's database is postgres\n\nWhich database should I use?"
+    assert pending.origin == {"prompt": "Which database should I use?", "memory": "feed.1", "context_tokens": 384}
+
+def test_late_recall_falls_back_to_the_bare_prompt_at_the_deadline():
+    memory = FakeMemory([memory_result("too late to matter")], delay=1.0)
+    timeouts = RECALL_OUTCOMES.value(("timeout",))
+    _, text, elapsed = assemble(memory, "summarize my deployment notes", deadline_ms=60)
+    assert text == "summarize my deployment notes"
+    assert 0.03 <= elapsed < 0.5
+    assert memory.cancelled
+    assert RECALL_OUTCOMES.value(("timeout",)) - timeouts == 1
+
+def test_failed_or_pointless_recall_sends_the_bare_prompt():
+    _, text, _ = assemble(FakeMemory(error=RuntimeError("db locked")), "summarize my deployment notes")
+    assert text == "summarize my deployment notes"
+    memory = FakeMemory([memory_result("never asked for")])
+    _, text, _ = assemble(memory, "how are you?")
+    assert text == "how are you?" and memory.queries == []
+
+def test_pack_memories_drops_near_duplicates_of_higher_ranked_ones():
+    packed = pack_memories([
+        memory_result("The user likes dark roast coffee", 0.9),
+        memory_result("the user really likes dark roast  coffee!", 0.95),
+        memory_result("the user likes light roast tea", 0.5),
+    ], budget=100)
+    # 6 of 7 distinct words shared (0.86) is a duplicate; 4 of 9 (0.44) is not
+    assert packed == ["the user really likes dark roast coffee!", "the user likes light roast tea"]
+
+def test_pack_memories_fills_the_token_budget_by_score():
+    long = "a much longer memory that will not fit into what is left of the budget"
+    results = [memory_result("first choice", 0.9), memory_result(long, 0.8), memory_result("short one", 0.1)]
+    budget = estimate_tokens("first choice") + 1 + estimate_tokens("short one") + 1
+    assert pack_memories(results, budget) == ["first choice", "short one"]
+    assert pack_memories(results, budget - 1) == ["first choice"]
+    assert pack_memories(results, 0) == []
+
+def test_recall_query_keeps_distinct_content_words_longest_first():
+    assert recall_query("What is the deadline for the Kubernetes upgrade? The deadline!") == \
+        "kubernetes deadline upgrade"
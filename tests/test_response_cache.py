@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+import core.response_cache as response_cache
+from core.models import GGUFChat, model_manager
+from core.response_cache import ResponseCache
+
+PROMPT = "alpha beta gamma"
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    c = ResponseCache(path=str(tmp_path / "responses.db"))
+    monkeypatch.setattr(GGUFChat, "response_cache", c)
+    yield c
+    c.close()
+
+def run_twice(**kwargs):
+    async def main():
+        first = [t async for t in GGUFChat.generate(PROMPT, **kwargs)]
+        second = [t async for t in GGUFChat.generate(PROMPT, **kwargs)]
+        return first, second
+
+    before = GGUFChat.stats()["requests"]
+    first, second = asyncio.run(main())
+    assert first == second and first
+    return GGUFChat.stats()["requests"] - before
+
+def test_only_deterministic_or_opted_in_requests_are_cached(fake_ollama, cache):
+    assert run_twice() == 2
+    assert cache.stats()["entries"] == 0
+
+    assert run_twice(options={"temperature": 0}) == 1
+    assert run_twice(options={"temperature": 0.9}, cache=True) == 1
+    assert cache.stats()["entries"] == 2 and cache.stats()["hits"] == 2
+
+def test_request_key_is_stable_and_covers_model_options_and_origin(monkeypatch):
+    key = GGUFChat.request_key
+    assert key(PROMPT, {"temperature": 0, "num_predict": 64}) == key(PROMPT, {"num_predict": 64, "temperature": 0})
+    assert key(PROMPT, {"temperature": 0}) != key(PROMPT, {"temperature": 0, "num_predict": 64})
+    # The origin stands in for the (enriched) prompt text
+    origin = {"prompt": PROMPT, "memory": "ab12.3", "context_tokens": None}
+    assert key("Relevant memories: x\n" + PROMPT, None, origin) == key("other text", None, dict(origin))
+    assert key(PROMPT, None, origin) != key(PROMPT, None, {**origin, "memory": "ab12.4"})
+    before = key(PROMPT)
+    monkeypatch.setattr(model_manager, "active", "another-model")
+    assert key(PROMPT) != before
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    c = ResponseCache(path=str(tmp_path / "responses.db"), ttl=60)
+    c.put_sync("k", ["a", "b"])
+    now[0] += 59
+    assert c.get_sync("k") == ["a", "b"]
+    now[0] += 2
+    assert c.get_sync("k") is None
+    assert c.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 0, "entries": 0, "bytes": 0}
+    c.close()
+
+def test_least_recently_used_entries_are_evicted_past_the_byte_budget(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    # Each entry is 14 bytes of JSON, so three fit
+    c = ResponseCache(path=str(tmp_path / "responses.db"), max_bytes=45)
+    for key in ("a", "b", "c"):
+        now[0] += 1
+        c.put_sync(key, ["0123456789"])
+    now[0] += 1
+    c.get_sync("a")
+    now[0] += 1
+    c.put_sync("d", ["0123456789"])
+    assert [k for k in "abcd" if c.get_sync(k) is not None] == ["a", "c", "d"]
+    assert c.stats()["evictions"] == 1
+    c.close()
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from core.scheduler import ChatScheduler, SchedulerFull
+
+class Jobs:
+    """Generation stand-ins that record when they start and run until released."""
+
+    def __init__(self):
+        self.started = []
+        self.release = {}
+
+    def __call__(self, name: str):
+        self.release[name] = asyncio.Event()
+
+        async def run():
+            self.started.append(name)
+            await self.release[name].wait()
+            return name
+        return run
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_waiters_are_granted_slots_by_priority_then_fifo():
+    async def main():
+        scheduler, jobs = ChatScheduler(max_active=1), Jobs()
+        tasks = [scheduler.submit("s0", jobs("running"))]
+        await settle()
+        for name, priority in (("agent", "agent"), ("chat1", "interactive"), ("voice", "voice"),
+                               ("chat2", "interactive")):
+            tasks.append(scheduler.submit(name, jobs(name), priority))
+        await settle()
+        assert scheduler.queue_depth() == {"voice": 1, "interactive": 2, "agent": 1}
+        for name in ("running", "voice", "chat1", "chat2", "agent"):
+            jobs.release[name].set()
+            await settle()
+        await asyncio.gather(*tasks)
+        return jobs.started
+
+    assert asyncio.run(main()) == ["running", "voice", "chat1", "chat2", "agent"]
+
+def test_sessions_holding_fewer_slots_go_first():
+    async def main():
+        scheduler, jobs = ChatScheduler(max_active=2), Jobs()
+        tasks = [scheduler.submit("a", jobs("a1")), scheduler.submit("x", jobs("x1"))]
+        await settle()
+        # "a" queued first, but it already holds a slot and "b" holds none
+        tasks += [scheduler.submit("a", jobs("a2")), scheduler.submit("b", jobs("b1"))]
+        await settle()
+        jobs.release["x1"].set()
+        await settle()
+        started = list(jobs.started)
+        for event in jobs.release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    assert asyncio.run(main()) == ["a1", "x1", "b1"]
+
+def test_admission_rejects_beyond_the_queue_bound_but_admits_joiners():
+    async def main():
+        scheduler, jobs = ChatScheduler(max_active=1, max_queued=1), Jobs()
+        tasks = [scheduler.submit("s1", jobs("running")), scheduler.submit("s2", jobs("queued"))]
+        await settle()
+        with pytest.raises(SchedulerFull):
+            scheduler.submit("s3", jobs("rejected"))
+        # Joining a generation already in flight takes no slot, so it is never rejected
+        tasks.append(scheduler.submit("s4", jobs("joiner"), needs_slot=False))
+        await settle()
+        assert jobs.started == ["running", "joiner"]
+        for event in jobs.release.values():
+            event.set()
+        await asyncio.gather(*tasks)
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["admitted"], stats["rejected"], stats["active_slots"]) == (2, 1, 0)
+
+def test_cancel_stops_a_sessions_running_and_queued_work_and_frees_its_slot():
+    async def main():
+        scheduler, jobs = ChatScheduler(max_active=1), Jobs()
+        running = scheduler.submit("a", jobs("a1"))
+        await settle()
+        queued = scheduler.submit("a", jobs("a2"))
+        other = scheduler.submit("b", jobs("b1"))
+        await settle()
+        assert scheduler.cancel("a") == 2
+        await settle()
+        assert running.cancelled() and queued.cancelled()
+        assert jobs.started == ["a1", "b1"]
+        assert scheduler.sessions() == ["b"]
+        jobs.release["b1"].set()
+        assert await other == "b1"
+        return scheduler.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["cancelled"], stats["active_slots"], stats["sessions"]) == (2, 0, 0)
+
+def test_slot_freed_in_the_same_tick_skips_a_waiter_being_cancelled():
+    async def main():
+        scheduler, jobs = ChatScheduler(max_active=1), Jobs()
+        running = scheduler.submit("a", jobs("a1"))
+        await settle()
+        queued = scheduler.submit("b", jobs("b1"))
+        other = scheduler.submit("c", jobs("c1"))
+        await settle()
+        # Both are cancelled in one tick; the running one unwinds first and hands its slot on
+        running.cancel()
+        queued.cancel()
+        await settle()
+        assert running.cancelled() and queued.cancelled()
+        assert jobs.started == ["a1", "c1"]
+        jobs.release["c1"].set()
+        assert await other == "c1"
+        return scheduler.stats()
+
+    assert asyncio.run(main())["active_slots"] == 0
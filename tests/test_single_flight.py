@@ -0,0 +1,57 @@
+import asyncio
+from contextlib import aclosing
+
+from core.models import GGUFChat, LLM_STREAMS
+from conftest import FAKE_TOKENS
+
+PROMPT = "alpha beta gamma delta"
+EXPECTED = [f"{w} " for w in (PROMPT.split() * FAKE_TOKENS)[:FAKE_TOKENS]]
+
+async def take(stream, n=None):
+    tokens = []
+    async for token in stream:
+        tokens.append(token)
+        if n is not None and len(tokens) == n:
+            break
+    return tokens
+
+def test_late_joiner_gets_the_tokens_it_missed_replayed(fake_ollama):
+    async def main():
+        first = GGUFChat.subscribe(PROMPT)
+        head = await take(first, 5)
+        assert GGUFChat.is_inflight(PROMPT)
+        late = await take(GGUFChat.subscribe(PROMPT))
+        return head + await take(first), late
+
+    before, joins = GGUFChat.stats()["requests"], GGUFChat.stats()["dedup_joins"]
+    first, late = asyncio.run(main())
+    assert first == late == EXPECTED
+    assert GGUFChat.stats()["requests"] - before == 1
+    assert GGUFChat.stats()["dedup_joins"] - joins == 1
+    assert GGUFChat.stats()["inflight"] == 0
+
+def test_request_after_the_flight_finished_starts_a_new_one(fake_ollama):
+    async def main():
+        first = await take(GGUFChat.subscribe(PROMPT))
+        await asyncio.sleep(0)
+        assert not GGUFChat.is_inflight(PROMPT)
+        return first, await take(GGUFChat.subscribe(PROMPT))
+
+    before, joins = GGUFChat.stats()["requests"], GGUFChat.stats()["dedup_joins"]
+    first, second = asyncio.run(main())
+    assert first == second == EXPECTED
+    assert GGUFChat.stats()["requests"] - before == 2
+    assert GGUFChat.stats()["dedup_joins"] == joins
+
+def test_backend_stream_is_cancelled_when_the_last_subscriber_leaves(fake_ollama):
+    async def main():
+        async with aclosing(GGUFChat.subscribe(PROMPT)) as a, aclosing(GGUFChat.subscribe(PROMPT)) as b:
+            await take(a, 2)
+            await take(b, 2)
+        # Both left early; the shared generation is torn down, not left running
+        assert not GGUFChat.is_inflight(PROMPT)
+        await asyncio.sleep(0.05)
+
+    cancelled = LLM_STREAMS.value(("cancelled",))
+    asyncio.run(main())
+    assert LLM_STREAMS.value(("cancelled",)) - cancelled == 1
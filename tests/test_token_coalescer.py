@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from core.streaming import TokenCoalescer
+
+class FakeWebSocket:
+    """Records (seconds since start, text) per frame; each send takes the next of `delays`."""
+
+    def __init__(self, delays=()):
+        self.frames = []
+        self.windows = []
+        self.delays = list(delays)
+        self.coalescer = None
+        self.started = None
+
+    async def send_text(self, text: str):
+        loop = asyncio.get_running_loop()
+        self.frames.append((loop.time() - self.started, text))
+        if self.coalescer is not None:
+            self.windows.append(self.coalescer.window)
+        if self.delays:
+            await asyncio.sleep(self.delays.pop(0))
+
+async def paced(tokens, gap: float):
+    for token in tokens:
+        yield token
+        await asyncio.sleep(gap)
+
+def deliver(tokens, ws: FakeWebSocket, **kwargs) -> TokenCoalescer:
+    async def main():
+        coalescer = TokenCoalescer(ws, **kwargs)
+        ws.coalescer = coalescer
+        ws.started = asyncio.get_running_loop().time()
+        await coalescer.run(tokens)
+        return coalescer
+    return asyncio.run(main())
+
+def test_first_token_is_sent_without_waiting_for_the_window():
+    ws = FakeWebSocket()
+    deliver(paced(["Hello", " world"], 0.3), ws, window_ms=1000)
+    (first_at, first), (_, second) = ws.frames
+    assert first == "Hello" and first_at < 0.1
+    assert second == " world"
+
+def test_tokens_within_the_window_share_a_frame():
+    ws = FakeWebSocket()
+    coalescer = deliver(paced([f"t{i} " for i in range(10)], 0.001), ws, window_ms=500)
+    assert [text for _, text in ws.frames] == ["t0 ", "t1 t2 t3 t4 t5 t6 t7 t8 t9 "]
+    assert (coalescer.tokens, coalescer.frames) == (10, 2)
+
+def test_byte_budget_ends_the_window_early():
+    ws = FakeWebSocket()
+    deliver(paced(["ab"] * 5, 0.01), ws, window_ms=5000, max_bytes=4)
+    assert [text for _, text in ws.frames] == ["ab", "abab", "abab"]
+    # Neither frame waited out the five second window
+    assert ws.frames[-1][0] < 1.0
+
+def test_slow_sends_double_the_window_up_to_the_cap_and_fast_ones_shrink_it():
+    ws = FakeWebSocket(delays=[0.05, 0.05, 0.05, 0.0])
+    coalescer = deliver(paced(["a", "b", "c", "d", "e"], 0.15), ws, window_ms=10, max_window_ms=40)
+    assert [text for _, text in ws.frames] == ["a", "b", "c", "d", "e"]
+    # Window seen by each send, i.e. as left by the one before it
+    assert ws.windows == pytest.approx([0.01, 0.02, 0.04, 0.04, 0.03])
+    assert coalescer.window == pytest.approx(0.0225)
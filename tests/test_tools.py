@@ -0,0 +1,120 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+import core.tools as tools
+from core.metrics import CountingExecutor
+from core.tools import TokenBucket, ToolDefinition, ToolPermissions
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(tools.time, "monotonic", fake)
+    return fake
+
+def test_token_bucket_rejects_past_the_burst_and_refills_over_time(clock):
+    bucket = TokenBucket(per_minute=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(20.0)
+    clock.now += 20.0
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    # Refill is capped at the burst size
+    clock.now += 3600.0
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(tools, "TOOL_REGISTRY", {})
+    log = []
+
+    def register(name, handler, side_effects, per_minute=100):
+        tools.register_tool(ToolDefinition(
+            name=name, description=name, category="test", permissions=ToolPermissions(),
+            side_effects=side_effects, rate_limit={"calls_per_minute": per_minute},
+        ), handler)
+
+    async def read(arg):
+        log.append(("read start", arg))
+        await asyncio.sleep(float(arg))
+        log.append(("read end", arg))
+        return f"read {arg}"
+
+    def write(arg):
+        log.append(("write", arg))
+        return f"wrote {arg}"
+
+    register("read", read, side_effects=False)
+    register("write", write, side_effects=True)
+    register("scarce", read, side_effects=False, per_minute=1)
+    return log
+
+def test_execute_tools_returns_results_in_call_order(registry):
+    calls = [{"tool": "read", "input": "0.03"}, {"tool": "read", "input": "0.01"},
+             {"tool": "write", "input": "a"}, {"tool": "read", "input": "0"},
+             {"tool": "missing"}, {"tool": "scarce", "input": "0"}, {"tool": "scarce", "input": "0"}]
+    results = asyncio.run(tools.execute_tools(calls, {}))
+    assert results[:4] == ["read 0.03", "read 0.01", "wrote a", "read 0"]
+    assert results[4] == "Error: Tool 'missing' not found."
+    assert results[5] == "read 0" and results[6].startswith("Rate Limited: 'scarce'")
+    # The reads before the write overlapped; the write waited for both and ran alone
+    assert registry[:5] == [("read start", "0.03"), ("read start", "0.01"), ("read end", "0.01"),
+                            ("read end", "0.03"), ("write", "a")]
+
+def test_counting_executor_reports_queued_and_running_jobs():
+    pool = CountingExecutor(max_workers=1)
+    release = threading.Event()
+    first = pool.submit(release.wait, 5)
+    second = pool.submit(time.sleep, 0)
+    third = pool.submit(time.sleep, 0)
+    while pool.stats()["running"] == 0:
+        time.sleep(0.001)
+    assert third.cancel()
+    assert pool.stats() == {"queued": 1, "running": 1, "workers": 1}
+    release.set()
+    first.result(), second.result()
+    pool.shutdown()
+    assert pool.stats() == {"queued": 0, "running": 0, "workers": 1}
+
+def test_apply_hunks_finds_matches_straddling_chunk_boundaries(tmp_path):
+    original = b"xxxxxxHELLOxxxx say hello to HELLO and goodbye" * 3
+    hunks = [(b"HELLO", b"BYE"), (b"goodbye", b"ciao"), (b"o t", b"O_T")]
+    expected = original.replace(b"HELLO", b"BYE").replace(b"goodbye", b"ciao").replace(b"o t", b"O_T")
+    path = tmp_path / "target.txt"
+    for chunk_size in (1, 2, 3, 5, 8, 13, 64):
+        path.write_bytes(original)
+        assert tools.apply_hunks(str(path), hunks, chunk_size=chunk_size) == [6, 3, 3]
+        assert path.read_bytes() == expected, chunk_size
+
+def test_apply_hunks_leaves_the_original_intact_on_failure(tmp_path, monkeypatch):
+    path = tmp_path / "target.txt"
+    path.write_bytes(b"keep HELLO as is\n" * 100)
+    path.chmod(0o640)
+
+    def fail(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(tools.os, "fsync", fail)
+    with pytest.raises(OSError):
+        tools.apply_hunks(str(path), [(b"HELLO", b"BYE")], chunk_size=16)
+    assert path.read_bytes() == b"keep HELLO as is\n" * 100
+    # The temp file is cleaned up too
+    assert os.listdir(tmp_path) == ["target.txt"]
+
+    monkeypatch.undo()
+    assert tools.apply_hunks(str(path), [(b"HELLO", b"BYE")], dry_run=True) == [100]
+    assert tools.apply_hunks(str(path), [(b"missing", b"x")]) == [0]
+    assert path.read_bytes() == b"keep HELLO as is\n" * 100
+    assert tools.apply_hunks(str(path), [(b"HELLO", b"BYE")], chunk_size=16) == [100]
+    assert path.read_bytes() == b"keep BYE as is\n" * 100
+    assert path.stat().st_mode & 0o777 == 0o640
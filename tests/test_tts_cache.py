@@ -0,0 +1,50 @@
+import threading
+
+from core.tts_cache import TTSCache
+
+CLIP = 1000
+
+def clip(i: int) -> bytes:
+    return bytes([i % 256]) * CLIP
+
+def test_compaction_keeps_live_clips(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=0, disk_bytes=4 * CLIP)
+    for i in range(12):
+        cache.put_sync(f"k{i}", clip(i))
+    assert cache.stats()["entries"] == 4
+    for i in range(8, 12):
+        assert cache.get(f"k{i}") == clip(i)
+    cache.close()
+
+    reopened = TTSCache(str(tmp_path), memory_bytes=0, disk_bytes=4 * CLIP)
+    assert [reopened.get(f"k{i}") for i in range(8, 12)] == [clip(i) for i in range(8, 12)]
+    reopened.close()
+
+def test_lookups_and_puts_proceed_while_compaction_copies(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=0, disk_bytes=4 * CLIP)
+    for i in range(4):
+        cache.put_sync(f"k{i}", clip(i))
+    copy = cache._copy_clips
+    during = {}
+
+    def slow_copy(src, dst, entries, moved):
+        if not during:
+            # Runs on another thread, as the event loop and other writers would
+            def other():
+                during["hit"] = cache.get("k8")
+                cache.put_sync("new", clip(99))
+            t = threading.Thread(target=other)
+            t.start()
+            t.join(timeout=5)
+            during["blocked"] = t.is_alive()
+        copy(src, dst, entries, moved)
+
+    cache._copy_clips = slow_copy
+    # k8 evicts k4 and pushes the dead share over COMPACT_RATIO
+    for i in range(4, 9):
+        cache.put_sync(f"k{i}", clip(i))
+    assert during["blocked"] is False and during["hit"] == clip(8)
+    # "new" was stored mid-copy and evicted k5; both changes survive the swap
+    assert cache.get("k5") is None and cache.get("new") == clip(99)
+    assert [cache.get(f"k{i}") for i in range(6, 9)] == [clip(i) for i in range(6, 9)]
+    cache.close()
@@ -0,0 +1,69 @@
+import numpy as np
+
+from core.voice import (
+    SAMPLE_RATE, PREROLL_MS, ENDPOINT_SILENCE_MS, PARTIAL_STEP_MS, SpeechSegmenter
+)
+
+SPEECH_LEVEL = 0.2
+
+def tone(seconds: float) -> np.ndarray:
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (SPEECH_LEVEL * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+def silence(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+def feed_in_chunks(segmenter: SpeechSegmenter, audio: np.ndarray, chunk_ms: int = 100):
+    chunk = SAMPLE_RATE * chunk_ms // 1000
+    jobs = []
+    for i in range(0, len(audio), chunk):
+        jobs.extend(segmenter.feed(audio[i:i + chunk]))
+    return jobs
+
+def test_silence_produces_no_jobs():
+    segmenter = SpeechSegmenter()
+    assert feed_in_chunks(segmenter, silence(3.0)) == []
+    assert not segmenter.in_speech
+
+def test_onset_starts_utterance():
+    segmenter = SpeechSegmenter()
+    feed_in_chunks(segmenter, silence(0.5))
+    assert not segmenter.in_speech
+    feed_in_chunks(segmenter, tone(0.1))
+    assert segmenter.in_speech
+
+def test_final_holds_preroll_and_whole_utterance_without_endpoint_silence():
+    segmenter = SpeechSegmenter()
+    jobs = feed_in_chunks(segmenter, np.concatenate((silence(0.5), tone(1.0), silence(1.0))))
+    finals = [audio for kind, audio in jobs if kind == "final"]
+    assert len(finals) == 1
+    final = finals[0]
+    preroll = SAMPLE_RATE * PREROLL_MS // 1000
+    assert len(final) == preroll + SAMPLE_RATE
+    # Pre-roll silence first, then every sample of the speech, nothing after it
+    assert not final[:preroll].any()
+    np.testing.assert_array_equal(final[preroll:], tone(1.0))
+    assert segmenter.utterance == 1 and not segmenter.in_speech
+
+def test_final_fires_after_endpoint_silence():
+    segmenter = SpeechSegmenter()
+    feed_in_chunks(segmenter, tone(1.0))
+    almost = silence((ENDPOINT_SILENCE_MS - 100) / 1000)
+    assert not [kind for kind, _ in feed_in_chunks(segmenter, almost) if kind == "final"]
+    assert [kind for kind, _ in feed_in_chunks(segmenter, silence(0.1)) if kind == "final"] == ["final"]
+
+def test_partials_follow_step_cadence():
+    segmenter = SpeechSegmenter()
+    jobs = feed_in_chunks(segmenter, tone(3.0))
+    partials = [audio for kind, audio in jobs if kind == "partial"]
+    step = SAMPLE_RATE * PARTIAL_STEP_MS // 1000
+    assert len(partials) == 3 * SAMPLE_RATE // step
+    # Each partial covers all speech so far (no pre-roll: the stream opened on speech)
+    assert [len(p) for p in partials] == [step * (i + 1) for i in range(len(partials))]
+
+def test_two_utterances_are_numbered_separately():
+    segmenter = SpeechSegmenter()
+    audio = np.concatenate((tone(0.6), silence(1.0), tone(0.6), silence(1.0)))
+    finals = [kind for kind, _ in feed_in_chunks(segmenter, audio) if kind == "final"]
+    assert finals == ["final", "final"]
+    assert segmenter.utterance == 2
@@ -0,0 +1,54 @@
+import os
+import threading
+
+import pytest
+
+from core.workspace_index import WorkspaceIndex
+
+def write(root, rel, text):
+    path = os.path.join(root, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+@pytest.fixture
+def index(tmp_path):
+    root = tmp_path / "workspace"
+    write(root, "Src/app.py", "def handler():\n    return 1\n")
+    write(root, "src/app.py", "def handler():\n    return 2\n")
+    write(root, "docs/notes.md", "x\n")
+    idx = WorkspaceIndex(str(root), str(tmp_path / "index.db"))
+    yield idx
+    idx.close()
+
+def test_prefix_is_case_sensitive(index):
+    index.refresh()
+    assert [path for path, _, _ in index.search("handler", prefix="src")] == ["src/app.py"]
+    assert [path for path, _, _ in index.search("handler", prefix="Src/")] == ["Src/app.py"]
+
+def test_search_does_not_wait_for_the_index_lock(index):
+    index.refresh()
+    hits = []
+    # A query with no 3+ character literal reads every body; indexing must not block it, nor it indexing
+    with index._lock:
+        reader = threading.Thread(target=lambda: hits.extend(index.search("x", prefix="docs")))
+        reader.start()
+        reader.join(5)
+    assert hits == [("docs/notes.md", 1, "x")]
+
+def test_first_search_does_not_build_on_the_calling_thread(index, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    refresh = index.refresh
+
+    def slow_refresh():
+        started.set()
+        release.wait(5)
+        return refresh()
+
+    monkeypatch.setattr(index, "refresh", slow_refresh)
+    assert index.search("handler") == []
+    assert started.wait(5) and not index.built.is_set()
+    release.set()
+    assert index.built.wait(5)
+    assert len(index.search("handler")) == 2